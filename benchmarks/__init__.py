@@ -0,0 +1,25 @@
+"""
+Benchmarks for comparedecimal.
+
+The benchmarks are modules of this package, run from the root of the
+repository with e.g. ``python3 -m benchmarks.run_benchmarks``, so that
+both they and the comparedecimal package being measured can be imported
+without installing either.
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the comparison of compressed files.
+
+A pair of files from a synthetic data set is compressed, and then
+compared in four ways:
+
+decompress first
+  both files are decompressed to temporary files, which are then
+  compared with compare_streams (the previous workflow)
+inline
+  the files are decompressed in the comparing thread while being read,
+  in the small blocks read by io.TextIOWrapper
+large blocks
+  the files are decompressed in the comparing thread in large blocks
+  (open_lines with read_ahead=False, as used by comparecsv on a machine
+  with a single processor)
+read-ahead
+  the files are decompressed by background threads (open_lines with
+  read_ahead=True, as used by comparecsv on a machine with more than one
+  processor)
+
+The totals of all runs are checked to be the same. Read-ahead can only
+gain the time spent decompressing, and only if the threads run on other
+processors; it gains most when decompression is slow and comparison is
+fast, as with bzip2 and the mostly_identical data set (the defaults). On
+a single processor, it takes a little longer than large blocks.
+
+Usage: python3 -m benchmarks.bench_compressed [DATASET] [ROWS] [FORMAT]
+
+where FORMAT is bzip2 (the default), gzip, or xz.
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import datasets
+from comparedecimal import DecimalComparer
+from comparedecimal.compressed import open_lines
+
+MODULES = {"gzip": gzip, "bzip2": bz2, "xz": lzma}
+
+
+def decompress_first(comparer, paths, module, directory):
+    plain_paths = []
+    for path in paths:
+        plain_path = os.path.join(directory, os.path.basename(path) + ".out")
+        with module.open(path) as source, open(plain_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        plain_paths.append(plain_path)
+    with open(plain_paths[0]) as fh0, open(plain_paths[1]) as fh1:
+        comparer.compare_streams(fh0, fh1)
+
+
+def inline(comparer, paths, module, directory):
+    with module.open(paths[0], "rt") as fh0, \
+            module.open(paths[1], "rt") as fh1:
+        comparer.compare_streams(fh0, fh1)
+
+
+def large_blocks(comparer, paths, module, directory):
+    with open_lines(paths[0], read_ahead=False) as fh0, \
+            open_lines(paths[1], read_ahead=False) as fh1:
+        comparer.compare_streams(fh0, fh1)
+
+
+def read_ahead(comparer, paths, module, directory):
+    with open_lines(paths[0], read_ahead=True) as fh0, \
+            open_lines(paths[1], read_ahead=True) as fh1:
+        comparer.compare_streams(fh0, fh1)
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "mostly_identical"
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    module = MODULES[sys.argv[3] if len(sys.argv) > 3 else "bzip2"]
+    columns = datasets.DATASETS[name][2]
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for path in datasets.write_pair(name, directory, rows, columns):
+            with open(path, "rb") as source, \
+                    module.open(path + ".z", "wb") as target:
+                shutil.copyfileobj(source, target)
+            paths.append(path + ".z")
+
+        results = []
+        for method_name, method in (("decompress first", decompress_first),
+                                    ("inline", inline),
+                                    ("large blocks", large_blocks),
+                                    ("read-ahead", read_ahead)):
+            comparer = DecimalComparer()
+            start = time.perf_counter()
+            method(comparer, paths, module, directory)
+            elapsed = time.perf_counter() - start
+            results.append((elapsed, comparer.totals))
+            print("{:16s} {:8.3f} s".format(method_name, elapsed))
+
+    assert all(totals == results[0][1] for _, totals in results), \
+        "totals differ"
+    print("speedup over decompress first: large blocks {:.2f}x, "
+          "read-ahead {:.2f}x ({} processors)".format(
+              results[0][0] / results[2][0], results[0][0] / results[3][0],
+              os.cpu_count()))
+
+
+if __name__ == "__main__":
+    main()
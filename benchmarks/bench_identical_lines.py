@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the identical-line fast path of DecimalComparer.compare_streams.
+
+Two mostly identical files are compared with compare_streams, which skips
+parsing for identical lines, and with the equivalent full path (every
+line parsed by csv.reader and compared by compare_string_lists). The
+totals of the two runs are checked to be the same.
+
+Usage: python3 -m benchmarks.bench_identical_lines [LINES] [FIELDS]
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import sys
+import time
+
+from benchmarks import datasets
+from comparedecimal import DecimalComparer
+
+
+def compare_full(comparer, lines0, lines1):
+    readers = [csv.reader(lines, delimiter=comparer.separator,
+                          skipinitialspace=True)
+               for lines in (lines0, lines1)]
+    for fields0, fields1 in zip(*readers):
+        comparer.compare_string_lists(fields0, fields1)
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    field_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    lines0, lines1 = zip(*datasets.generate("mostly_identical",
+                                            line_count, field_count))
+
+    results = []
+    for name, function in (("full path", compare_full),
+                           ("fast path", DecimalComparer.compare_streams)):
+        comparer = DecimalComparer()
+        start = time.perf_counter()
+        function(comparer, lines0, lines1)
+        elapsed = time.perf_counter() - start
+        results.append((elapsed, comparer.totals))
+        print("{:10s} {:8.3f} s {:12.0f} fields/s".format(
+            name, elapsed, line_count * field_count / elapsed))
+
+    assert results[0][1] == results[1][1], "totals differ"
+    print("speedup    {:8.1f}x".format(results[0][0] / results[1][0]))
+
+
+if __name__ == "__main__":
+    main()
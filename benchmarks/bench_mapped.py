@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the memory-mapped comparison of mostly identical files.
+
+A pair of files from the mostly_identical data set, in which 1% of the
+lines differ, is compared with compare_streams and with compare_mapped
+(as used by comparecsv --mmap). The totals of the two runs are checked
+to be the same, and the benchmark fails if compare_mapped is slower.
+
+Usage: python3 -m benchmarks.bench_mapped [ROWS] [COLUMNS]
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import tempfile
+import time
+
+from benchmarks import datasets
+from comparedecimal import DecimalComparer
+from comparedecimal.mapped import compare_mapped
+
+
+def streams(comparer, paths):
+    with open(paths[0]) as fh0, open(paths[1]) as fh1:
+        return comparer.compare_streams(fh0, fh1)
+
+
+def mapped(comparer, paths):
+    return compare_mapped(comparer, *paths)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as directory:
+        paths = datasets.write_pair("mostly_identical", directory, rows,
+                                    columns)
+        results = []
+        for name, function in (("streams", streams), ("mmap", mapped)):
+            comparer = DecimalComparer()
+            start = time.perf_counter()
+            difference = function(comparer, paths)
+            elapsed = time.perf_counter() - start
+            results.append((elapsed, difference, comparer.totals))
+            print("{:10s} {:8.3f} s {:12.0f} fields/s".format(
+                name, elapsed, rows * columns / elapsed))
+
+    assert results[0][1:] == results[1][1:], "results differ"
+    print("speedup    {:8.1f}x".format(results[0][0] / results[1][0]))
+    assert results[1][0] <= results[0][0], "--mmap is slower"
+
+
+if __name__ == "__main__":
+    main()
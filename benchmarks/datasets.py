@@ -0,0 +1,119 @@
+"""
+Reproducible synthetic data sets for benchmarking comparedecimal.
+
+Each data set is a generator function taking a row count, a column count,
+and a random number generator, and yielding pairs of corresponding lines
+for two files. The data sets are:
+
+mostly_identical
+  1% of lines differ in precision; the rest are byte-for-byte identical.
+truncated
+  every value of the second file is rounded to fewer decimal places,
+  as when a file is opened in a spreadsheet and saved again.
+scientific
+  values are written in scientific notation in the first file and in
+  fixed-point notation in the second.
+wide
+  few rows with thousands of columns, as for mostly_identical.
+tall
+  many rows with a few columns, as for truncated.
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import random
+
+
+def _values(rnd, columns):
+    return [rnd.uniform(-1, 1) * 10 ** rnd.randint(-4, 6)
+            for _ in range(columns)]
+
+
+def _join(strings):
+    return ",".join(strings) + "\n"
+
+
+def mostly_identical(rows, columns, rnd):
+    for _ in range(rows):
+        values = _values(rnd, columns)
+        line = _join("{:.15g}".format(v) for v in values)
+        if rnd.random() < 0.01:
+            yield line, _join("{:.6g}".format(v) for v in values)
+        else:
+            yield line, line
+
+
+def truncated(rows, columns, rnd):
+    for _ in range(rows):
+        values = _values(rnd, columns)
+        yield _join("{:.15g}".format(v) for v in values), \
+            _join("{:.{}g}".format(v, rnd.randint(2, 8)) for v in values)
+
+
+def scientific(rows, columns, rnd):
+    for _ in range(rows):
+        values = _values(rnd, columns)
+        yield _join("{:.8e}".format(v) for v in values), \
+            _join("{:.6f}".format(v) for v in values)
+
+
+DATASETS = {
+    # name: (generator, default rows, default columns)
+    "mostly_identical": (mostly_identical, 100000, 10),
+    "truncated": (truncated, 100000, 10),
+    "scientific": (scientific, 100000, 10),
+    "wide": (mostly_identical, 500, 2000),
+    "tall": (truncated, 1000000, 3),
+}
+"""the available data sets, with their default dimensions"""
+
+
+def generate(name, rows, columns, seed=42):
+    """
+    Generate the pairs of lines of a data set.
+
+    :param name: the name of a data set in DATASETS
+    :param rows: the number of rows
+    :param columns: the number of columns
+    :param seed: the seed for the random number generator
+    :return: an iterator over pairs of lines
+    """
+    return DATASETS[name][0](rows, columns, random.Random(seed))
+
+
+def write_pair(name, directory, rows, columns, seed=42):
+    """
+    Write the two files of a data set. The lines are generated and written
+    one at a time, so data sets of any size can be written.
+
+    :param name: the name of a data set in DATASETS
+    :param directory: the directory in which to write the files
+    :param rows: the number of rows
+    :param columns: the number of columns
+    :param seed: the seed for the random number generator
+    :return: the paths of the two files
+    """
+    paths = [os.path.join(directory, "{}-{}x{}-{}.csv".
+                          format(name, rows, columns, suffix))
+             for suffix in ("a", "b")]
+    with open(paths[0], "w") as fh0, open(paths[1], "w") as fh1:
+        for line0, line1 in generate(name, rows, columns, seed):
+            fh0.write(line0)
+            fh1.write(line1)
+    return paths
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for comparedecimal.
+
+For each selected data set (see datasets.py), a pair of files is
+generated and each selected target is timed on it:
+
+compare_strings
+  DecimalComparer.compare_strings on every pair of fields
+compare_string_lists
+  DecimalComparer.compare_string_lists on every pair of rows
+compare_line_lists
+  DecimalComparer.compare_line_lists on the lists of lines
+cli
+  the comparecsv command-line tool, end to end
+
+The in-memory targets use at most --in-memory-rows rows of each data set,
+since their inputs have to be held in memory; the cli target always uses
+the whole files. Every target is run in its own process, so that the
+peak resident set size (RSS) reported for it is its own. Throughput is
+reported in fields per second and in megabytes of input (both files)
+per second.
+
+Usage example:
+
+    python3 -m benchmarks.run_benchmarks --datasets truncated wide \\
+        --scale 0.1 --json results.json
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import datasets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ["compare_strings", "compare_string_lists", "compare_line_lists",
+           "cli"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark comparedecimal on synthetic data sets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--datasets", nargs="+", choices=datasets.DATASETS,
+                        default=list(datasets.DATASETS),
+                        help="data sets to generate")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS,
+                        default=TARGETS, help="functions to time")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="factor applied to the default row counts")
+    parser.add_argument("--rows", type=int,
+                        help="row count, overriding the defaults")
+    parser.add_argument("--columns", type=int,
+                        help="column count, overriding the defaults")
+    parser.add_argument("--in-memory-rows", type=int, default=200000,
+                        help="maximum rows used by the in-memory targets")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--directory", type=str,
+                        help="directory for the generated files "
+                             "(default: a temporary directory)")
+    parser.add_argument("--json", type=str,
+                        help="also write the results to this file as JSON")
+    parser.add_argument("--run-one", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        target, path0, path1, max_rows = args.run_one
+        print(json.dumps(_run_in_process(target, path0, path1,
+                                         int(max_rows))))
+        return
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        directory = args.directory or tempdir
+        results = []
+        print("{:17s} {:21s} {:>9s} {:>13s} {:>9s} {:>10s}".format(
+            "dataset", "target", "seconds", "fields/s", "MB/s", "peak RSS"))
+        for name in args.datasets:
+            _, rows, columns = datasets.DATASETS[name]
+            rows = args.rows or max(1, int(rows * args.scale))
+            columns = args.columns or columns
+            paths = datasets.write_pair(name, directory, rows, columns,
+                                        args.seed)
+            for target in args.targets:
+                result = _run_target(target, paths, args.in_memory_rows)
+                result.update(dataset=name, rows=rows, columns=columns,
+                              target=target)
+                results.append(result)
+                print("{:17s} {:21s} {:9.3f} {:13.0f} {:9.2f} {:8.1f}MB".
+                      format(name, target, result["seconds"],
+                             result["fields"] / result["seconds"],
+                             result["bytes"] / result["seconds"] / 1e6,
+                             result["peak_rss"] / 1e6))
+
+    if args.json is not None:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+def _run_target(target, paths, max_rows):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [REPO_DIR] + [p for p in [env.get("PYTHONPATH")] if p])
+    if target == "cli":
+        fields = _count_fields(paths[0])
+        size = sum(os.path.getsize(path) for path in paths)
+        command = [sys.executable, "-c",
+                   "from comparedecimal.comparedecimal import main; main()"]
+        start = time.perf_counter()
+        output, rusage = _run(command + paths, env)
+        result = dict(seconds=time.perf_counter() - start,
+                      fields=fields, bytes=size)
+    else:
+        command = [sys.executable, "-m", "benchmarks.run_benchmarks",
+                   "--run-one", target, paths[0], paths[1], str(max_rows)]
+        output, rusage = _run(command, env)
+        result = json.loads(output)
+    result["peak_rss"] = _max_rss_bytes(rusage)
+    return result
+
+
+def _run(command, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE)
+    output = process.stdout.read()
+    process.stdout.close()
+    _, status, rusage = os.wait4(process.pid, 0)
+    if status != 0:
+        raise RuntimeError("{} failed with status {}".format(command, status))
+    return output, rusage
+
+
+def _max_rss_bytes(rusage):
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _count_fields(path):
+    with open(path) as fh:
+        return sum(len(row) for row in csv.reader(fh))
+
+
+def _run_in_process(target, path0, path1, max_rows):
+    from comparedecimal import DecimalComparer
+
+    lines = []
+    for path in path0, path1:
+        with open(path) as fh:
+            lines.append(list(itertools.islice(fh, max_rows)))
+    size = sum(len(line.encode()) for line in itertools.chain(*lines))
+    rows = [list(csv.reader(line_list, skipinitialspace=True))
+            for line_list in lines]
+    fields = sum(len(row) for row in rows[0])
+
+    comparer = DecimalComparer()
+    start = time.perf_counter()
+    if target == "compare_strings":
+        for fields0, fields1 in zip(*rows):
+            for string0, string1 in zip(fields0, fields1):
+                comparer.compare_strings(string0, string1)
+    elif target == "compare_string_lists":
+        for fields0, fields1 in zip(*rows):
+            comparer.compare_string_lists(fields0, fields1)
+    elif target == "compare_line_lists":
+        comparer.compare_line_lists(lines[0], lines[1])
+    return dict(seconds=time.perf_counter() - start, fields=fields,
+                bytes=size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
 from .comparedecimal import EqualityLevel
 from .comparedecimal import DecimalComparer
 from .comparedecimal import FieldDifference
+from .comparedecimal import ParsedLiteral
+from .comparedecimal import ColumnStatistics
+from .comparedecimal import column_indices
@@ -0,0 +1,335 @@
+"""
+Comparison of delimited files with rows inserted or deleted.
+
+This module is part of comparedecimal. The function compare_aligned
+aligns the records of two files in the manner of a diff tool, compares
+the aligned pairs of records field by field, and reports the blocks of
+records which only occur in one of the files.
+
+The alignment uses the patience diff algorithm on hashes of the records:
+records occurring exactly once in each file are used as anchors, the
+longest sequence of anchors in the same order in both files is matched,
+and the gaps between anchors are aligned in the same way. Since a record
+which was written with a different precision has a different hash, gaps
+without anchors are aligned again using normalized forms of the records:
+first with every number rounded to three significant figures, then with
+every number replaced by its sign and order of magnitude. Gaps which still
+have no anchors are aligned record by record from their start.
+
+Memory use is proportional to the number of records rather than to their
+size: each record is kept as an 8-byte hash, and anchors are found with a
+table of bounded size rather than one entry per distinct record. The
+alignment time is close to linear in the number of records for files
+which mostly agree.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import itertools
+import math
+from array import array
+from collections import namedtuple
+from typing import Callable, Iterator, List, Sequence, TextIO, Tuple
+
+from .comparedecimal import DecimalComparer
+
+# The largest number of buckets used to count records when finding anchors
+ANCHOR_TABLE_SIZE = 1 << 20
+
+Block = namedtuple("Block", "start0 end0 start1 end1")
+"""
+A block of records occurring in only one file: records start0 to end0
+(exclusive, counting from 0) of the first file were deleted, or records
+start1 to end1 of the second file were inserted. The other range is empty,
+and gives the position of the block in the other file.
+"""
+
+AlignedResult = namedtuple("AlignedResult", "first_difference blocks")
+"""
+The result of an aligned comparison: a string describing the first
+difference between aligned records (or None), and a list of Blocks of
+inserted and deleted records in the order in which they occur.
+"""
+
+
+def compare_aligned(comparer: DecimalComparer, stream0: TextIO,
+                    stream1: TextIO) -> AlignedResult:
+    """
+    Align the records of two delimited files and compare them.
+
+    The streams are read once to hash their records, once more for each
+    normalized form needed to align gaps without anchors, and once to
+    compare the aligned records. The
+    streams must therefore be seekable, e.g. files opened in text mode or
+    ``io.StringIO`` objects. The ``totals`` attribute of ``comparer`` is
+    updated with the results of comparing each aligned pair of records,
+    and line numbers in the description of the first difference refer to
+    the first file.
+
+    If the comparer is in fail-fast mode and any records were inserted or
+    deleted, the aligned records are not compared.
+
+    :param comparer: the comparer to use
+    :param stream0: a seekable stream of lines
+    :param stream1: another seekable stream of lines
+    :return: an AlignedResult describing the differences
+    """
+    hashes0 = _hash_records(comparer, stream0)
+    hashes1 = _hash_records(comparer, stream1)
+    blocks, gaps = align(hashes0, hashes1)
+    for normalize in _round_number, _magnitude:
+        if not gaps:
+            break
+        normalized0 = _hash_ranges(comparer, stream0, normalize,
+                                   [(gap.start0, gap.end0) for gap in gaps])
+        normalized1 = _hash_ranges(comparer, stream1, normalize,
+                                   [(gap.start1, gap.end1) for gap in gaps])
+        remaining = []
+        for gap, gap_hashes0, gap_hashes1 in \
+                zip(gaps, normalized0, normalized1):
+            gap_blocks, gap_gaps = align(gap_hashes0, gap_hashes1)
+            for start0, end0, start1, end1 in gap_blocks:
+                blocks.append(Block(gap.start0 + start0, gap.start0 + end0,
+                                    gap.start1 + start1, gap.start1 + end1))
+            for start0, end0, start1, end1 in gap_gaps:
+                remaining.append(Block(gap.start0 + start0, gap.start0 + end0,
+                                       gap.start1 + start1, gap.start1 + end1))
+        gaps = sorted(remaining)
+
+    # Treat the records in the remaining gaps as changed, and any surplus
+    # at the end of a gap as inserted or deleted.
+    for start0, end0, start1, end1 in gaps:
+        common = min(end0 - start0, end1 - start1)
+        if end0 - start0 != end1 - start1:
+            blocks.append(Block(start0 + common, end0, start1 + common, end1))
+    blocks.sort()
+
+    if comparer.fail_fast and blocks:
+        return AlignedResult(first_difference=None, blocks=blocks)
+
+    stream0.seek(0)
+    stream1.seek(0)
+    records0 = comparer._reader(stream0)
+    records1 = comparer._reader(stream1)
+    first_difference = None
+    line0 = line1 = 0
+    end = Block(len(hashes0), len(hashes0), len(hashes1), len(hashes1))
+    for block in blocks + [end]:
+        # Records between blocks are aligned one to one.
+        aligned = zip(itertools.islice(records0, block.start0 - line0),
+                      itertools.islice(records1, block.start1 - line1))
+        for row0, row1 in aligned:
+            if row0 == row1:
+                comparer._add_identical_rows(len(row0))
+                line0 += 1
+                line1 += 1
+                continue
+            result = comparer.compare_string_lists(row0, row1, line0)
+            if result is not None and first_difference is None:
+                first_difference = line0, result
+                if comparer.fail_fast:
+                    break
+            line0 += 1
+            line1 += 1
+        if first_difference is not None and comparer.fail_fast:
+            break
+        _skip(records0, block.end0 - block.start0)
+        _skip(records1, block.end1 - block.start1)
+        line0, line1 = block.end0, block.end1
+
+    return AlignedResult(
+        first_difference=None if first_difference is None else
+        comparer._describe_difference(*first_difference),
+        blocks=blocks)
+
+
+def align(hashes0: Sequence[int], hashes1: Sequence[int]) ->\
+        Tuple[List[Block], List[Block]]:
+    """
+    Align two sequences of record hashes using the patience diff
+    algorithm.
+
+    :param hashes0: the hashes of the first file's records
+    :param hashes1: the hashes of the second file's records
+    :return: a tuple of the blocks of inserted and deleted records, and
+             the gaps (containing records from both files) in which no
+             anchors were found, each sorted by position
+    """
+    blocks = []
+    gaps = []
+    stack = [(0, len(hashes0), 0, len(hashes1))]
+    while stack:
+        start0, end0, start1, end1 = stack.pop()
+        while start0 < end0 and start1 < end1 and \
+                hashes0[start0] == hashes1[start1]:
+            start0 += 1
+            start1 += 1
+        while start0 < end0 and start1 < end1 and \
+                hashes0[end0 - 1] == hashes1[end1 - 1]:
+            end0 -= 1
+            end1 -= 1
+        if start0 == end0 or start1 == end1:
+            if start0 < end0 or start1 < end1:
+                blocks.append(Block(start0, end0, start1, end1))
+            continue
+
+        anchors = _unique_anchors(hashes0, start0, end0,
+                                  hashes1, start1, end1)
+        if not anchors:
+            gaps.append(Block(start0, end0, start1, end1))
+            continue
+        previous0, previous1 = start0, start1
+        for anchor0, anchor1 in anchors + [(end0, end1)]:
+            if previous0 < anchor0 or previous1 < anchor1:
+                stack.append((previous0, anchor0, previous1, anchor1))
+            previous0, previous1 = anchor0 + 1, anchor1 + 1
+
+    blocks.sort()
+    gaps.sort()
+    return blocks, gaps
+
+
+def _unique_anchors(hashes0: Sequence[int], start0: int, end0: int,
+                    hashes1: Sequence[int], start1: int, end1: int) ->\
+        List[Tuple[int, int]]:
+    """
+    Find the longest sequence of records which occur exactly once in each
+    range, and in the same order in both.
+
+    Occurrences are counted in a table of at most ANCHOR_TABLE_SIZE
+    buckets rather than one entry per distinct record. For a range with
+    more records than half the table, only records whose hash is a
+    multiple of a stride are candidates, so that the table stays sparse;
+    the gaps between the anchors found are searched again with a smaller
+    stride. Records sharing a bucket with another record are not used as
+    anchors, which only loses anchors, never gives wrong ones.
+    """
+    longest = max(end0 - start0, end1 - start1)
+    stride = -(-2 * longest // ANCHOR_TABLE_SIZE)
+    size = min(ANCHOR_TABLE_SIZE, 2 * longest)
+    counts0 = bytearray(size)
+    counts1 = bytearray(size)
+    # The position of the last record of the second range in each bucket
+    positions1 = array("q", bytes(8 * size))
+    for index in range(start1, end1):
+        value = hashes1[index]
+        if value % stride == 0:
+            bucket = value // stride % size
+            if counts1[bucket] < 2:
+                counts1[bucket] += 1
+            positions1[bucket] = index
+    for index in range(start0, end0):
+        value = hashes0[index]
+        if value % stride == 0:
+            bucket = value // stride % size
+            if counts0[bucket] < 2:
+                counts0[bucket] += 1
+    indices0 = []  # type: List[int]
+    indices1 = []  # type: List[int]
+    for index in range(start0, end0):
+        value = hashes0[index]
+        if value % stride == 0:
+            bucket = value // stride % size
+            if counts0[bucket] == 1 and counts1[bucket] == 1 and \
+                    hashes1[positions1[bucket]] == value:
+                indices0.append(index)
+                indices1.append(positions1[bucket])
+    candidates = list(zip(indices0, indices1))
+    if all(a < b for a, b in zip(indices1, indices1[1:])):
+        # The common case of no reordered records
+        return candidates
+
+    # Patience sorting: tails[k] is the index of the candidate ending
+    # the best increasing sequence of length k + 1 found so far.
+    tails = []  # type: List[int]
+    tail_values = []  # type: List[int]
+    predecessors = [-1] * len(candidates)
+    for candidate, (_, index1) in enumerate(candidates):
+        if tail_values and index1 > tail_values[-1]:
+            # The common case of records in the same order in both files
+            k = len(tails)
+        else:
+            k = bisect.bisect_left(tail_values, index1)
+        if k > 0:
+            predecessors[candidate] = tails[k - 1]
+        if k == len(tails):
+            tails.append(candidate)
+            tail_values.append(index1)
+        else:
+            tails[k] = candidate
+            tail_values[k] = index1
+
+    anchors = []
+    candidate = tails[-1] if tails else -1
+    while candidate != -1:
+        anchors.append(candidates[candidate])
+        candidate = predecessors[candidate]
+    anchors.reverse()
+    return anchors
+
+
+def _skip(records: Iterator[List[str]], count: int) -> None:
+    for _ in itertools.islice(records, count):
+        pass
+
+
+def _hash_records(comparer: DecimalComparer, stream: TextIO) -> array:
+    hashes = array("q")
+    for row in comparer._reader(stream):
+        hashes.append(hash(tuple(row)))
+    return hashes
+
+
+def _hash_ranges(comparer: DecimalComparer, stream: TextIO,
+                 normalize: Callable[[str], tuple],
+                 ranges: List[Tuple[int, int]]) -> List[array]:
+    """
+    Hash the records of a stream within sorted, disjoint ranges, with
+    each field normalized by the given function.
+    """
+    stream.seek(0)
+    records = comparer._reader(stream)
+    hashes = []
+    position = 0
+    for start, end in ranges:
+        _skip(records, start - position)
+        hashes.append(array("q", (
+            hash(tuple(normalize(field) for field in row))
+            for row in itertools.islice(records, end - start))))
+        position = end
+    return hashes
+
+
+def _round_number(field: str) -> tuple:
+    try:
+        value = float(field)
+    except ValueError:
+        return field.strip(),
+    return "{:.2e}".format(value),
+
+
+def _magnitude(field: str) -> tuple:
+    try:
+        value = float(field)
+    except ValueError:
+        return field.strip(),
+    if value == 0:
+        return 0,
+    if not math.isfinite(value):
+        # NaNs are hashed by identity, so use their string form.
+        return repr(value),
+    return value > 0, math.floor(math.log10(abs(value)))
@@ -0,0 +1,432 @@
+"""
+Comparison of columnar files in the Arrow IPC and Parquet formats.
+
+This module is part of comparedecimal. It requires the pyarrow package,
+which is an optional dependency of the package (installable with
+``pip install comparedecimal[arrow]``), and NumPy.
+
+The function compare_tables compares two tables column by column rather
+than line by line. Either table may be read from an Arrow IPC file or
+stream, a Parquet file, or a delimited text file with a header row, so a
+CSV file can be compared with its Parquet counterpart. Arrow files are
+memory-mapped, and Parquet files are read through a memory map, so their
+columns are never converted to text as a whole. A delimited text file is
+read SLICE_ROWS rows at a time, so only one slice of it is held in memory.
+
+Each pair of columns is compared in slices of SLICE_ROWS rows. If the two
+columns have the same type, the values which are equal (and not
+differently signed zeros) are found with an Arrow compute kernel and
+counted as identical without being converted. If the types differ (for
+instance, when a text file is compared with a Parquet file), both columns
+are first converted to strings by an Arrow cast, and compared in the
+same way. If both columns are numeric, the remaining pairs of values
+which are equal, or which have opposite signs or differ by a factor of
+ten or more, are classified from their values as DecimalComparer would
+classify their strings. The rest are converted to strings and compared by classify_columns in the
+vectorized module. The strings are those which Arrow writes to CSV files
+-- the shortest representation which reads back as the same value for a
+float, the digits of a decimal with its scale, and the empty string for
+a null -- except that the mantissas of integral floats are given a
+trailing ".0", as Python writes 2.0 (but not 1e+20). Otherwise an
+integral float would only have the significant figures of its integer
+part, and 2.0 would be compatible with 2.1, or 1e+20 with 1.5e+20.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import contextlib
+import itertools
+from typing import List, Optional, Tuple
+
+from .comparedecimal import DecimalComparer, EqualityLevel, FieldDifference
+
+SLICE_ROWS = 1 << 16
+"""the number of rows of each column compared at a time"""
+
+_MAGIC = [
+    (b"ARROW1", "arrow"),
+    (b"\xff\xff\xff\xff", "arrow-stream"),
+    (b"PAR1", "parquet"),
+]
+
+
+def detect_format(path: str) -> Optional[str]:
+    """
+    Detect the format of a columnar file from its first bytes.
+
+    :param path: the path of a file
+    :return: "arrow" for an Arrow IPC file, "arrow-stream" for an Arrow
+             IPC stream, "parquet" for a Parquet file, or None for any
+             other file
+    """
+    with open(path, "rb") as fh:
+        start = fh.read(6)
+    for magic, file_format in _MAGIC:
+        if start.startswith(magic):
+            return file_format
+    return None
+
+
+def column_names(path: str) -> List[str]:
+    """
+    Read the column names of an Arrow or Parquet file from its schema,
+    without reading its columns.
+
+    :param path: the path of an Arrow or Parquet file
+    :return: the names of the columns
+    :raises ValueError: if pyarrow is not installed, or if the file isn't
+            an Arrow or Parquet file
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("{} can't be read without the pyarrow "
+                         "package".format(path))
+    file_format = detect_format(path)
+    if file_format == "arrow":
+        schema = pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema
+    elif file_format == "arrow-stream":
+        schema = pyarrow.ipc.open_stream(pyarrow.memory_map(path)).schema
+    elif file_format == "parquet":
+        import pyarrow.parquet
+        schema = pyarrow.parquet.read_schema(path, memory_map=True)
+    else:
+        raise ValueError("{} isn't an Arrow or Parquet file".format(path))
+    return schema.names
+
+
+def open_table(path: str, separator: str = ","):
+    """
+    Read a table from an Arrow, Parquet, or delimited text file.
+
+    Arrow files are memory-mapped, so their columns are only read from
+    the file when they're used. Delimited text files are read with the
+    same CSV settings as DecimalComparer, taking the column names from
+    the first row, and all their columns have the string type; the
+    whole file is read into memory, which compare_tables avoids by
+    reading it in slices.
+
+    :param path: the path of a file
+    :param separator: the field separator of a delimited text file
+    :return: a pyarrow.Table
+    :raises ValueError: if pyarrow is not installed, or if the rows of a
+            delimited text file have different numbers of fields
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("{} can't be compared as a table without the "
+                         "pyarrow package".format(path))
+    file_format = detect_format(path)
+    if file_format == "arrow":
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+    if file_format == "arrow-stream":
+        return pyarrow.ipc.open_stream(pyarrow.memory_map(path)).read_all()
+    if file_format == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(path, memory_map=True)
+
+    with _text_slices(path, separator, None) as (header, slices):
+        return pyarrow.Table.from_batches(
+            list(slices), schema=_string_schema(header))
+
+
+@contextlib.contextmanager
+def _open_slices(path: str, separator: str, slice_rows: int):
+    """
+    Open a table file for reading in slices.
+
+    :return: a context manager giving the column names, an iterator over
+             slices of slice_rows rows (the last one possibly shorter)
+             as pyarrow.Table or pyarrow.RecordBatch objects, and the
+             number of rows, or None if it isn't known in advance
+    """
+    if detect_format(path) is None:
+        with _text_slices(path, separator, slice_rows) as (header, slices):
+            yield header, slices, None
+        return
+    table = open_table(path)
+    yield table.column_names, (table.slice(start, slice_rows) for start
+                               in range(0, table.num_rows, slice_rows)), \
+        table.num_rows
+
+
+@contextlib.contextmanager
+def _text_slices(path: str, separator: str, slice_rows: Optional[int]):
+    """
+    Read a delimited text file in slices of string columns.
+
+    :param slice_rows: the number of rows in each slice, or None to read
+           the file as a single slice
+    :return: a context manager giving the column names and an iterator
+             over pyarrow.RecordBatch slices
+    :raises ValueError: if the rows have different numbers of fields
+    """
+    import pyarrow
+    from .compressed import open_lines
+    with open_lines(path) as fh:
+        reader = DecimalComparer(separator=separator)._reader(fh)
+        header = next(reader, [])
+        schema = _string_schema(header)
+
+        def slices():
+            rows = itertools.islice(reader, slice_rows)
+            while True:
+                columns = [[] for _ in header]
+                for row in rows:
+                    if len(row) != len(header):
+                        raise ValueError(
+                            "Line {} of {} has {} fields rather than "
+                            "{}".format(reader.line_num, path, len(row),
+                                        len(header)))
+                    for column, field in zip(columns, row):
+                        column.append(field)
+                if not header or not columns[0]:
+                    return
+                yield pyarrow.RecordBatch.from_arrays(
+                    [pyarrow.array(column, type=pyarrow.string())
+                     for column in columns], schema=schema)
+                if slice_rows is None or len(columns[0]) < slice_rows:
+                    return
+                rows = itertools.islice(reader, slice_rows)
+
+        yield header, slices()
+
+
+def _string_schema(header: List[str]):
+    import pyarrow
+    return pyarrow.schema([(name, pyarrow.string()) for name in header])
+
+
+def compare_tables(comparer: DecimalComparer, path0: str, path1: str,
+                   slice_rows: int = SLICE_ROWS) -> Optional[str]:
+    """
+    Compare two tables column by column.
+
+    Columns are matched by position, as in a comparison of text files,
+    and the column selection of the comparer is applied. The ``totals``
+    and ``column_statistics`` of the comparer are updated. Rows are
+    numbered from 1 in the description of a difference, excluding any
+    header row. In fail-fast mode, no further slices of rows are
+    compared once a difference has been found.
+
+    :param comparer: the comparer whose settings should be used, and
+           whose totals should be updated
+    :param path0: the path of a table file (see open_table); a delimited
+           text file is read slice_rows rows at a time
+    :param path1: the path of another table file
+    :param slice_rows: the number of rows compared at a time
+    :return: a string describing the first difference, or ``None``
+           if the tables are equal
+    """
+    with _open_slices(path0, comparer.separator, slice_rows) as table0, \
+            _open_slices(path1, comparer.separator, slice_rows) as table1:
+        (names0, slices0, rows0), (names1, slices1, rows1) = table0, table1
+        if comparer.fail_fast and None not in (rows0, rows1) and \
+                rows0 != rows1:
+            return "Unequal numbers of lines ({}, {})".format(rows0, rows1)
+        if len(names0) != len(names1):
+            return "Differing numbers of columns ({}, {})".format(
+                len(names0), len(names1))
+
+        columns = range(len(names0)) if comparer._projections is None \
+            else comparer._project(len(names0))
+        iterators = [slices0, slices1]
+        row_counts = [0, 0]
+        first_difference = None
+        while True:
+            slices = [next(iterator, None) for iterator in iterators]
+            if slices[0] is None or slices[1] is None:
+                break
+            length = min(slices[0].num_rows, slices[1].num_rows)
+            for column in columns:
+                difference = _compare_slices(
+                    comparer, column, slices[0].column(column).slice(0, length),
+                    slices[1].column(column).slice(0, length), row_counts[0])
+                if difference is not None and (first_difference is None or
+                                               difference[0] <
+                                               first_difference[0]):
+                    first_difference = difference
+            row_counts[0] += slices[0].num_rows
+            row_counts[1] += slices[1].num_rows
+            if first_difference is not None and comparer.fail_fast:
+                return comparer._describe_difference(*first_difference)
+
+        for i in (0, 1):
+            if slices[i] is not None:
+                row_counts[i] += slices[i].num_rows + \
+                    sum(rest.num_rows for rest in iterators[i])
+
+    if row_counts[0] != row_counts[1]:
+        return "Unequal numbers of lines ({}, {})".format(*row_counts)
+    return None if first_difference is None else \
+        comparer._describe_difference(*first_difference)
+
+
+def _compare_slices(comparer: DecimalComparer, column: int, values0, values1,
+                    first_row: int) ->\
+        Optional[Tuple[int, FieldDifference]]:
+    """
+    Compare two slices of columns, updating the comparer's totals.
+
+    :param comparer: the comparer
+    :param column: the index of the columns
+    :param values0: a pyarrow.ChunkedArray
+    :param values1: another pyarrow.ChunkedArray of the same length
+    :param first_row: the index of the first row of the slices
+    :return: the index of the first row with unequal values and their
+             difference, or None if there is no such row
+    """
+    import numpy as np
+    import pyarrow
+    import pyarrow.compute as pc
+    from .vectorized import classify_columns
+
+    try:
+        if values0.type != values1.type:
+            raise pyarrow.ArrowNotImplementedError
+        equal = pc.equal(values0, values1)
+    except pyarrow.ArrowNotImplementedError:
+        values0 = _cast_to_strings(values0)
+        values1 = _cast_to_strings(values1)
+        equal = pc.equal(values0, values1)
+    identical = pc.or_(pc.fill_null(equal, False),
+                       pc.and_(pc.is_null(values0), pc.is_null(values1)))
+    identical = identical.to_numpy(zero_copy_only=False)
+    if pyarrow.types.is_floating(values0.type):
+        # 0 and -0 are equal, but their strings aren't identical.
+        identical &= np.signbit(values0.to_numpy(zero_copy_only=False)) == \
+            np.signbit(values1.to_numpy(zero_copy_only=False))
+    rows = np.flatnonzero(~identical)
+
+    totals = comparer.totals
+    statistics = comparer.column_statistics
+    totals[EqualityLevel.IDENTICAL] += len(values0) - len(rows)
+    if statistics is not None:
+        statistics.add_identical_rows(0, len(values0) - len(rows), [column])
+    if len(rows) == 0:
+        return None
+
+    values0 = values0.take(pyarrow.array(rows))
+    values1 = values1.take(pyarrow.array(rows))
+    levels = np.zeros(len(rows), dtype=np.int64)
+    if _is_numeric(values0.type) and _is_numeric(values1.type):
+        _classify_numbers(values0, values1, levels)
+    undecided = np.flatnonzero(levels == 0)
+    if len(undecided) == len(rows):
+        strings0 = _cast_to_strings(values0).to_pylist()
+        strings1 = _cast_to_strings(values1).to_pylist()
+        levels = classify_columns(comparer, strings0, strings1)
+    else:
+        strings0 = strings1 = None
+        if len(undecided):
+            indices = pyarrow.array(undecided)
+            levels[undecided] = classify_columns(
+                comparer, _cast_to_strings(values0.take(indices)).to_pylist(),
+                _cast_to_strings(values1.take(indices)).to_pylist())
+    for value, count in enumerate(np.bincount(levels)):
+        if count:
+            totals[EqualityLevel(value)] += int(count)
+
+    report = comparer.report
+    if statistics is not None or report is not None:
+        if strings0 is None:
+            strings0 = _cast_to_strings(values0).to_pylist()
+            strings1 = _cast_to_strings(values1).to_pylist()
+        for i, value in enumerate(levels.tolist()):
+            level = EqualityLevel(value)
+            relative_difference = None \
+                if level == EqualityLevel.IDENTICAL else \
+                comparer._relative_difference(strings0[i], strings1[i])
+            if statistics is not None:
+                statistics.add(column, level, relative_difference,
+                               first_row + int(rows[i]))
+            if report is not None and level != EqualityLevel.IDENTICAL:
+                report.add(first_row + int(rows[i]), column, strings0[i],
+                           strings1[i], level, relative_difference)
+
+    unequal = np.flatnonzero(levels == EqualityLevel.UNEQUAL.value)
+    if len(unequal) == 0:
+        return None
+    i = int(unequal[0])
+    if strings0 is None:
+        strings0 = _cast_to_strings(values0.slice(i, 1)).to_pylist()
+        strings1 = _cast_to_strings(values1.slice(i, 1)).to_pylist()
+        i = 0
+    return first_row + int(rows[int(unequal[0])]), FieldDifference(
+        field_index=column, string0=strings0[i], string1=strings1[i])
+
+
+def _is_numeric(data_type) -> bool:
+    import pyarrow
+    return pyarrow.types.is_integer(data_type) or \
+        pyarrow.types.is_floating(data_type)
+
+
+def _classify_numbers(values0, values1, levels) -> None:
+    """
+    Classify pairs of numbers which can be classified without converting
+    them to strings, using the same tests as DecimalComparer before it
+    compares digits: equal values are numerically equal, and values with
+    opposite signs or differing by a factor of ten or more are unequal.
+
+    :param values0: a pyarrow.Array or pyarrow.ChunkedArray of numbers
+    :param values1: another of the same length
+    :param levels: an array of EqualityLevel values for the pairs, which
+           is set for the pairs classified here and left untouched (zero)
+           for the others; nulls and non-finite values are left untouched
+    """
+    import numpy as np
+    import pyarrow
+    import pyarrow.compute as pc
+
+    def floats(values):
+        return pc.cast(values, pyarrow.float64()).to_numpy(
+            zero_copy_only=False)
+
+    a, b = floats(values0), floats(values1)
+    finite = np.isfinite(a) & np.isfinite(b)  # False for nulls (NaN)
+    smaller = np.minimum(np.abs(a), np.abs(b))
+    larger = np.maximum(np.abs(a), np.abs(b))
+    levels[finite & (a == b)] = EqualityLevel.NUMERICALLY_EQUAL.value
+    unequal = finite & (a != b) & (
+        (np.signbit(a) != np.signbit(b)) & (smaller != 0) |
+        (larger >= smaller * 10))
+    levels[unequal] = EqualityLevel.UNEQUAL.value
+
+
+def _cast_to_strings(values):
+    """
+    :param values: a pyarrow.ChunkedArray
+    :return: a pyarrow.ChunkedArray of the strings which would represent
+             the values in a CSV file, with the empty string for nulls
+    """
+    import pyarrow
+    import pyarrow.compute as pc
+    try:
+        strings = pc.cast(values, pyarrow.string())
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+        # Nested types and binary data which isn't UTF-8
+        strings = pyarrow.chunked_array(
+            [pyarrow.array([None if value is None else str(value)
+                            for value in values.to_pylist()],
+                           type=pyarrow.string())])
+    if pyarrow.types.is_floating(values.type):
+        # Python and Arrow both write 1e+20 for 1e20, which would be
+        # taken as a value of low precision, compatible with 1.5e+20.
+        strings = pc.replace_substring_regex(
+            strings, pattern=r"^(-?\d+)(e[-+]?\d+)?$", replacement=r"\1.0\2")
+    return pc.fill_null(strings, "")
@@ -24,12 +24,26 @@ along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
 
 
 import argparse
+import contextlib
 import csv
+from array import array
+import functools
+import itertools
+import json
 import math
+import os
 import re
+import sys
+import time
 from collections import namedtuple
 from enum import Enum
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, \
+    Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    # Only for annotations: these modules import this one.
+    from .align import Block
+    from .report import DifferenceReport
 
 
 def main():
@@ -38,9 +52,12 @@ def main():
 
     Run this module as a command-line utility with files and options
     specified as command-line arguments. The files will be read and
-    compared using DecimalComparer.compare_line_lists, and the results
+    compared using DecimalComparer.compare_streams, and the results
     of comparison written to the standard output in a human-readable
-    format.
+    format. Files compressed with gzip, bzip2, xz, or Zstandard are
+    decompressed while they are read, and Arrow and Parquet files are
+    compared column by column. With the --fail-fast option, the
+    process exits with status 1 if the files differ.
 
     :return: None
     """
@@ -53,29 +70,287 @@ def main():
                         help="threshold for considering values \"close\", "
                              "as a decimal fraction of the smaller value",
                         default=0.01)
+    parser.add_argument("-j", "--jobs", type=int, required=False,
+                        help="number of worker processes to use", default=1)
+    parser.add_argument("-m", "--mmap", action="store_true",
+                        help="memory-map the files and compare them "
+                             "as bytes where possible")
+    parser.add_argument("-p", "--per-column", action="store_true",
+                        help="print statistics for each column")
+    parser.add_argument("-f", "--fail-fast", action="store_true",
+                        help="stop at the first difference, and exit with "
+                             "status 1 if the files differ")
+    parser.add_argument("-k", "--key", type=str, required=False,
+                        help="match rows by these comma-separated key "
+                             "columns (numbers counting from 1, or names "
+                             "in the header of FILE1) rather than by "
+                             "position")
+    parser.add_argument("-a", "--align", action="store_true",
+                        help="align the rows of the files like a diff "
+                             "tool, reporting inserted and deleted rows")
+    parser.add_argument("-c", "--cache", type=str, metavar="DIR",
+                        help="keep results for chunks of the files in "
+                             "this directory, and reuse them for chunks "
+                             "which haven't changed")
+    parser.add_argument("-s", "--sample", action="store_true",
+                        help="estimate the proportions of field pairs at "
+                             "each level by comparing randomly chosen lines")
+    parser.add_argument("--precision", type=float, default=0.01,
+                        help="with --sample, stop when the 95%% confidence "
+                             "intervals are at most this wide on each side")
+    parser.add_argument("--time-budget", type=float, default=10.0,
+                        metavar="SECONDS",
+                        help="with --sample, stop after sampling for this "
+                             "many seconds")
+    parser.add_argument("--columns", type=str, metavar="COLS",
+                        help="only compare these comma-separated columns, "
+                             "given by number (counting from 1) or by name "
+                             "in the header row of FILE1")
+    parser.add_argument("--exclude-columns", type=str, metavar="COLS",
+                        help="don't compare these columns, given as for "
+                             "--columns")
+    parser.add_argument("-r", "--report", type=str, metavar="FILE",
+                        help="write every field pair which isn't identical "
+                             "to this file")
+    parser.add_argument("--report-format", choices=["csv", "jsonl"],
+                        help="format of the report (by default, jsonl if "
+                             "FILE ends with .jsonl or .json, else csv)")
+    parser.add_argument("--report-unequal-only", action="store_true",
+                        help="only write unequal field pairs to the report")
+    parser.add_argument("--report-max-per-column", type=int, metavar="N",
+                        help="write at most N field pairs of each column "
+                             "to the report")
+    parser.add_argument("--report-max", type=int, metavar="N",
+                        help="write at most N field pairs to the report")
+    parser.add_argument("--profile", action="store_true",
+                        help="report the time spent in each stage of "
+                             "the comparison")
+    parser.add_argument("--profile-json", type=str, metavar="FILE",
+                        help="write the profile to this file as JSON")
     parser.add_argument("FILE1", type=str)
     parser.add_argument("FILE2", type=str)
     args = parser.parse_args()
 
-    with open(args.FILE1) as fh:
-        lines0 = fh.readlines()
-
-    with open(args.FILE2) as fh:
-        lines1 = fh.readlines()
+    from .compressed import detect_compression, open_lines
+    if (args.key is not None or args.align or args.jobs > 1 or args.mmap
+            or args.cache is not None or args.sample) \
+            and any(detect_compression(path) is not None
+                    for path in (args.FILE1, args.FILE2)):
+        parser.error("compressed files can't be compared with --key, "
+                     "--align, --jobs, --mmap, --cache, or --sample")
+    if args.key is not None and (args.align or args.jobs > 1 or args.mmap):
+        parser.error("--key can't be used with --align, --jobs, or --mmap")
+    if args.jobs > 1 and args.mmap:
+        parser.error("--jobs can't be used with --mmap")
+    if args.align and (args.jobs > 1 or args.mmap):
+        parser.error("--align can't be used with --jobs or --mmap")
+    if args.cache is not None and (args.key is not None or args.align or
+                                   args.mmap):
+        parser.error("--cache can't be used with --key, --align, or --mmap")
+    from .columnar import detect_format
+    columnar = any(detect_format(path) is not None
+                   for path in (args.FILE1, args.FILE2))
+    if columnar and (args.key is not None or args.align or args.jobs > 1 or
+                     args.mmap or args.cache is not None or args.sample):
+        parser.error("Arrow and Parquet files can't be compared with --key, "
+                     "--align, --jobs, --mmap, --cache, or --sample")
+    if args.sample and (args.key is not None or args.align or
+                        args.jobs > 1 or args.mmap or
+                        args.cache is not None or args.fail_fast):
+        parser.error("--sample can't be used with --key, --align, --jobs, "
+                     "--mmap, --cache, or --fail-fast")
+    if args.report is not None and (args.jobs > 1 or args.cache is not None
+                                    or args.sample):
+        parser.error("--report can't be used with --jobs, --cache, or "
+                     "--sample")
 
     separator = bytes(args.delimiter, "utf-8").decode("unicode_escape")
+    columns, exclude_columns = [
+        None if selection is None else
+        _parse_columns(parser, selection, args.FILE1, separator)
+        for selection in (args.columns, args.exclude_columns)]
+    key_columns = None if args.key is None else \
+        _parse_columns(parser, args.key, args.FILE1, separator)
     comparer = DecimalComparer(separator=separator,
-                               closeness_threshold=args.threshold)
-    result = comparer.compare_line_lists(lines0, lines1)
+                               closeness_threshold=args.threshold,
+                               per_column=args.per_column,
+                               fail_fast=args.fail_fast,
+                               profile=args.profile or
+                               args.profile_json is not None,
+                               columns=columns,
+                               exclude_columns=exclude_columns)
+    if args.report is not None:
+        from .report import DifferenceReport, format_for_path
+        comparer.report = DifferenceReport(
+            open(args.report, "w", newline=""),
+            args.report_format or format_for_path(args.report),
+            unequal_only=args.report_unequal_only,
+            max_per_column=args.report_max_per_column,
+            max_total=args.report_max)
+    start_time = time.perf_counter_ns()
+    unmatched = None
+    blocks = None
+    sampled = None
+    if columnar:
+        from .columnar import compare_tables
+        try:
+            result = compare_tables(comparer, args.FILE1, args.FILE2)
+        except ValueError as error:
+            parser.error(str(error))
+    elif args.key is not None:
+        from .keyed import compare_keyed
+        keyed = compare_keyed(comparer, args.FILE1, args.FILE2, key_columns)
+        result = keyed.first_difference
+        unmatched = zip((args.FILE1, args.FILE2), keyed.unmatched,
+                        keyed.examples)
+    elif args.align:
+        from .align import compare_aligned
+        with open(args.FILE1) as fh0, open(args.FILE2) as fh1:
+            aligned = compare_aligned(comparer, fh0, fh1)
+        result = aligned.first_difference
+        blocks = aligned.blocks
+    elif args.sample:
+        from .sampling import compare_sampled
+        sampled = compare_sampled(comparer, args.FILE1, args.FILE2,
+                                  args.precision, args.time_budget)
+        result = sampled.first_difference
+    elif args.cache is not None:
+        from .incremental import compare_cached
+        result = compare_cached(comparer, args.FILE1, args.FILE2, args.cache,
+                                jobs=args.jobs).first_difference
+    elif args.jobs > 1:
+        from .parallel import compare_files
+        result = compare_files(comparer, args.FILE1, args.FILE2, args.jobs)
+    elif args.mmap:
+        from .mapped import compare_mapped
+        result = compare_mapped(comparer, args.FILE1, args.FILE2)
+    else:
+        with contextlib.ExitStack() as stack:
+            try:
+                fh0, fh1 = [stack.enter_context(open_lines(path))
+                            for path in (args.FILE1, args.FILE2)]
+            except ValueError as error:
+                parser.error(str(error))
+            result = comparer.compare_streams(fh0, fh1)
+
+    if comparer.profile is not None:
+        comparer.profile.wall_ns = time.perf_counter_ns() - start_time
+    if comparer.report is not None:
+        comparer.report.close()
 
+    if args.sample:
+        print("Field pairs in the sampled lines:")
     for level, count in sorted(list(comparer.totals.items()),
                                key=lambda x: x[0].value):
         print("{:10d} {}".format(count, level.description))
 
+    if args.per_column:
+        _print_column_statistics(comparer.column_statistics)
+
+    if unmatched is not None:
+        for path, count, examples in unmatched:
+            if count > 0:
+                print("{} rows only in {}, e.g. keys: {}".format(
+                    count, path, "; ".join(
+                        separator.join("" if value is None else value
+                                            for value in key)
+                        for key in examples)))
+                if result is None:
+                    result = "Keys missing from one of the files"
+
+    if blocks:
+        _print_blocks(blocks, args.FILE1, args.FILE2)
+        if result is None:
+            result = "Rows inserted or deleted"
+
+    if sampled is not None:
+        from .sampling import format_estimates
+        print()
+        print(format_estimates(sampled))
+        print()
+        if sampled.line_counts[0] != sampled.line_counts[1] and \
+                result is None:
+            result = "Unequal numbers of lines ({}, {})".format(
+                *sampled.line_counts)
+
+    if comparer.report is not None:
+        print("{} field pairs written to {}{}".format(
+            comparer.report.written, args.report,
+            " ({} more not written)".format(comparer.report.dropped)
+            if comparer.report.dropped else ""))
+
+    if args.profile:
+        print()
+        print(comparer.profile.report())
+        print()
+    if args.profile_json is not None:
+        with open(args.profile_json, "w") as fh:
+            json.dump(comparer.profile.to_dict(), fh, indent=2)
+
     if result is None:
-        print("The files contain the same values.")
+        print("The sampled lines contain the same values." if args.sample
+              else "The files contain the same values.")
     else:
         print("First difference:", result)
+        if args.fail_fast:
+            sys.exit(1)
+
+
+def _parse_columns(parser: argparse.ArgumentParser, selection: str,
+                   path: str, separator: str) -> List[int]:
+    columns = [int(column) - 1 if column.isdigit() else column
+               for column in selection.split(",")]
+    if -1 in columns:
+        parser.error("column numbers start at 1")
+    header = []
+    try:
+        if any(isinstance(column, str) for column in columns):
+            from .columnar import column_names, detect_format
+            if detect_format(path) is not None:
+                header = column_names(path)
+            else:
+                from .compressed import open_lines
+                with open_lines(path) as fh:
+                    header = next(
+                        DecimalComparer(separator=separator)._reader(fh), [])
+        return column_indices(header, columns)
+    except ValueError as error:
+        parser.error(str(error))
+
+
+def _print_blocks(blocks: List["Block"], path0: str, path1: str,
+                  limit: int = 20) -> None:
+    for start0, end0, start1, end1 in blocks[:limit]:
+        if end0 > start0:
+            print("Rows {}-{} of {} deleted (before row {} of {})".format(
+                start0 + 1, end0, path0, start1 + 1, path1))
+        else:
+            print("Rows {}-{} of {} inserted (before row {} of {})".format(
+                start1 + 1, end1, path1, start0 + 1, path0))
+    if len(blocks) > limit:
+        print("... and {} more blocks".format(len(blocks) - limit))
+
+
+def _print_column_statistics(statistics: "ColumnStatistics") -> None:
+    levels = sorted(EqualityLevel, key=lambda level: level.value)
+    headings = ["column"] + [level.description for level in levels] + \
+        ["max rel. diff.", "first unequal line"]
+    widths = [max(10, len(heading)) for heading in headings]
+    print()
+    print(" ".join("{:>{}}".format(heading, width)
+                   for heading, width in zip(headings, widths)))
+    for column in range(statistics.column_count):
+        if not any(statistics.count(column, level) for level in levels):
+            # The column wasn't compared.
+            continue
+        first_unequal = statistics.first_unequal_line(column)
+        cells = [str(column + 1)] + \
+            [str(statistics.count(column, level)) for level in levels] + \
+            ["{:.3g}".format(statistics.max_relative_difference(column)),
+             "-" if first_unequal is None else str(first_unequal)]
+        print(" ".join("{:>{}}".format(cell, width)
+                       for cell, width in zip(cells, widths)))
+    print()
 
 
 class EqualityLevel(Enum):
@@ -121,6 +396,168 @@ class EqualityLevel(Enum):
 
 FieldDifference = namedtuple("FieldDifference", "field_index string0 string1")
 
+ParsedLiteral = namedtuple("ParsedLiteral", "value digits sig_figs")
+"""
+A string parsed as a decimal literal: its float value, its mantissa
+digits without leading zeros (or None if it's not in plain decimal
+form, e.g. "nan"), and its number of significant figures (-1 if
+digits is None).
+"""
+
+_MANTISSA_PATTERN = re.compile(r"^[-+]?([0-9]*)\.?([0-9]+)([eE][-+]?[0-9]+)?$")
+
+
+class ColumnStatistics:
+    """
+    Comparison statistics for each column of a pair of delimited files.
+
+    For each column, this records the number of field pairs at each
+    equality level, the maximum relative difference between the values
+    of numeric field pairs (abs(a - b) / min(abs(a), abs(b))), and the
+    line number of the first unequal field pair. The counts are held in a
+    flat integer array of shape (columns × levels), which grows when a
+    line with more columns than any previous one is seen.
+
+    Identical lines which are counted without being split into fields
+    are recorded by their field count only, and added to the per-column
+    counts when they are read.
+    """
+
+    _LEVELS = len(EqualityLevel)
+
+    def __init__(self):
+        self.column_count = 0  # type: int
+        """the number of columns seen so far"""
+        self._counts = array("q")
+        self._max_relative_differences = array("d")
+        self._first_unequal_lines = array("q")
+        self._identical_rows = {}  # type: Dict[int, int]
+
+    def add(self, column: int, level: EqualityLevel,
+            relative_difference: Optional[float] = None,
+            line: Optional[int] = None) -> None:
+        """
+        Record the result of comparing a pair of fields.
+
+        :param column: the index of the fields' column
+        :param level: the equality level of the fields
+        :param relative_difference: the relative difference between the
+               fields' values, or None if they aren't both numeric
+        :param line: the index of the fields' line, or None if unknown
+        """
+        if column >= self.column_count:
+            self._add_columns(column + 1)
+        self._counts[column * self._LEVELS + level.value - 1] += 1
+        if relative_difference is not None and \
+                relative_difference > self._max_relative_differences[column]:
+            self._max_relative_differences[column] = relative_difference
+        if level == EqualityLevel.UNEQUAL and line is not None and \
+                self._first_unequal_lines[column] == 0:
+            self._first_unequal_lines[column] = line + 1
+
+    def add_identical_rows(self, field_count: int, rows: int = 1,
+                           columns: Optional[Sequence[int]] = None) -> None:
+        """
+        Record identical lines without adding each of their fields.
+
+        :param field_count: the number of fields in each line
+        :param rows: the number of lines
+        :param columns: the indices of the columns to record, in
+               ascending order, if not all of the lines' columns
+        """
+        if columns is not None:
+            if columns and columns[-1] >= self.column_count:
+                self._add_columns(columns[-1] + 1)
+            offset = EqualityLevel.IDENTICAL.value - 1
+            for column in columns:
+                self._counts[column * self._LEVELS + offset] += rows
+            return
+        self._identical_rows[field_count] = \
+            self._identical_rows.get(field_count, 0) + rows
+        if field_count > self.column_count:
+            self._add_columns(field_count)
+
+    def merge(self, other: "ColumnStatistics") -> None:
+        """
+        Add the statistics from another instance to this one. The lines
+        recorded in the other instance are assumed to have the same
+        numbering as those in this one.
+
+        :param other: another ColumnStatistics instance
+        """
+        if other.column_count > self.column_count:
+            self._add_columns(other.column_count)
+        for i in range(len(other._counts)):
+            self._counts[i] += other._counts[i]
+        for column in range(other.column_count):
+            self._max_relative_differences[column] = max(
+                self._max_relative_differences[column],
+                other._max_relative_differences[column])
+            line = other._first_unequal_lines[column]
+            if line != 0 and (self._first_unequal_lines[column] == 0 or
+                              line < self._first_unequal_lines[column]):
+                self._first_unequal_lines[column] = line
+        for field_count, rows in other._identical_rows.items():
+            self.add_identical_rows(field_count, rows)
+
+    def count(self, column: int, level: EqualityLevel) -> int:
+        """
+        :param column: the index of a column
+        :param level: an equality level
+        :return: the number of field pairs in the column with that level
+        """
+        total = self._counts[column * self._LEVELS + level.value - 1]
+        if level == EqualityLevel.IDENTICAL:
+            total += sum(rows for field_count, rows
+                         in self._identical_rows.items()
+                         if field_count > column)
+        return total
+
+    def max_relative_difference(self, column: int) -> float:
+        """
+        :param column: the index of a column
+        :return: the largest relative difference between numeric values
+                 in the column, which is 0 if there were none
+        """
+        return self._max_relative_differences[column]
+
+    def first_unequal_line(self, column: int) -> Optional[int]:
+        """
+        :param column: the index of a column
+        :return: the number (counting from 1) of the first line on which
+                 the column had an unequal field pair, or None if none did
+        """
+        line = self._first_unequal_lines[column]
+        return None if line == 0 else line
+
+    def _add_columns(self, column_count: int) -> None:
+        added = column_count - self.column_count
+        self._counts.extend([0] * (added * self._LEVELS))
+        self._max_relative_differences.extend([0.0] * added)
+        self._first_unequal_lines.extend([0] * added)
+        self.column_count = column_count
+
+
+def column_indices(header: Sequence[str],
+                   columns: Sequence[Union[int, str]]) -> List[int]:
+    """
+    Find the indices of columns given by index or by name.
+
+    :param header: the fields of a file's header row
+    :param columns: column indices (counting from 0) and names from the
+           header row
+    :return: the indices of the columns
+    :raises ValueError: if a name doesn't occur in the header row
+    """
+    indices = []
+    for column in columns:
+        if isinstance(column, str):
+            if column not in header:
+                raise ValueError("No column named \"{}\"".format(column))
+            column = list(header).index(column)
+        indices.append(column)
+    return indices
+
 
 class DecimalComparer:
     """
@@ -132,7 +569,12 @@ class DecimalComparer:
     stored in the instance attribute ``totals``.
     """
 
-    def __init__(self, separator: str = ",", closeness_threshold: float = 0.01):
+    def __init__(self, separator: str = ",", closeness_threshold: float = 0.01,
+                 cache_size: Optional[int] = 65536, per_column: bool = False,
+                 fail_fast: bool = False, profile: bool = False,
+                 columns: Optional[Sequence[int]] = None,
+                 exclude_columns: Optional[Sequence[int]] = None,
+                 report: Optional["DifferenceReport"] = None):
         """
         Create a new comparer.
 
@@ -142,6 +584,25 @@ class DecimalComparer:
                as close if they have the same sign and
                max(abs(a), abs(b)) <= (1 + closeness_threshold) *
                min(abs(a), abs(b)).
+        :param cache_size: the maximum number of distinct strings whose
+               parsed values are cached; 0 disables the cache, and None
+               makes it unbounded
+        :param per_column: whether to record statistics for each column
+               in ``column_statistics``
+        :param fail_fast: whether to stop comparing at the first unequal
+               field or at the end of the shorter of two streams. This is
+               much faster for finding out whether two files differ, but
+               ``totals`` then only reflect the part of the input that
+               was read.
+        :param profile: whether to record timings and counts of the
+               stages of comparison in ``profile``. This slows down
+               comparison somewhat, and has no cost when disabled.
+        :param columns: the indices (counting from 0) of the only columns
+               to compare, or None to compare all columns; see
+               ``column_indices`` for selecting columns by name
+        :param exclude_columns: the indices of columns not to compare
+        :param report: a comparedecimal.report.DifferenceReport to which
+               each field pair which isn't identical is added, or None
         """
         self.separator = separator  # type: str
         """the field separator to use when comparing lines"""
@@ -149,6 +610,40 @@ class DecimalComparer:
         """an accumulator to count comparison results for each equality level"""
         self.closeness_threshold = closeness_threshold  # type: float
         """the fractional threshold at which values are regarded as close"""
+        self.column_statistics = \
+            ColumnStatistics() if per_column else None
+        """per-column statistics, or None if they're not being recorded"""
+        self.report = report
+        """a DifferenceReport receiving differing fields, or None"""
+        self.fail_fast = fail_fast  # type: bool
+        """whether to stop comparing at the first difference"""
+        self.columns = None if columns is None else sorted(set(columns))
+        """the indices of the columns to compare, or None for all"""
+        self.exclude_columns = None if exclude_columns is None else \
+            sorted(set(exclude_columns))
+        """the indices of the columns not to compare, or None"""
+        # The indices of the compared columns of records with a given
+        # number of fields, or None if all columns are compared.
+        self._projections = None if columns is None and \
+            exclude_columns is None else {}  # type: Optional[Dict]
+        self._parse_literal = functools.lru_cache(maxsize=cache_size)(
+            DecimalComparer._parse_literal_uncached)
+        self.profile = None
+        """a comparedecimal.profiling.Profile, or None if not profiling"""
+        if profile:
+            from .profiling import Profile
+            self.profile = Profile()
+            self.profile.instrument(self)
+
+    def cache_info(self):
+        """
+        Report statistics for the cache of parsed strings.
+
+        :return: a named tuple with the fields ``hits``, ``misses``,
+           ``maxsize``, and ``currsize``, as returned by the ``cache_info``
+           method of a ``functools.lru_cache`` function
+        """
+        return self._parse_literal.cache_info()
 
     def compare_strings(self, decimal0: str, decimal1: str) -> EqualityLevel:
         """
@@ -169,14 +664,13 @@ class DecimalComparer:
         if string0 == string1:
             return EqualityLevel.IDENTICAL
 
-        try:
-            floats = [float(s) for s in (string0, string1)]
-            sig_figs =\
-                [DecimalComparer._sig_figs(s) for s in (string0, string1)]
-        except ValueError:
+        literals = [self._parse_literal(s) for s in (string0, string1)]
+        if literals[0] is None or literals[1] is None:
             # If the strings are unequal and one or both can't be parsed
             # as floats, then they're clearly numerically unequal.
             return EqualityLevel.UNEQUAL
+        floats = [literal.value for literal in literals]
+        sig_figs = [literal.sig_figs for literal in literals]
 
         if floats[0] == floats[1]:
             # This catches the case where we're comparing -0 with 0,
@@ -195,11 +689,13 @@ class DecimalComparer:
         if positives[0] >= positives[1] * 10 or \
            positives[1] >= positives[0] * 10:
             return EqualityLevel.UNEQUAL
+        if math.isnan(floats[0]) or math.isnan(floats[1]):
+            # NaN has no order of magnitude or digits, and equals nothing.
+            return EqualityLevel.UNEQUAL
         # We've now established that they have the same order of magnitude.
         # Next step is to compare the digits.
 
-        digits = [DecimalComparer._extract_mantissa_digits(s)
-                  for s in (string0, string1)]
+        digits = [literal.digits for literal in literals]
         digits_padded = \
             [digits[i] + ("0" * (max(sig_figs) - sig_figs[i])) for i in (0, 1)]
         max_diff = 10**(max(sig_figs) - min(sig_figs)) // 2
@@ -225,7 +721,30 @@ class DecimalComparer:
         else:
             return self._unequal_or_close(positives[0], positives[1])
 
-    def compare_string_lists(self, fields0: List[str], fields1: List[str]) ->\
+    def compare_columns(self, column0: Sequence[str],
+                        column1: Sequence[str]):
+        """
+        Compare two equal-length columns of strings element by element,
+        using NumPy array operations rather than comparing each pair
+        in turn. The result for each pair is the same as that of
+        ``compare_strings``, and this object's ``totals`` attribute will be
+        updated with the results of the comparisons.
+
+        This method requires NumPy to be installed.
+
+        :param column0: a sequence of strings
+        :param column1: another sequence of strings
+        :return: a NumPy int8 array containing the ``EqualityLevel``
+           value of each pair of strings
+        """
+        from .vectorized import classify_columns, count_levels
+        levels = classify_columns(self, column0, column1)
+        for level, count in count_levels(levels).items():
+            self.totals[level] += count
+        return levels
+
+    def compare_string_lists(self, fields0: List[str], fields1: List[str],
+                             line: Optional[int] = None) ->\
             Optional[FieldDifference]:
         """
         Compare two lists of strings. If they're equal, return None. If not,
@@ -239,6 +758,8 @@ class DecimalComparer:
 
         :param fields0: a list of strings
         :param fields1: another list of strings
+        :param line: the index of the line containing the strings, which
+               is recorded in ``column_statistics`` if it's not None
         :return: None if lists equal, otherwise a FieldDifference object
         """
 
@@ -247,14 +768,47 @@ class DecimalComparer:
                                    string0="{}".format(len(fields0)),
                                    string1="{}".format(len(fields1)))
 
+        if self._projections is None:
+            return self._compare_fields(range(len(fields0)), fields0, fields1,
+                                        line)
+        columns = self._project(len(fields0))
+        return self._compare_fields(columns,
+                                    [fields0[i] for i in columns],
+                                    [fields1[i] for i in columns], line)
+
+    def _compare_fields(self, columns: Iterable[int], fields0: List[str],
+                        fields1: List[str], line: Optional[int]) ->\
+            Optional[FieldDifference]:
+        """
+        Compare the fields of two records in the given columns.
+
+        :param columns: the indices of the columns compared
+        :param fields0: the fields of a record in those columns
+        :param fields1: the fields of another record in those columns
+        :param line: as for compare_string_lists
+        :return: as for compare_string_lists
+        """
+        statistics = self.column_statistics
+        report = self.report
         first_difference = None
-        for i in range(len(fields0)):
-            level = self.compare_strings(fields0[i], fields1[i])
+        for i, field0, field1 in zip(columns, fields0, fields1):
+            level = self.compare_strings(field0, field1)
+            if statistics is not None or report is not None:
+                relative_difference = None \
+                    if level == EqualityLevel.IDENTICAL else \
+                    self._relative_difference(field0, field1)
+                if statistics is not None:
+                    statistics.add(i, level, relative_difference, line)
+                if report is not None and level != EqualityLevel.IDENTICAL:
+                    report.add(line, i, field0, field1, level,
+                               relative_difference)
             if level == EqualityLevel.UNEQUAL and \
                     first_difference is None:
                 first_difference = FieldDifference(
-                    field_index=i, string0=fields0[i], string1=fields1[i]
+                    field_index=i, string0=field0, string1=field1
                 )
+                if self.fail_fast:
+                    break
 
         return first_difference
 
@@ -277,31 +831,273 @@ class DecimalComparer:
             return "Unequal numbers of lines ({}, {})".\
                 format(len(lines0), len(lines1))
 
-        fields = []
-        for line_list in lines0, lines1:
-            fields_list = []
-            fields.append(fields_list)
-            reader = csv.reader(line_list,
-                                delimiter=self.separator,
-                                skipinitialspace=True)
-            for row in reader:
-                fields_list.append(row)
+        return self.compare_streams(lines0, lines1)
+
+    def compare_streams(self, lines0: Iterable[str], lines1: Iterable[str]) ->\
+            Optional[str]:
+        """
+        Compare two streams of lines, each containing multiple fields.
+        The streams are read in lockstep, one record at a time, so memory
+        use is independent of their length: any iterable of lines, such
+        as an open file, may be passed.
+        This object's ``separator`` object will be used as the separator
+        when splitting a line into fields.
+        This object's ``totals`` attribute will be updated
+        with the results of the comparisons as the streams are read.
+
+        Unlike ``compare_line_lists``, this method cannot know the number
+        of lines in advance, so when the line counts differ the records
+        before the end of the shorter stream will already have been
+        compared and counted in ``totals``.
+
+        :param lines0: an iterable of lines
+        :param lines1: another iterable of lines
+        :return: a string describing the first difference, or ``None``
+           if the streams are equal
+        """
 
+        first_difference, line_counts = self._compare_lines(lines0, lines1)
+        if line_counts[0] != line_counts[1] and \
+                not (self.fail_fast and first_difference is not None):
+            return self._describe_line_counts(line_counts)
+
+        return None if first_difference is None else \
+            self._describe_difference(*first_difference)
+
+    def _reader(self, lines: Iterable[str]):
+        return csv.reader(lines, delimiter=self.separator,
+                          skipinitialspace=True)
+
+    def _compare_lines(self, lines0: Iterable[str], lines1: Iterable[str],
+                       first_line: int = 0) ->\
+            Tuple[Optional[Tuple[int, FieldDifference]], List[int]]:
+        """
+        Compare two iterables of lines record by record until either
+        is exhausted, then count the lines remaining in the other.
+
+        Pairs of identical lines which are complete records are counted
+        as identical fields without being split; all other records are
+        parsed with a CSV reader and compared with compare_string_lists.
+        If only some columns are compared, records on a single line
+        without quotation marks are split only as far as the last
+        compared column, and the other fields are never extracted.
+
+        In fail-fast mode, this returns as soon as a difference is found,
+        and doesn't count the lines remaining in the longer iterable.
+
+        :return: a tuple of the index and FieldDifference of the first
+                 differing record (or None), and a list of the numbers of
+                 lines in the two iterables
+        """
+        iterators = [iter(lines0), iter(lines1)]
+        line_counts = [0, 0]
         first_difference = None
-        for line in range(len(fields[0])):
-            result = self.compare_string_lists(fields[0][line], fields[1][line])
-            if result is not None and first_difference is None:
-                if result.field_index == -1:
-                    first_difference = \
-                        "Differing numbers of fields on line {}". \
-                        format(line+1)
-                else:
-                    first_difference = \
-                        "On line {}: field {} differs ({}, {})". \
-                        format(line + 1, result.field_index + 1,
-                               result.string0, result.string1)
+        line = first_line
+        while True:
+            first_lines = [next(iterator, None) for iterator in iterators]
+            if first_lines[0] is None or first_lines[1] is None:
+                break
 
-        return first_difference
+            field_count = None
+            if first_lines[0] == first_lines[1]:
+                field_count = self._count_fields(first_lines[0])
+            if field_count is not None:
+                self._add_identical_rows(field_count)
+                line_counts[0] += 1
+                line_counts[1] += 1
+            elif self._projections is not None:
+                result = self._compare_projected(first_lines, iterators,
+                                                 line_counts, line)
+                if result is not None and first_difference is None:
+                    first_difference = line, result
+                    if self.fail_fast:
+                        return first_difference, line_counts
+            else:
+                rows = []
+                for i in (0, 1):
+                    # The reader only takes more lines from the iterator
+                    # if the record continues past its first line.
+                    reader = self._reader(
+                        itertools.chain([first_lines[i]], iterators[i]))
+                    rows.append(next(reader))
+                    line_counts[i] += reader.line_num
+                result = self.compare_string_lists(rows[0], rows[1], line)
+                if result is not None and first_difference is None:
+                    first_difference = line, result
+                    if self.fail_fast:
+                        return first_difference, line_counts
+            line += 1
+
+        for i in (0, 1):
+            if first_lines[i] is not None:
+                line_counts[i] += 1
+                if not self.fail_fast:
+                    line_counts[i] += sum(1 for _ in iterators[i])
+        return first_difference, line_counts
+
+    def _compare_projected(self, first_lines: List[str],
+                           iterators: List[Iterator[str]],
+                           line_counts: List[int], line: int) ->\
+            Optional[FieldDifference]:
+        """
+        Read a record from each of two iterators and compare the fields
+        in the compared columns.
+
+        :param first_lines: the first line of each record
+        :param iterators: the iterators from which any further lines of
+               the records are read
+        :param line_counts: the numbers of lines read from the iterators,
+               which are updated
+        :param line: the index of the records
+        :return: as for compare_string_lists
+        """
+        records = []
+        for i in (0, 1):
+            record = self._split_projected(first_lines[i])
+            if record is None:
+                reader = self._reader(
+                    itertools.chain([first_lines[i]], iterators[i]))
+                row = next(reader)
+                line_counts[i] += reader.line_num
+                record = len(row), \
+                    [row[column] for column in self._project(len(row))]
+            else:
+                line_counts[i] += 1
+            records.append(record)
+        (field_count0, fields0), (field_count1, fields1) = records
+        if field_count0 != field_count1:
+            return FieldDifference(field_index=-1,
+                                   string0="{}".format(field_count0),
+                                   string1="{}".format(field_count1))
+        return self._compare_fields(self._project(field_count0),
+                                    fields0, fields1, line)
+
+    def _split_projected(self, line: str) ->\
+            Optional[Tuple[int, List[str]]]:
+        """
+        Split a line into the fields in the compared columns, without
+        extracting the fields after the last compared column.
+
+        :param line: a line, with or without its terminator
+        :return: the number of fields in the line and a list of the fields
+                 in the compared columns, or None if the line must be
+                 parsed by the CSV reader
+        """
+        # The same conditions as in _count_fields
+        if "\"" in line or self.separator == " ":
+            return None
+        if line.endswith("\n"):
+            line = line[:-1]
+        if line.endswith("\r"):
+            line = line[:-1]
+        if "\r" in line or "\n" in line:
+            return None
+        if line == "":
+            return 0, []
+        field_count = line.count(self.separator) + 1
+        columns = self._project(field_count)
+        if not columns:
+            return field_count, []
+        fields = line.split(self.separator, columns[-1] + 1)
+        # The reader skips spaces at the start of each field.
+        return field_count, [fields[column].lstrip(" ")
+                             for column in columns]
+
+    def _project(self, field_count: int) -> Sequence[int]:
+        """
+        :param field_count: the number of fields in a record
+        :return: the indices of the record's fields which are compared,
+                 in ascending order
+        """
+        columns = self._projections.get(field_count)
+        if columns is None:
+            columns = range(field_count) if self.columns is None else \
+                [column for column in self.columns if column < field_count]
+            if self.exclude_columns is not None:
+                excluded = set(self.exclude_columns)
+                columns = [column for column in columns
+                           if column not in excluded]
+            columns = self._projections[field_count] = list(columns)
+        return columns
+
+    def _add_identical_rows(self, field_count: int, rows: int = 1) -> None:
+        """
+        Count the compared fields of identical records in ``totals``
+        and ``column_statistics``.
+
+        :param field_count: the number of fields in each record
+        :param rows: the number of records
+        """
+        if self._projections is None:
+            self.totals[EqualityLevel.IDENTICAL] += field_count * rows
+            if self.column_statistics is not None:
+                self.column_statistics.add_identical_rows(field_count, rows)
+            return
+        columns = self._project(field_count)
+        self.totals[EqualityLevel.IDENTICAL] += len(columns) * rows
+        if self.column_statistics is not None:
+            self.column_statistics.add_identical_rows(field_count, rows,
+                                                      columns)
+
+    def _count_fields(self, line: str) -> Optional[int]:
+        """
+        Count the fields which the CSV reader would produce from a line.
+
+        Lines without quotation marks are counted by counting separators
+        (runs of spaces after a separator are skipped by the reader, so
+        they never add fields unless the separator is itself a space).
+        Lines with quotation marks are counted by the reader itself.
+
+        :param line: a line, with or without its terminator
+        :return: the number of fields, or None if the line is not a
+                 complete record or if the number can't be determined
+        """
+        if "\"" not in line and self.separator != " ":
+            if line.endswith("\n"):
+                line = line[:-1]
+            if line.endswith("\r"):
+                line = line[:-1]
+            if "\r" in line or "\n" in line:
+                # The reader would reject this, so let it.
+                return None
+            return 0 if line == "" else line.count(self.separator) + 1
+
+        # If the reader asks for the empty second line, the record
+        # continues beyond the end of this one.
+        reader = self._reader([line, ""])
+        try:
+            fields = next(reader)
+        except csv.Error:
+            return None
+        return len(fields) if reader.line_num == 1 else None
+
+    def _describe_line_counts(self, line_counts: List[int]) -> str:
+        counts = [str(count) for count in line_counts]
+        if self.fail_fast:
+            # The longer input wasn't read to the end.
+            longer = 0 if line_counts[0] > line_counts[1] else 1
+            counts[longer] = "at least " + counts[longer]
+        return "Unequal numbers of lines ({}, {})".format(*counts)
+
+    @staticmethod
+    def _describe_difference(line: int, result: FieldDifference) -> str:
+        if result.field_index == -1:
+            return "Differing numbers of fields on line {}".format(line + 1)
+        else:
+            return "On line {}: field {} differs ({}, {})".\
+                format(line + 1, result.field_index + 1,
+                       result.string0, result.string1)
+
+    def _relative_difference(self, string0: str, string1: str) ->\
+            Optional[float]:
+        literals = [self._parse_literal(s) for s in (string0, string1)]
+        if literals[0] is None or literals[1] is None:
+            return None
+        a, b = literals[0].value, literals[1].value
+        if a == b:
+            return 0.0
+        smaller = min(abs(a), abs(b))
+        return abs(a - b) / smaller if smaller != 0 else math.inf
 
     def _unequal_or_close(self, a: float, b: float) -> EqualityLevel:
         if max(a, b) <= min(a, b) * (1 + self.closeness_threshold):
@@ -309,10 +1105,19 @@ class DecimalComparer:
         else:
             return EqualityLevel.UNEQUAL
 
+    @staticmethod
+    def _parse_literal_uncached(literal: str) -> Optional[ParsedLiteral]:
+        try:
+            value = float(literal)
+        except ValueError:
+            return None
+        digits = DecimalComparer._extract_mantissa_digits(literal)
+        return ParsedLiteral(value=value, digits=digits,
+                             sig_figs=-1 if digits is None else len(digits))
+
     @staticmethod
     def _extract_mantissa_digits(literal: str) -> Optional[str]:
-        match = re.match(r"^[-+]?([0-9]*)\.?([0-9]+)([eE][-+]?[0-9]+)?$",
-                         literal)
+        match = _MANTISSA_PATTERN.match(literal)
         if match is None:
             return None
         return (match.group(1) + match.group(2)).lstrip("0")
@@ -324,4 +1129,12 @@ class DecimalComparer:
 
 
 if __name__ == "__main__":
-    main()
+    # Run main in the package's copy of this module rather than in this
+    # one, so that main and the modules it imports share one copy of its
+    # classes (such as EqualityLevel). When this file is run as a script,
+    # the package's parent directory has to be put on the path first.
+    if not __package__:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+    import comparedecimal.comparedecimal
+    comparedecimal.comparedecimal.main()
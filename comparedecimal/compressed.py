@@ -0,0 +1,211 @@
+"""
+Reading of compressed delimited files.
+
+This module is part of comparedecimal. The function open_lines opens a
+file which may be compressed with gzip, bzip2, xz, or Zstandard, detecting
+the format from its first bytes, and returns it as a text file.
+Compressed files are decompressed by a background thread which reads
+ahead into a bounded queue of large blocks of bytes, so that decompression
+overlaps with the comparison of the lines already read (the decompressors
+release the global interpreter lock while they work). The thread only
+decompresses: the blocks are decoded and split into lines by the reading
+thread, with the C implementation of io.TextIOWrapper, so the thread adds
+no work for each line. On a machine with a single processor, the file is
+decompressed by the reading thread instead. Zstandard support requires
+the optional zstandard package.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from typing import BinaryIO, Optional, TextIO
+
+BLOCK_SIZE = 1 << 20
+"""the number of decompressed bytes in each block read ahead"""
+
+QUEUE_BLOCKS = 8
+"""the number of blocks of lines which may be read ahead"""
+
+_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bzip2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """
+    Detect the compression format of a file from its first bytes.
+
+    :param path: the path of a file
+    :return: "gzip", "bzip2", "xz", or "zstd", or None if the file
+             is not compressed in any of these formats
+    """
+    with open(path, "rb") as fh:
+        start = fh.read(6)
+    for magic, compression in _MAGIC:
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_lines(path: str, block_size: int = BLOCK_SIZE,
+               queue_blocks: int = QUEUE_BLOCKS,
+               read_ahead: Optional[bool] = None) -> TextIO:
+    """
+    Open a possibly compressed file for reading as lines of text.
+
+    Uncompressed files are opened as usual. Compressed files are
+    decompressed as they are read, by a background thread if read_ahead
+    is true; the returned file should then be closed (or used as a
+    context manager) so that the thread stops if the lines are not read
+    to the end. The text is decoded as it would be by ``open(path)``.
+
+    :param path: the path of a file
+    :param block_size: the number of decompressed bytes in each block read
+           ahead
+    :param queue_blocks: the number of blocks which may be read ahead
+    :param read_ahead: whether to decompress in a background thread; by
+           default, only if there is more than one processor, since the
+           thread can only gain time by running on another one
+    :return: a text file
+    :raises ValueError: if the file is compressed with Zstandard and the
+            zstandard package isn't installed
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path)
+    stream = _open_binary(path, compression)
+    if read_ahead is None:
+        read_ahead = _processor_count() > 1
+    if read_ahead:
+        stream = ReadAheadStream(stream, block_size, queue_blocks)
+    # Decompressing in large blocks, rather than in the small ones which
+    # io.TextIOWrapper asks for, is faster even without a thread:
+    # decompressing two files in lockstep in small blocks evicts each
+    # decompressor's state from the processor caches.
+    text = io.TextIOWrapper(io.BufferedReader(stream, block_size))
+    text._CHUNK_SIZE = block_size  # the size of its reads from the stream
+    return text
+
+
+def _processor_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        return os.cpu_count() or 1
+
+
+def _open_binary(path: str, compression: str) -> BinaryIO:
+    if compression == "gzip":
+        return gzip.open(path)
+    if compression == "bzip2":
+        return bz2.open(path)
+    if compression == "xz":
+        return lzma.open(path)
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("{} is compressed with Zstandard, which requires "
+                         "the zstandard package".format(path))
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"),
+                                                      closefd=True)
+
+
+class ReadAheadStream(io.RawIOBase):
+    """
+    A raw binary stream whose data is read ahead in blocks by a background
+    thread from another binary stream.
+
+    Only the reading of the underlying stream (the decompression, for a
+    compressed file) is done by the thread, and only whole blocks are
+    passed between the threads. Decoding the data and splitting it into
+    lines is left to the reader, which can wrap this stream in an
+    io.BufferedReader and an io.TextIOWrapper.
+
+    Errors raised while reading (e.g. for corrupt compressed data) are
+    raised again by readinto when it reaches the point where they
+    occurred.
+    """
+
+    _END = object()
+
+    def __init__(self, stream: BinaryIO, block_size: int = BLOCK_SIZE,
+                 queue_blocks: int = QUEUE_BLOCKS):
+        super().__init__()
+        self._stream = stream
+        self._block_size = block_size
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._stopped = threading.Event()
+        self._block = memoryview(b"")
+        self._finished = False
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                block = self._stream.read(self._block_size)
+                if not block:
+                    break
+                self._put(block)
+            self._put(ReadAheadStream._END)
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item) -> None:
+        # Time out periodically to notice if the reader has been closed.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._block:
+            if self._finished:
+                return 0
+            block = self._queue.get()
+            if block is ReadAheadStream._END:
+                self._finished = True
+                return 0
+            if isinstance(block, Exception):
+                self._finished = True
+                raise block
+            self._block = memoryview(block)
+        count = min(len(buffer), len(self._block))
+        buffer[:count] = self._block[:count]
+        self._block = self._block[count:]
+        return count
+
+    def close(self) -> None:
+        """Stop the background thread and close the stream."""
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
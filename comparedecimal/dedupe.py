@@ -0,0 +1,341 @@
+"""
+Finding groups of duplicates among many delimited files.
+
+This module is part of comparedecimal, and provides the command-line tool
+comparecsv-dedupe. Rather than comparing every pair of files, it first
+computes a cheap fingerprint of each file, which is designed to match
+for any two files which DecimalComparer would find to contain the same
+values, even when one has lower precision than the other, and
+DecimalComparer is only run on files with matching fingerprints.
+
+A fingerprint consists of
+
+- the number of lines and the number of fields on each line,
+- the non-numeric fields in the first rows, which must be identical in
+  files with the same values, and
+- a description of the sampled numeric fields in the first rows (one on
+  each row, cycling through the columns): the sign of each finite value
+  and the range of magnitudes which its digits could represent (e.g.
+  0.95 to 1.05 for "1.0").
+
+Files are first grouped into buckets by the exact parts of their
+fingerprints. A bucket is then split by the first sampled values, each
+file being placed in every cell of a logarithmic grid which the range of
+its value, widened by the closeness threshold, overlaps; each part is
+split by the second sampled values, and so on, until the parts are
+small. The values of two files with the same values are compatible or
+close, so their ranges overlap, and the files always end up in a common
+part. Only files in a common part are compared.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import csv
+import fnmatch
+import decimal
+import hashlib
+import math
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .comparedecimal import DecimalComparer
+from .mapped import compare_mapped
+
+SAMPLE_ROWS = 100
+"""the number of rows whose fields are sampled for a fingerprint"""
+
+PART_SIZE = 8
+"""the number of files in a bucket below which it isn't split further"""
+
+Fingerprint = namedtuple("Fingerprint", "shape text values")
+"""
+A fingerprint of a delimited file: a digest of its line count and the
+field count of each line, a digest of the non-numeric fields in its first
+rows, and a tuple describing a sampled field on each of its first rows
+(see describe_value), with None for a non-numeric field.
+"""
+
+
+def main():
+    """
+    Find groups of duplicate files in the directories given on the
+    command line, and write them to the standard output.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        description="Find groups of delimited files containing "
+                    "the same numbers",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-d", "--delimiter", type=str, required=False,
+                        help="delimiter between fields", default=",")
+    parser.add_argument("-t", "--threshold", type=float, required=False,
+                        help="threshold for considering values \"close\", "
+                             "as a decimal fraction of the smaller value",
+                        default=0.01)
+    parser.add_argument("-p", "--pattern", type=str, required=False,
+                        help="glob pattern for the names of files to check",
+                        default="*.csv")
+    parser.add_argument("-j", "--jobs", type=int, required=False,
+                        help="number of worker processes to use for "
+                             "fingerprinting", default=1)
+    parser.add_argument("DIR", type=str, nargs="+")
+    args = parser.parse_args()
+
+    separator = bytes(args.delimiter, "utf-8").decode("unicode_escape")
+    paths = list(find_files(args.DIR, args.pattern))
+    groups = find_duplicates(paths, separator, args.threshold, args.jobs)
+
+    for number, group in enumerate(groups, 1):
+        print("Group {} ({} files):".format(number, len(group)))
+        for path in group:
+            print("  " + path)
+    print("{} files checked, {} groups of duplicates found.".
+          format(len(paths), len(groups)))
+
+
+def find_files(directories: Iterable[str], pattern: str) -> Iterable[str]:
+    """
+    Find files within directories, recursively.
+
+    :param directories: the directories to search
+    :param pattern: a glob pattern which the file names must match
+    :return: an iterable of paths, sorted within each directory
+    """
+    for directory in directories:
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(fnmatch.filter(filenames, pattern)):
+                yield os.path.join(root, filename)
+
+
+def find_duplicates(paths: List[str], separator: str = ",",
+                    closeness_threshold: float = 0.01,
+                    jobs: int = 1) -> List[List[str]]:
+    """
+    Find groups of files containing the same values.
+
+    Two files are regarded as duplicates if comparing them with a
+    DecimalComparer finds no differences, i.e. every pair of fields has
+    an equality level other than UNEQUAL. Since this relation isn't
+    transitive, a group is a set of files connected by such pairs.
+    Files which can't be read or decoded are reported on the standard
+    error stream and skipped.
+
+    :param paths: the paths of the files to check
+    :param separator: the field separator
+    :param closeness_threshold: the threshold for values to be regarded
+           as close, as for DecimalComparer
+    :param jobs: the number of worker processes used to compute
+           fingerprints
+    :return: a list of groups of two or more paths, each in the order in
+             which they were given
+    """
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            fingerprints = list(executor.map(
+                _fingerprint_or_none, paths,
+                [separator] * len(paths), chunksize=16))
+    else:
+        fingerprints = [_fingerprint_or_none(path, separator)
+                        for path in paths]
+
+    buckets = {}  # type: Dict[tuple, List[int]]
+    for index, fingerprint in enumerate(fingerprints):
+        if fingerprint is not None:
+            buckets.setdefault((fingerprint.shape, fingerprint.text),
+                               []).append(index)
+
+    parents = list(range(len(paths)))
+
+    def find_root(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    compared = set()
+    for members in buckets.values():
+        for part in _split(members, fingerprints, 0, closeness_threshold,
+                           set()):
+            # Every pair which isn't already connected is compared, so
+            # that a file matching any member of a group joins it.
+            for i, index0 in enumerate(part):
+                for index1 in part[i + 1:]:
+                    if find_root(index0) == find_root(index1) or \
+                            (index0, index1) in compared:
+                        continue
+                    compared.add((index0, index1))
+                    if _files_match(paths[index0], paths[index1],
+                                    separator, closeness_threshold):
+                        parents[find_root(index1)] = find_root(index0)
+
+    groups = {}  # type: Dict[int, List[str]]
+    for index, path in enumerate(paths):
+        groups.setdefault(find_root(index), []).append(path)
+    return [group for root, group in sorted(groups.items())
+            if len(group) > 1]
+
+
+def fingerprint(path: str, separator: str = ",",
+                sample_rows: int = SAMPLE_ROWS) -> Fingerprint:
+    """
+    Compute the fingerprint of a delimited file.
+
+    :param path: the path of the file
+    :param separator: the field separator
+    :param sample_rows: the number of rows whose fields are included in
+           the fingerprint
+    :return: the file's fingerprint
+    """
+    shape = hashlib.sha1()
+    text = hashlib.sha1()
+    values = []
+    with open(path) as fh:
+        reader = DecimalComparer(separator=separator)._reader(fh)
+        for row_index, row in enumerate(reader):
+            shape.update(b"%d," % len(row))
+            if row_index >= sample_rows:
+                continue
+            numeric = []
+            for column, field in enumerate(row):
+                try:
+                    float(field)
+                    numeric.append(True)
+                except ValueError:
+                    numeric.append(False)
+                    text.update(repr((row_index, column, field)).encode())
+            if row:
+                column = row_index % len(row)
+                values.append(describe_value(row[column])
+                              if numeric[column] else None)
+        shape.update(b"lines:%d" % reader.line_num)
+    return Fingerprint(shape=shape.hexdigest(), text=text.hexdigest(),
+                       values=tuple(values))
+
+
+def describe_value(field: str) -> tuple:
+    """
+    :param field: a string which can be parsed as a float
+    :return: for a finite non-zero value, a tuple of "finite", the sign,
+             and the base-10 logarithms of the smallest and largest
+             magnitudes which the string could be a rounded
+             representation of; for NaN, which only matches an identical
+             string, a tuple of "nan" and the string; otherwise, a tuple
+             which is the same for all values of one kind (zero, or each
+             infinity)
+    """
+    value = float(field)
+    if math.isnan(value):
+        return ("nan", field)
+    if value == 0:
+        # Zero is never compatible with a non-zero value.
+        return ("zero",)
+    if math.isinf(value):
+        return ("inf", value > 0)
+    try:
+        exponent = decimal.Decimal(field.strip()).as_tuple().exponent
+        half_unit = 0.5 * 10.0 ** exponent
+    except (decimal.InvalidOperation, OverflowError):
+        # Allow for the widest range, that of a single digit.
+        half_unit = abs(value) / 3
+    low = max(abs(value) - half_unit, abs(value) / 1.5)
+    return ("finite", value > 0, math.log10(low),
+            math.log10(abs(value) + half_unit))
+
+
+def value_cells(description: Optional[tuple],
+                closeness_threshold: float = 0.01) -> List[tuple]:
+    """
+    Find the cells in which a sampled value places a file. Two values
+    which are compatible or close always share at least one cell.
+
+    :param description: a value as described by describe_value, or None
+    :param closeness_threshold: the threshold for values to be regarded
+           as close, as for DecimalComparer
+    :return: a list of hashable cells
+    """
+    if description is None or description[0] != "finite":
+        # Strings, NaNs, zeros, and infinities only match values with the
+        # same description.
+        return [description]
+    # Two close values are within this distance of each other, and the
+    # ranges of two compatible values overlap, so the widened ranges of
+    # two values which are either overlap, and share a cell. The margin
+    # allows for rounding in the logarithms.
+    tolerance = math.log10(1 + closeness_threshold) + 1e-9
+    cell_width = max(2 * tolerance, 0.001)
+    _, sign, log_low, log_high = description
+    return [(sign, cell) for cell in range(
+        math.floor((log_low - tolerance) / cell_width),
+        math.floor((log_high + tolerance) / cell_width) + 1)]
+
+
+def _split(members: List[int], fingerprints: List[Fingerprint],
+           position: int, closeness_threshold: float,
+           seen: set) -> Iterator[List[int]]:
+    """
+    Split a bucket of files into parts by their sampled values.
+
+    :param members: the indices of the files in the bucket, which have
+           the same shape, and so the same number of sampled values
+    :param fingerprints: the fingerprints of all the files
+    :param position: the index of the sampled value to split by
+    :param closeness_threshold: as for value_cells
+    :param seen: the parts already split at each position, to avoid
+           splitting identical parts repeatedly when files are placed in
+           two cells
+    :return: an iterator over parts, such that any two files whose
+             sampled values are all compatible or close share a part
+    """
+    values = fingerprints[members[0]].values
+    if len(members) <= PART_SIZE or position >= len(values):
+        yield members
+        return
+    cells = {}  # type: Dict[tuple, List[int]]
+    for index in members:
+        for cell in value_cells(fingerprints[index].values[position],
+                                closeness_threshold):
+            cells.setdefault(cell, []).append(index)
+    for part in cells.values():
+        key = position, tuple(part)
+        if len(part) > 1 and key not in seen:
+            seen.add(key)
+            yield from _split(part, fingerprints, position + 1,
+                              closeness_threshold, seen)
+
+
+def _fingerprint_or_none(path: str, separator: str) -> Optional[Fingerprint]:
+    try:
+        return fingerprint(path, separator)
+    except (OSError, UnicodeDecodeError, csv.Error) as error:
+        print("Skipping {}: {}".format(path, error), file=sys.stderr)
+        return None
+
+
+def _files_match(path0: str, path1: str, separator: str,
+                 closeness_threshold: float) -> bool:
+    comparer = DecimalComparer(separator=separator,
+                               closeness_threshold=closeness_threshold,
+                               fail_fast=True)
+    try:
+        return compare_mapped(comparer, path0, path1) is None
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return False
@@ -0,0 +1,303 @@
+"""
+Incremental comparison of delimited files using a persistent cache.
+
+This module is part of comparedecimal. The function compare_cached
+compares two files in chunks of records, as compare_files in the parallel
+module does, and keeps two kinds of files in a cache directory:
+
+- an index for each compared file, holding its size, inode number, and
+  modification and status change times, and the byte offsets and digests
+  of its chunks; and
+- a results file for each pair of compared files, holding the totals,
+  column statistics, and first difference of each chunk pair, keyed by
+  the digests of the chunks.
+
+When a file's size, inode number, and times match its index, the file
+isn't read to find its chunks. The status change time can't be set back
+by tools which preserve modification times (e.g. cp -p or rsync -t), and
+a file replaced by renaming another over it has a new inode number, so a
+changed file is always scanned again. When a chunk pair's digests match a cached
+result, the result is reused rather than the chunks being compared again,
+so re-comparing a file with a copy in which a small region has changed
+only re-parses the chunks in that region. Since chunks hold a fixed number
+of records, rows inserted or deleted change every later chunk.
+
+Cache files which can't be read, which fail their checksum, or which were
+written with different settings are ignored and rewritten.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import locale
+import os
+import tempfile
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from .comparedecimal import ColumnStatistics, DecimalComparer, \
+    EqualityLevel, FieldDifference
+from .parallel import _compare_chunk
+
+RECORDS_PER_CHUNK = 10000
+"""the default number of records in each cached chunk"""
+
+_VERSION = 2
+
+IncrementalResult = namedtuple("IncrementalResult",
+                               "first_difference reused compared")
+"""
+The result of an incremental comparison: a string describing the first
+difference (or None), and the numbers of chunk pairs whose cached results
+were reused and which were compared.
+"""
+
+
+def compare_cached(comparer: DecimalComparer, path0: str, path1: str,
+                   cache_directory: str,
+                   records_per_chunk: int = RECORDS_PER_CHUNK,
+                   jobs: int = 1) -> IncrementalResult:
+    """
+    Compare two delimited files, reusing cached results for the chunks
+    which haven't changed since they were last compared.
+
+    The ``totals`` and ``column_statistics`` of ``comparer`` are updated,
+    and the first difference is the same as that found by
+    ``comparer.compare_streams``. In fail-fast mode, cached chunk results
+    are neither read nor updated, since they would be incomplete. If the
+    comparer has a profile, it only includes the chunks compared.
+
+    :param comparer: the comparer whose settings should be used, and
+           whose totals should be updated
+    :param path0: the path of a delimited file
+    :param path1: the path of another delimited file
+    :param cache_directory: the directory holding the cache files, which
+           is created if necessary
+    :param records_per_chunk: the number of records in each chunk
+    :param jobs: the number of worker processes to compare changed chunks
+    :return: an IncrementalResult
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    encoding = locale.getpreferredencoding(False)
+    settings = {"version": _VERSION, "separator": comparer.separator,
+                "encoding": encoding, "records_per_chunk": records_per_chunk}
+    indices = [_load_index(cache_directory, path, settings, comparer)
+               for path in (path0, path1)]
+    line_counts = [index["line_count"] for index in indices]
+    if comparer.fail_fast and line_counts[0] != line_counts[1]:
+        return IncrementalResult(comparer._describe_line_counts(line_counts),
+                                 reused=0, compared=0)
+
+    result_settings = dict(settings,
+                           threshold=comparer.closeness_threshold,
+                           per_column=comparer.column_statistics is not None,
+                           columns=comparer.columns,
+                           exclude_columns=comparer.exclude_columns)
+    results_path = _cache_path(cache_directory, "results", path0, path1)
+    cached = {} if comparer.fail_fast else \
+        _read_cache_file(results_path, result_settings).get("chunks", {})
+
+    chunk_pairs = list(zip(indices[0]["chunks"], indices[1]["chunks"]))
+    keys = ["{}:{}:{}".format(i, chunk0[2], chunk1[2])
+            for i, (chunk0, chunk1) in enumerate(chunk_pairs)]
+    arguments = [(comparer.separator, comparer.closeness_threshold,
+                  comparer.column_statistics is not None, comparer.fail_fast,
+                  comparer.profile is not None, comparer.columns,
+                  comparer.exclude_columns, encoding,
+                  path0, chunk0[0], chunk0[1], path1, chunk1[0], chunk1[1],
+                  i * records_per_chunk)
+                 for i, (chunk0, chunk1) in enumerate(chunk_pairs)]
+    results = {}
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {i: executor.submit(_compare_chunk, *arguments[i])
+                       for i in missing}
+            for i, future in futures.items():
+                results[keys[i]] = _result_to_json(comparer,
+                                                   *future.result())
+    else:
+        for i in missing:
+            results[keys[i]] = _result_to_json(comparer,
+                                               *_compare_chunk(*arguments[i]))
+            if comparer.fail_fast and results[keys[i]]["difference"]:
+                break
+
+    first_difference = None
+    for key in keys:
+        result = results.get(key) or cached.get(key)
+        if result is None:
+            # Not compared, since fail-fast mode stopped earlier
+            break
+        totals, statistics, difference = _result_from_json(result)
+        for level, count in totals.items():
+            comparer.totals[level] += count
+        if statistics is not None:
+            comparer.column_statistics.merge(statistics)
+        if first_difference is None and difference is not None:
+            first_difference = difference
+            if comparer.fail_fast:
+                break
+
+    if not comparer.fail_fast:
+        _write_cache_file(results_path, result_settings, {"chunks": {
+            key: results.get(key) or cached[key] for key in keys}})
+
+    if line_counts[0] != line_counts[1]:
+        description = comparer._describe_line_counts(line_counts)
+    else:
+        description = None if first_difference is None else \
+            comparer._describe_difference(*first_difference)
+    return IncrementalResult(description, reused=len(keys) - len(missing),
+                             compared=len(missing))
+
+
+def _load_index(cache_directory: str, path: str, settings: dict,
+                comparer: DecimalComparer) -> dict:
+    """
+    Load a file's index from the cache, or scan the file and cache a new
+    index if the cached one is missing, stale, or corrupt.
+    """
+    status = os.stat(path)
+    identity = {"size": status.st_size, "inode": status.st_ino,
+                "mtime_ns": status.st_mtime_ns,
+                "ctime_ns": status.st_ctime_ns}
+    index_path = _cache_path(cache_directory, "index", path)
+    index = _read_cache_file(index_path, settings)
+    if all(index.get(key) == value for key, value in identity.items()):
+        return index
+    index = _scan(path, comparer, settings["encoding"],
+                  settings["records_per_chunk"])
+    index.update(identity)
+    _write_cache_file(index_path, settings, index)
+    return index
+
+
+def _scan(path: str, comparer: DecimalComparer, encoding: str,
+          records_per_chunk: int) -> dict:
+    """
+    Find the chunks of a file and their digests.
+
+    :return: a dictionary with a list of [start, end, digest] for each
+             chunk and the number of lines
+    """
+    chunks = []
+    chunk_digest = hashlib.sha256()
+    position = start = 0
+    with open(path, "rb") as fh:
+        def lines() -> Iterator[str]:
+            nonlocal position
+            for line in fh:
+                position += len(line)
+                chunk_digest.update(line)
+                yield line.decode(encoding)
+
+        # As in parallel._find_chunk_offsets, position is at a record
+        # boundary whenever the reader returns a record.
+        reader = DecimalComparer(separator=comparer.separator)._reader(lines())
+        for record, _ in enumerate(reader, 1):
+            if record % records_per_chunk == 0:
+                chunks.append([start, position, chunk_digest.hexdigest()])
+                chunk_digest = hashlib.sha256()
+                start = position
+    if start != position or not chunks:
+        chunks.append([start, position, chunk_digest.hexdigest()])
+    return {"chunks": chunks, "line_count": reader.line_num}
+
+
+def _cache_path(cache_directory: str, kind: str, *paths: str) -> str:
+    name = hashlib.sha256("\0".join(
+        os.path.abspath(path) for path in paths).encode()).hexdigest()
+    return os.path.join(cache_directory, "{}-{}.json".format(kind, name))
+
+
+def _read_cache_file(path: str, settings: dict) -> dict:
+    """
+    :return: the contents of a cache file, or an empty dictionary if it's
+             missing, corrupt, or was written with different settings
+    """
+    try:
+        with open(path) as fh:
+            stored = json.load(fh)
+        contents = stored["contents"]
+        valid = stored["checksum"] == _checksum(contents) and \
+            stored["settings"] == settings
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    return contents if valid else {}
+
+
+def _write_cache_file(path: str, settings: dict, contents: dict) -> None:
+    # Write to a temporary file first, so that an interrupted write
+    # can't leave a truncated cache file.
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                          suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump({"settings": settings, "checksum": _checksum(contents),
+                   "contents": contents}, fh)
+    os.replace(temporary_path, path)
+
+
+def _checksum(contents: dict) -> str:
+    return hashlib.sha256(json.dumps(contents, sort_keys=True).encode()).\
+        hexdigest()
+
+
+def _result_to_json(comparer: DecimalComparer, totals: dict,
+                    statistics: Optional[ColumnStatistics], profile,
+                    difference) -> dict:
+    # Profiles aren't cached, so they're merged as soon as they arrive.
+    if profile is not None:
+        comparer.profile.merge(profile)
+    return {
+        "totals": {level.name: count for level, count in totals.items()},
+        "statistics": None if statistics is None else {
+            "column_count": statistics.column_count,
+            "counts": list(statistics._counts),
+            "max_relative_differences":
+                list(statistics._max_relative_differences),
+            "first_unequal_lines": list(statistics._first_unequal_lines),
+            "identical_rows": [[field_count, rows] for field_count, rows
+                               in statistics._identical_rows.items()]},
+        "difference": None if difference is None else
+        [difference[0], list(difference[1])],
+    }
+
+
+def _result_from_json(result: dict):
+    totals = {EqualityLevel[name]: count
+              for name, count in result["totals"].items()}
+    statistics = None
+    if result["statistics"] is not None:
+        stored = result["statistics"]
+        statistics = ColumnStatistics()
+        statistics.column_count = stored["column_count"]
+        statistics._counts = array("q", stored["counts"])
+        statistics._max_relative_differences = \
+            array("d", stored["max_relative_differences"])
+        statistics._first_unequal_lines = \
+            array("q", stored["first_unequal_lines"])
+        statistics._identical_rows = dict(
+            (field_count, rows)
+            for field_count, rows in stored["identical_rows"])
+    difference = None
+    if result["difference"] is not None:
+        line, fields = result["difference"]
+        difference = line, FieldDifference(*fields)
+    return totals, statistics, difference
@@ -0,0 +1,337 @@
+"""
+Comparison of delimited files whose rows are matched by key columns.
+
+This module is part of comparedecimal. The function compare_keyed
+compares the rows of two files which have the same values in one or more
+key columns, regardless of the order in which the rows appear. Key
+values are matched as strings.
+
+If the second file has few enough rows, a hash index of its keys (mapping
+the hash of each key to the byte offset of its row) is built, and the
+first file is streamed against it. Otherwise, both files are sorted by
+key into runs in temporary files, and the sorted runs are merge-joined.
+At most MERGE_FAN_IN runs of a file are read at once; if there are more,
+they are first merged into longer runs in several passes.
+Both methods give the same results.
+
+Rows whose key occurs more than once in a file are paired with rows
+having the same key in the other file in order of appearance.
+
+If the comparer is in fail-fast mode, the join stops at the first pair
+of matched rows which differ, and the counts of unmatched rows only
+cover the rows read so far. The hash join finds the difference on the
+earliest line of the first file; the merge join finds the one with the
+smallest key.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import heapq
+import itertools
+import locale
+import os
+import tempfile
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple
+
+from .comparedecimal import DecimalComparer
+
+MAX_INDEX_ROWS = 10000000
+"""the largest number of rows for which a hash index is built in memory"""
+
+RUN_ROWS = 100000
+"""the number of rows sorted in memory for each run of an external sort"""
+
+MERGE_FAN_IN = 64
+"""the largest number of sorted runs read at once in an external sort"""
+
+MAX_EXAMPLES = 10
+"""the number of unmatched keys kept as examples for each file"""
+
+KeyedResult = namedtuple("KeyedResult",
+                         "first_difference unmatched examples")
+"""
+The result of comparing two files by key: a string describing the first
+difference between matched rows (or None), a list of the numbers of rows
+in each file whose keys were not found in the other, and a list of
+examples of such keys for each file (the keys of the first MAX_EXAMPLES
+unmatched rows).
+"""
+
+
+def compare_keyed(comparer: DecimalComparer, path0: str, path1: str,
+                  key_columns: Sequence[int],
+                  max_index_rows: int = MAX_INDEX_ROWS,
+                  run_rows: int = RUN_ROWS,
+                  fan_in: int = MERGE_FAN_IN) -> KeyedResult:
+    """
+    Compare the rows of two delimited files which have the same keys.
+
+    The ``totals`` attribute of ``comparer`` is updated with the results
+    of comparing each pair of matched rows, and line numbers in the
+    description of the first difference refer to the first file.
+
+    :param comparer: the comparer to use
+    :param path0: the path of a delimited file
+    :param path1: the path of another delimited file
+    :param key_columns: the indices of the key columns, counting from 0
+    :param max_index_rows: the largest number of rows in the second file
+           for which an in-memory hash index is used
+    :param run_rows: the number of rows in each sorted run, if an
+           external sort is used
+    :param fan_in: the largest number of sorted runs of each file which
+           are merged at once, if an external sort is used
+    :return: a KeyedResult describing the differences
+    """
+    join = _Join(comparer, key_columns)
+    with open(path0, "rb") as fh0, open(path1, "rb") as fh1:
+        index = _build_index(join, fh1, max_index_rows)
+        if index is not None:
+            _hash_join(join, fh0, fh1, index)
+        else:
+            _merge_join(join, fh0, fh1, run_rows, fan_in)
+    return join.result()
+
+
+class _Join:
+    """The state of a join: the comparer, key columns, and results."""
+
+    def __init__(self, comparer: DecimalComparer, key_columns: Sequence[int]):
+        self.comparer = comparer
+        self.key_columns = list(key_columns)
+        self.encoding = locale.getpreferredencoding(False)
+        self.first_difference = None
+        self.unmatched = [0, 0]
+        self.examples = [[], []]  # type: List[List[Tuple[int, tuple]]]
+
+    def key(self, row: List[str]) -> tuple:
+        # Missing key fields sort before any string.
+        return tuple((False, "") if column >= len(row) else (True, row[column])
+                     for column in self.key_columns)
+
+    def compare(self, line: int, row0: List[str], row1: List[str]) -> None:
+        result = self.comparer.compare_string_lists(row0, row1, line)
+        if result is not None and (self.first_difference is None or
+                                   line < self.first_difference[0]):
+            self.first_difference = line, result
+
+    def done(self) -> bool:
+        """Whether a fail-fast join has found a difference."""
+        return self.comparer.fail_fast and self.first_difference is not None
+
+    def add_unmatched(self, file: int, line: int, key: tuple) -> None:
+        self.unmatched[file] += 1
+        examples = self.examples[file]
+        if len(examples) < MAX_EXAMPLES or line < examples[-1][0]:
+            examples.append((line, key))
+            examples.sort()
+            del examples[MAX_EXAMPLES:]
+
+    def result(self) -> KeyedResult:
+        first_difference = None if self.first_difference is None else \
+            self.comparer._describe_difference(*self.first_difference)
+        return KeyedResult(
+            first_difference=first_difference,
+            unmatched=self.unmatched,
+            examples=[[tuple(value if present else None
+                             for present, value in key)
+                       for _, key in examples]
+                      for examples in self.examples])
+
+    def records(self, fh) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Read records from a binary file.
+
+        :return: an iterator over tuples of the byte offset of each
+                 record and its fields
+        """
+        position = fh.tell()
+
+        def lines() -> Iterator[str]:
+            nonlocal position
+            for line in fh:
+                position += len(line)
+                yield line.decode(self.encoding)
+
+        # The reader only takes a further line when the current record
+        # continues onto it, so position is always at a record boundary
+        # when a record is returned.
+        start = position
+        for row in self.comparer._reader(lines()):
+            yield start, row
+            start = position
+
+
+def _build_index(join: _Join, fh, max_rows: int) ->\
+        Optional[Dict[int, object]]:
+    """
+    Build an index from key hashes to lists of record offsets.
+
+    To save memory, a single offset is stored as an int rather than as a
+    list. The actual keys are not stored, so they must be checked when
+    the records are read back.
+
+    :return: the index, or None if the file has more than max_rows rows
+    """
+    index = {}  # type: Dict[int, object]
+    for row_count, (offset, row) in enumerate(join.records(fh), 1):
+        if row_count > max_rows:
+            return None
+        key_hash = hash(join.key(row))
+        existing = index.get(key_hash)
+        if existing is None:
+            index[key_hash] = offset
+        elif isinstance(existing, list):
+            existing.append(offset)
+        else:
+            index[key_hash] = [existing, offset]
+    return index
+
+
+def _hash_join(join: _Join, fh0, fh1, index: Dict[int, object]) -> None:
+    fh0.seek(0)
+    for line, (_, row0) in enumerate(join.records(fh0)):
+        key = join.key(row0)
+        key_hash = hash(key)
+        offsets = index.get(key_hash)
+        if offsets is None:
+            join.add_unmatched(0, line, key)
+            continue
+        if not isinstance(offsets, list):
+            offsets = [offsets]
+        for i, offset in enumerate(offsets):
+            row1 = _read_row(join, fh1, offset)
+            if join.key(row1) == key:
+                join.compare(line, row0, row1)
+                if join.done():
+                    return
+                del offsets[i]
+                if len(offsets) == 0:
+                    del index[key_hash]
+                elif len(offsets) == 1:
+                    index[key_hash] = offsets[0]
+                else:
+                    index[key_hash] = offsets
+                break
+        else:
+            join.add_unmatched(0, line, key)
+
+    # Whatever is left in the index had no match in the first file.
+    remaining = sorted(offset for offsets in index.values()
+                       for offset in (offsets if isinstance(offsets, list)
+                                      else [offsets]))
+    if remaining:
+        fh1.seek(0)
+        remaining_set = set(remaining)
+        for line, (offset, row1) in enumerate(join.records(fh1)):
+            if offset in remaining_set:
+                join.add_unmatched(1, line, join.key(row1))
+
+
+def _read_row(join: _Join, fh, offset: int) -> List[str]:
+    fh.seek(offset)
+    return next(join.comparer._reader(
+        line.decode(join.encoding) for line in fh))
+
+
+def _merge_join(join: _Join, fh0, fh1, run_rows: int, fan_in: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        streams = []
+        for file, fh in enumerate((fh0, fh1)):
+            fh.seek(0)
+            runs = _write_sorted_runs(join, fh, directory, file, run_rows)
+            # Merge the runs in passes until there are few enough of them
+            # to be read at once without running out of file descriptors.
+            while len(runs) > fan_in:
+                runs = [_merge_runs(join, runs[start:start + fan_in],
+                                    directory)
+                        for start in range(0, len(runs), fan_in)]
+            streams.append(heapq.merge(*[_read_run(join, path)
+                                         for path in runs]))
+
+        # Both streams are sorted by (key, line); pair up the rows with
+        # each key in order of appearance.
+        grouped = [itertools.groupby(stream, key=lambda record: record[0])
+                   for stream in streams]
+        current = [next(groups, None) for groups in grouped]
+        while current[0] is not None or current[1] is not None:
+            keys = [None if group is None else group[0] for group in current]
+            if keys[1] is None or (keys[0] is not None and keys[0] < keys[1]):
+                advance = [0]
+            elif keys[0] is None or keys[1] < keys[0]:
+                advance = [1]
+            else:
+                advance = [0, 1]
+            records = [list(current[i][1]) if i in advance else []
+                       for i in (0, 1)]
+            for (_, line, row0), (_, _, row1) in zip(*records):
+                join.compare(line, row0, row1)
+                if join.done():
+                    return
+            for file in (0, 1):
+                for _, line, _ in records[file][len(records[1 - file]):]:
+                    join.add_unmatched(file, line, keys[file])
+            for i in advance:
+                current[i] = next(grouped[i], None)
+
+
+def _write_sorted_runs(join: _Join, fh, directory: str, file: int,
+                       run_rows: int) -> List[str]:
+    paths = []
+    records = enumerate(row for _, row in join.records(fh))
+    while True:
+        run = sorted((join.key(row), line, row)
+                     for line, row in itertools.islice(records, run_rows))
+        if not run:
+            return paths
+        path = os.path.join(directory, "{}-{}.csv".format(file, len(paths)))
+        _write_run(path, run)
+        paths.append(path)
+
+
+def _merge_runs(join: _Join, paths: List[str], directory: str) -> str:
+    """
+    Merge sorted runs into a single run, deleting them.
+
+    :return: the path of the merged run
+    """
+    merged = tempfile.mkstemp(suffix=".csv", dir=directory)
+    os.close(merged[0])
+    _write_run(merged[1], heapq.merge(*[_read_run(join, path)
+                                        for path in paths]))
+    for path in paths:
+        os.remove(path)
+    return merged[1]
+
+
+def _write_run(path: str, records: Iterable[Tuple[tuple, int, List[str]]]) \
+        -> None:
+    with open(path, "w", newline="") as out:
+        # Quoting every field preserves leading spaces, which the
+        # comparer's reader would otherwise skip.
+        writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+        for _, line, row in records:
+            writer.writerow([line] + row)
+
+
+def _read_run(join: _Join, path: str) ->\
+        Iterator[Tuple[tuple, int, List[str]]]:
+    with open(path, newline="") as fh:
+        for fields in csv.reader(fh):
+            row = fields[1:]
+            yield join.key(row), int(fields[0]), row
@@ -0,0 +1,306 @@
+"""
+Comparison of two delimited files through memory-mapped buffers.
+
+This module is part of comparedecimal. The function compare_mapped
+compares two files without first decoding them to text: runs of lines,
+single lines, and fields are checked for identity as bytes, directly
+against the mapped files, and only fields which differ are decoded and
+passed to the comparer. When most of the data is identical, this avoids
+almost all of the allocation done by DecimalComparer.compare_streams,
+while giving the same results.
+
+Identical runs of lines are found by comparing a window of the two files
+which starts at MIN_WINDOW bytes after each differing line and doubles
+after each identical run, up to BLOCK_SIZE. If the window differs, the
+first differing byte is found by bisection, and the complete lines
+before it are skipped, so scattered differences don't make any part of
+the files be compared more than a few times over.
+
+The files are assumed to use an ASCII-compatible encoding and "\\n" or
+"\\r\\n" line endings.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import itertools
+import locale
+import mmap
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+
+from .comparedecimal import DecimalComparer, EqualityLevel, FieldDifference
+
+BLOCK_SIZE = 65536
+"""the largest window checked for identity before splitting into lines"""
+
+MIN_WINDOW = 4096
+"""the size of the window checked for identity after a differing line"""
+
+
+def compare_mapped(comparer: DecimalComparer, path0: str, path1: str) ->\
+        Optional[str]:
+    """
+    Compare two delimited files by memory-mapping them.
+
+    The result, and the updates made to the ``totals`` attribute of
+    ``comparer``, are the same as for ``comparer.compare_streams``.
+
+    :param comparer: the comparer to use
+    :param path0: the path of a delimited file
+    :param path1: the path of another delimited file
+    :return: a string describing the first difference, or ``None``
+           if the files are equal
+    """
+    if comparer.separator == " ":
+        # With skipinitialspace, runs of spaces are a single separator,
+        # which the byte-level field splitting doesn't handle.
+        with open(path0) as fh0, open(path1) as fh1:
+            return comparer.compare_streams(fh0, fh1)
+
+    encoding = locale.getpreferredencoding(False)
+    with _map(path0) as buffer0, _map(path1) as buffer1:
+        return _MappedComparison(comparer, buffer0, buffer1, encoding).run()
+
+
+@contextmanager
+def _map(path: str):
+    with open(path, "rb") as fh:
+        # Empty files can't be mapped, but an empty bytes object
+        # supports all the operations needed.
+        if fh.seek(0, 2) == 0:
+            yield b""
+        else:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+
+class _MappedLines:
+    """An iterator over the lines of a buffer, as bytes."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+        self.line_count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.position >= len(self.buffer):
+            raise StopIteration
+        end = self.buffer.find(b"\n", self.position)
+        end = len(self.buffer) if end == -1 else end + 1
+        line = self.buffer[self.position:end]
+        self.position = end
+        self.line_count += 1
+        return line
+
+    def skip(self, length: int, line_count: int) -> None:
+        self.position += length
+        self.line_count += line_count
+
+    def drain(self) -> None:
+        if self.position < len(self.buffer) and \
+                self.buffer[-1:] != b"\n":
+            # The last line has no terminator to count.
+            self.line_count += 1
+        while self.position < len(self.buffer):
+            end = min(self.position + BLOCK_SIZE, len(self.buffer))
+            self.line_count += self.buffer[self.position:end].count(b"\n")
+            self.position = end
+
+
+class _MappedComparison:
+
+    def __init__(self, comparer: DecimalComparer, buffer0, buffer1,
+                 encoding: str):
+        self.comparer = comparer
+        self.encoding = encoding
+        self.separator = comparer.separator.encode(encoding)
+        self.lines = [_MappedLines(buffer0), _MappedLines(buffer1)]
+
+    def run(self) -> Optional[str]:
+        lines0, lines1 = self.lines
+        first_difference = None
+        line = 0
+        window = MIN_WINDOW
+        while lines0.position < len(lines0.buffer) and \
+                lines1.position < len(lines1.buffer):
+            identical_lines = self._skip_identical_lines(window)
+            if identical_lines > 0:
+                line += identical_lines
+                window = min(2 * window, BLOCK_SIZE)
+                continue
+            window = MIN_WINDOW
+            result = self._compare_records(line)
+            if result is not None and first_difference is None:
+                first_difference = line, result
+                if self.comparer.fail_fast:
+                    break
+            line += 1
+        else:
+            for lines in self.lines:
+                if self.comparer.fail_fast:
+                    # Count one more line to show that there is one.
+                    lines.line_count += lines.position < len(lines.buffer)
+                else:
+                    lines.drain()
+            if lines0.line_count != lines1.line_count:
+                return self.comparer._describe_line_counts(
+                    [lines0.line_count, lines1.line_count])
+
+        return None if first_difference is None else \
+            self.comparer._describe_difference(*first_difference)
+
+    def _skip_identical_lines(self, window: int) -> int:
+        """
+        Skip the complete lines at the start of a window which are
+        identical in both buffers.
+
+        Lines are only skipped up to the first quotation mark or empty
+        line, whose fields can't be counted from the separators alone.
+
+        :param window: the number of bytes to check
+        :return: the number of lines skipped, which is zero if the first
+                 line differs or can't be counted
+        """
+        lines0, lines1 = self.lines
+        start0, start1 = lines0.position, lines1.position
+        length = min(window, len(lines0.buffer) - start0,
+                     len(lines1.buffer) - start1)
+        length = self._common_prefix(start0, start1, length)
+        end = lines0.buffer.rfind(b"\n", start0, start0 + length) + 1
+        if end <= start0:
+            return 0
+        block = lines0.buffer[start0:end]
+        quote = block.find(b"\"")
+        if quote != -1:
+            block = block[:block.rfind(b"\n", 0, quote) + 1]
+        for empty_line in (b"\n\n", b"\n\r\n"):
+            position = block.find(empty_line)
+            if position != -1:
+                block = block[:position + 1]
+        if block.startswith((b"\n", b"\r\n")) or not block:
+            return 0
+
+        line_count = block.count(b"\n")
+        if self.comparer.column_statistics is None and \
+                self.comparer._projections is None:
+            self.comparer.totals[EqualityLevel.IDENTICAL] += \
+                block.count(self.separator) + line_count
+        else:
+            field_counts = Counter(line.count(self.separator) + 1
+                                   for line in block.split(b"\n")[:-1])
+            for field_count, rows in field_counts.items():
+                self.comparer._add_identical_rows(field_count, rows)
+        for lines in self.lines:
+            lines.skip(len(block), line_count)
+        return line_count
+
+    def _common_prefix(self, start0: int, start1: int, length: int) -> int:
+        """
+        :return: the number of bytes, up to length, which are the same in
+                 both buffers from the given positions
+        """
+        buffer0, buffer1 = self.lines[0].buffer, self.lines[1].buffer
+        if buffer0[start0:start0 + length] == buffer1[start1:start1 + length]:
+            return length
+        # The first low bytes are the same, and the first high aren't.
+        low, high = 0, length
+        while high - low > 64:
+            middle = (low + high) // 2
+            if buffer0[start0 + low:start0 + middle] == \
+                    buffer1[start1 + low:start1 + middle]:
+                low = middle
+            else:
+                high = middle
+        while buffer0[start0 + low] == buffer1[start1 + low]:
+            low += 1
+        return low
+
+    def _compare_records(self, line: int) -> Optional[FieldDifference]:
+        records = [next(lines) for lines in self.lines]
+        if records[0] == records[1] and b"\"" not in records[0]:
+            # An identical line which isn't a complete record is one
+            # containing a bare "\r", which the CSV reader rejects.
+            record = records[0]
+            if record.endswith(b"\n"):
+                record = record[:-1]
+            if record.endswith(b"\r"):
+                record = record[:-1]
+            if b"\r" not in record:
+                self.comparer._add_identical_rows(
+                    0 if record == b"" else record.count(self.separator) + 1)
+                return None
+        if b"\"" in records[0] or b"\"" in records[1]:
+            # Quoted fields may contain separators or span lines, so
+            # leave these records to the CSV reader.
+            rows = [self._parse(record, lines)
+                    for record, lines in zip(records, self.lines)]
+            return self.comparer.compare_string_lists(rows[0], rows[1], line)
+
+        fields0, fields1 = [self._split(record) for record in records]
+        if len(fields0) != len(fields1):
+            return FieldDifference(field_index=-1,
+                                   string0="{}".format(len(fields0)),
+                                   string1="{}".format(len(fields1)))
+
+        statistics = self.comparer.column_statistics
+        first_difference = None
+        columns = range(len(fields0)) \
+            if self.comparer._projections is None \
+            else self.comparer._project(len(fields0))
+        for i in columns:
+            if fields0[i] == fields1[i]:
+                self.comparer.totals[EqualityLevel.IDENTICAL] += 1
+                if statistics is not None:
+                    statistics.add(i, EqualityLevel.IDENTICAL)
+                continue
+            strings = fields0[i].decode(self.encoding), \
+                fields1[i].decode(self.encoding)
+            level = self.comparer.compare_strings(*strings)
+            if statistics is not None or self.comparer.report is not None:
+                relative_difference = \
+                    self.comparer._relative_difference(*strings)
+                if statistics is not None:
+                    statistics.add(i, level, relative_difference, line)
+                if self.comparer.report is not None:
+                    self.comparer.report.add(line, i, strings[0], strings[1],
+                                             level, relative_difference)
+            if level == EqualityLevel.UNEQUAL and first_difference is None:
+                first_difference = FieldDifference(
+                    field_index=i, string0=strings[0], string1=strings[1])
+                if self.comparer.fail_fast:
+                    break
+        return first_difference
+
+    def _parse(self, record: bytes, lines: _MappedLines) -> List[str]:
+        # The reader only takes further lines from the buffer if the
+        # record continues beyond its first line.
+        reader = self.comparer._reader(
+            line.decode(self.encoding)
+            for line in itertools.chain([record], lines))
+        return next(reader)
+
+    def _split(self, record: bytes) -> List[bytes]:
+        if record.endswith(b"\n"):
+            record = record[:-1]
+        if record.endswith(b"\r"):
+            record = record[:-1]
+        if record == b"":
+            return []
+        return [field.lstrip(b" ") for field in record.split(self.separator)]
@@ -0,0 +1,253 @@
+"""
+Parallel comparison of two delimited files using multiple processes.
+
+This module is part of comparedecimal. The function compare_files splits
+both files into chunks holding the same range of records, compares the
+chunk pairs in a pool of worker processes, and merges the results so
+that they are identical to those of DecimalComparer.compare_streams.
+
+The chunk boundaries are found without reading a file serially if every
+line is a record, as in most numeric files. The workers first scan
+blocks of SCAN_BLOCK_SIZE bytes in parallel, counting their line breaks
+and checking for quotation marks and bare carriage returns. If a file
+has neither, its lines are its records, and a chunk boundary is found
+by seeking to the block holding the line break before it and skipping
+the breaks in that block before it. Otherwise the file is read once
+with the comparer's CSV reader settings, so that quoted fields
+containing line breaks are never split between chunks.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import io
+import itertools
+import locale
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from .comparedecimal import DecimalComparer
+
+RECORDS_PER_CHUNK = 100000
+"""the default number of records in each chunk handed to a worker"""
+
+SCAN_BLOCK_SIZE = 1 << 22
+"""the number of bytes in each block scanned for line breaks by a worker"""
+
+
+def compare_files(comparer: DecimalComparer, path0: str, path1: str,
+                  jobs: Optional[int] = None,
+                  records_per_chunk: int = RECORDS_PER_CHUNK) -> Optional[str]:
+    """
+    Compare two delimited files using a pool of worker processes.
+
+    The byte offset of every ``records_per_chunk``-th record boundary in
+    each file is found first, in parallel if the lines of the file are
+    its records (see the module documentation), and otherwise with the
+    comparer's CSV reader settings, so that quoted fields containing
+    newlines are never split between chunks. Each worker then compares
+    one pair of chunks with its own DecimalComparer. The totals from the
+    workers are added to the ``totals`` attribute of ``comparer``, and the
+    result is the same as that of ``comparer.compare_streams`` on the same
+    files.
+
+    If the comparer is in fail-fast mode, no further chunks are started
+    once a difference has been found.
+
+    :param comparer: the comparer whose separator and threshold should be
+           used, and whose ``totals`` should be updated
+    :param path0: the path of a delimited file
+    :param path1: the path of another delimited file
+    :param jobs: the maximum number of worker processes; if ``None``,
+           the number of processors on the machine is used
+    :param records_per_chunk: the number of records in each chunk
+    :return: a string describing the first difference, or ``None``
+           if the files are equal
+    """
+    encoding = locale.getpreferredencoding(False)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        (offsets0, line_count0), (offsets1, line_count1) = [
+            _find_offsets(executor, path, comparer.separator, encoding,
+                          records_per_chunk) for path in (path0, path1)]
+
+        # Chunks beyond the end of the shorter file are not compared,
+        # matching the behaviour of compare_streams.
+        futures = [
+            executor.submit(_compare_chunk, comparer.separator,
+                            comparer.closeness_threshold,
+                            comparer.column_statistics is not None,
+                            comparer.fail_fast,
+                            comparer.profile is not None,
+                            comparer.columns, comparer.exclude_columns,
+                            encoding,
+                            path0, offsets0[i], offsets0[i + 1],
+                            path1, offsets1[i], offsets1[i + 1],
+                            i * records_per_chunk)
+            for i in range(min(len(offsets0), len(offsets1)) - 1)
+        ]
+
+        first_difference = None
+        for future in futures:
+            totals, statistics, profile, difference = future.result()
+            for level, count in totals.items():
+                comparer.totals[level] += count
+            if statistics is not None:
+                comparer.column_statistics.merge(statistics)
+            if profile is not None:
+                comparer.profile.merge(profile)
+            if first_difference is None:
+                first_difference = difference
+                if difference is not None and comparer.fail_fast:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+    if line_count0 != line_count1 and \
+            not (comparer.fail_fast and first_difference is not None):
+        return "Unequal numbers of lines ({}, {})".\
+            format(line_count0, line_count1)
+
+    return None if first_difference is None else \
+        comparer._describe_difference(*first_difference)
+
+
+def _find_offsets(executor: ProcessPoolExecutor, path: str, separator: str,
+                  encoding: str, records_per_chunk: int) ->\
+        Tuple[List[int], int]:
+    """
+    Find the byte offsets of chunk boundaries within a file, using the
+    workers of an executor.
+
+    :return: as for _find_chunk_offsets
+    """
+    size = os.path.getsize(path)
+    block_size = SCAN_BLOCK_SIZE
+    starts = range(0, size, block_size)
+    scans = list(executor.map(_scan_block, itertools.repeat(path), starts,
+                              itertools.repeat(block_size), chunksize=16))
+    if not all(plain for _, plain in scans):
+        return executor.submit(_find_chunk_offsets, path, separator,
+                               encoding, records_per_chunk).result()
+
+    # breaks[i] is the number of line breaks before the start of block i.
+    breaks = [0] + list(itertools.accumulate(count for count, _ in scans))
+    with open(path, "rb") as fh:
+        fh.seek(max(0, size - 1))
+        unterminated = fh.read(1) not in (b"", b"\n")
+    line_count = breaks[-1] + (1 if unterminated else 0)
+    # The boundary before line n follows the nth line break, which lies
+    # in the last block with fewer than n breaks before it.
+    boundaries = range(records_per_chunk, line_count, records_per_chunk)
+    blocks = [bisect.bisect_left(breaks, line) - 1 for line in boundaries]
+    offsets = executor.map(_line_start, itertools.repeat(path),
+                           [block * block_size for block in blocks],
+                           [line - breaks[block] for line, block
+                            in zip(boundaries, blocks)],
+                           itertools.repeat(block_size), chunksize=16)
+    return [0] + list(offsets) + [size], line_count
+
+
+def _scan_block(path: str, start: int, block_size: int) -> Tuple[int, bool]:
+    """
+    Scan a block of a file.
+
+    :return: the number of line breaks in the block, and whether every
+             line break ends a record: that is, whether the block has no
+             quotation marks and no carriage returns which aren't part of
+             a CRLF line ending
+    """
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        # One more byte shows whether a final CR is followed by LF.
+        data = fh.read(block_size + 1)
+    block = data[:block_size]
+    return block.count(b"\n"), b'"' not in block and \
+        block.count(b"\r") == data.count(b"\r\n")
+
+
+def _line_start(path: str, start: int, breaks: int, block_size: int) -> int:
+    """
+    :return: the offset of the byte after the given number of line breaks
+             from a block start
+    """
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        block = fh.read(block_size)
+    offset = -1
+    for _ in range(breaks):
+        offset = block.index(b"\n", offset + 1)
+    return start + offset + 1
+
+
+def _find_chunk_offsets(path: str, separator: str, encoding: str,
+                        records_per_chunk: int) -> Tuple[List[int], int]:
+    """
+    Find the byte offsets of chunk boundaries within a file by reading
+    its records.
+
+    :return: a tuple containing a list of chunk boundary offsets, starting
+             with 0 and ending with the length of the file, and the number
+             of lines in the file
+    """
+    offsets = [0]
+    position = 0
+    with open(path, "rb") as fh:
+        def lines() -> Iterator[str]:
+            nonlocal position
+            for line in fh:
+                position += len(line)
+                yield line.decode(encoding)
+
+        # The reader only requests another line when it needs one to
+        # complete the current record, so after each record is returned,
+        # position is at the start of the next one.
+        reader = DecimalComparer(separator=separator)._reader(lines())
+        for record, _ in enumerate(reader, 1):
+            if record % records_per_chunk == 0:
+                offsets.append(position)
+    if offsets[-1] != position or len(offsets) == 1:
+        offsets.append(position)
+    return offsets, reader.line_num
+
+
+def _compare_chunk(separator: str, closeness_threshold: float,
+                   per_column: bool, fail_fast: bool, profile: bool,
+                   columns: Optional[List[int]],
+                   exclude_columns: Optional[List[int]], encoding: str,
+                   path0: str, start0: int, end0: int,
+                   path1: str, start1: int, end1: int,
+                   first_line: int):
+    comparer = DecimalComparer(separator=separator,
+                               closeness_threshold=closeness_threshold,
+                               per_column=per_column, fail_fast=fail_fast,
+                               profile=profile, columns=columns,
+                               exclude_columns=exclude_columns)
+    difference, _ = comparer._compare_lines(
+        _read_lines(path0, start0, end0, encoding),
+        _read_lines(path1, start1, end1, encoding),
+        first_line)
+    return comparer.totals, comparer.column_statistics, comparer.profile, \
+        difference
+
+
+def _read_lines(path: str, start: int, end: int, encoding: str) -> io.StringIO:
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    # newline=None gives the same universal newline handling as a file
+    # opened in text mode.
+    return io.StringIO(data.decode(encoding), newline=None)
@@ -0,0 +1,345 @@
+"""
+Instrumentation of DecimalComparer for finding where time is spent.
+
+This module is part of comparedecimal. A Profile is created by a
+DecimalComparer constructed with ``profile=True``, which replaces some of
+the comparer's methods with timed versions. Comparers without a profile
+run the original methods, so profiling has no cost unless enabled.
+
+A profile records
+
+- the time spent in each stage of a comparison: reading lines, CSV
+  parsing, float() and the mantissa regular expression (both only run
+  for strings not yet in the parsed-literal cache), and the rest of the
+  string comparison;
+- the number of string comparisons leaving _compare_strings at each
+  decision point; and
+- a histogram of string comparison latencies for each equality level,
+  with buckets bounded by powers of two nanoseconds.
+
+The stage times are exclusive: for instance, the time for CSV parsing
+doesn't include the time spent reading the lines which the parser
+consumes. Since the decision point of each comparison is found by looking
+up its literals again, the hit counts reported by the comparer's
+cache_info method include these lookups while profiling.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import functools
+import math
+import time
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+from .comparedecimal import DecimalComparer, EqualityLevel, ParsedLiteral
+
+STAGES = ["read", "csv", "float", "regex", "compare"]
+"""the timed stages of a comparison"""
+
+STAGE_DESCRIPTIONS = ["reading lines", "CSV parsing", "float()",
+                      "mantissa regex", "string comparison"]
+
+EXITS = ["identical", "parse failure", "float equal", "sign", "magnitude",
+         "digits"]
+"""the decision points at which _compare_strings can return, in order"""
+
+BUCKETS = 40
+"""the number of latency histogram buckets; bucket i counts latencies
+below 2**i nanoseconds (and at least 2**(i-1))"""
+
+_READ, _CSV, _FLOAT, _REGEX, _COMPARE = range(len(STAGES))
+_IDENTICAL, _PARSE_FAILURE, _FLOAT_EQUAL, _SIGN, _MAGNITUDE, _DIGITS = \
+    range(len(EXITS))
+
+
+class Profile:
+    """
+    Timings and counts collected from an instrumented DecimalComparer.
+
+    The counts are kept in arrays indexed by the positions of the stages
+    and decision points in STAGES and EXITS; to_dict gives them by name.
+    """
+
+    def __init__(self):
+        self.stage_ns = array("q", [0] * len(STAGES))
+        """the total time spent in each stage, in nanoseconds"""
+        self.stage_calls = array("q", [0] * len(STAGES))
+        """the number of times each stage was entered"""
+        self.exits = array("q", [0] * len(EXITS))
+        """the number of comparisons leaving at each decision point"""
+        self.histograms = array("q", [0] * (len(EqualityLevel) * BUCKETS))
+        """the latency histograms of string comparisons for each level,
+        concatenated in order of level value"""
+        self.identical_lines = 0
+        """the number of pairs of identical lines counted without parsing"""
+        self.wall_ns = 0
+        """the total elapsed time, if recorded by the caller"""
+
+    def histogram(self, level: EqualityLevel) -> array:
+        """
+        :param level: an equality level
+        :return: the latency histogram for the level
+        """
+        start = (level.value - 1) * BUCKETS
+        return self.histograms[start:start + BUCKETS]
+
+    def instrument(self, comparer: DecimalComparer) -> None:
+        """
+        Replace the methods of a comparer with versions which record
+        their timings in this profile.
+
+        :param comparer: the comparer to instrument
+        """
+        clock = time.perf_counter_ns
+        stage_ns = self.stage_ns
+        stage_calls = self.stage_calls
+        exits = self.exits
+        histograms = self.histograms
+        profile = self
+
+        def parse_literal_uncached(literal: str) -> Optional[ParsedLiteral]:
+            # Mirrors DecimalComparer._parse_literal_uncached, timing its
+            # two steps separately.
+            start = clock()
+            try:
+                value = float(literal)
+            except ValueError:
+                value = None
+            middle = clock()
+            stage_ns[_FLOAT] += middle - start
+            stage_calls[_FLOAT] += 1
+            if value is None:
+                return None
+            digits = DecimalComparer._extract_mantissa_digits(literal)
+            stage_ns[_REGEX] += clock() - middle
+            stage_calls[_REGEX] += 1
+            return ParsedLiteral(value=value, digits=digits,
+                                 sig_figs=-1 if digits is None
+                                 else len(digits))
+
+        maxsize = comparer.cache_info().maxsize
+        parse_literal = functools.lru_cache(maxsize=maxsize)(
+            parse_literal_uncached)
+        # The decision point is found after the comparison. Only some
+        # levels can be reached from more than one; for those, the
+        # literals are looked up again in the cache (or, with no cache,
+        # parsed again without timing).
+        lookup = parse_literal if maxsize != 0 else \
+            DecimalComparer._parse_literal_uncached
+        # Enum members hash slowly, so they're looked up by identity.
+        exit_by_level = {id(EqualityLevel.IDENTICAL): _IDENTICAL,
+                         id(EqualityLevel.COMPATIBLE): _DIGITS,
+                         id(EqualityLevel.CLOSE): _DIGITS}
+        histogram_offsets = {id(level): (level.value - 1) * BUCKETS
+                             for level in EqualityLevel}
+        last_bucket = BUCKETS - 1
+
+        compare_strings = comparer._compare_strings
+
+        def profiled_compare_strings(string0: str,
+                                     string1: str) -> EqualityLevel:
+            parse_before = stage_ns[_FLOAT] + stage_ns[_REGEX]
+            start = clock()
+            level = compare_strings(string0, string1)
+            elapsed = clock() - start
+            stage_ns[_COMPARE] += elapsed - \
+                (stage_ns[_FLOAT] + stage_ns[_REGEX] - parse_before)
+            stage_calls[_COMPARE] += 1
+            bucket = elapsed.bit_length()
+            histograms[histogram_offsets[id(level)] +
+                       (bucket if bucket < last_bucket else last_bucket)] += 1
+            exit_point = exit_by_level.get(id(level))
+            if exit_point is None:
+                exit_point = _exit_point(lookup(string0), lookup(string1))
+            exits[exit_point] += 1
+            return level
+
+        reader = comparer._reader
+
+        def profiled_reader(lines: Iterable[str]) -> _TimedReader:
+            return _TimedReader(reader(lines), self)
+
+        compare_lines = comparer._compare_lines
+
+        def profiled_compare_lines(lines0: Iterable[str],
+                                   lines1: Iterable[str], first_line=0):
+            return compare_lines(self._timed_lines(lines0),
+                                 self._timed_lines(lines1), first_line)
+
+        count_fields = comparer._count_fields
+
+        def profiled_count_fields(line: str) -> Optional[int]:
+            result = count_fields(line)
+            if result is not None:
+                profile.identical_lines += 1
+            return result
+
+        comparer._parse_literal = parse_literal
+        comparer._compare_strings = profiled_compare_strings
+        comparer._reader = profiled_reader
+        comparer._compare_lines = profiled_compare_lines
+        comparer._count_fields = profiled_count_fields
+
+    def _timed_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        clock = time.perf_counter_ns
+        stage_ns = self.stage_ns
+        stage_calls = self.stage_calls
+        iterator = iter(lines)
+        while True:
+            start = clock()
+            line = next(iterator, None)
+            stage_ns[_READ] += clock() - start
+            if line is None:
+                return
+            stage_calls[_READ] += 1
+            yield line
+
+    def merge(self, other: "Profile") -> None:
+        """
+        Add the timings and counts of another profile to this one.
+
+        :param other: another profile
+        """
+        for mine, theirs in ((self.stage_ns, other.stage_ns),
+                             (self.stage_calls, other.stage_calls),
+                             (self.exits, other.exits),
+                             (self.histograms, other.histograms)):
+            for index, value in enumerate(theirs):
+                mine[index] += value
+        self.identical_lines += other.identical_lines
+        self.wall_ns += other.wall_ns
+
+    def to_dict(self) -> dict:
+        """
+        :return: the contents of this profile as a dictionary which can be
+                 serialized as JSON
+        """
+        return {
+            "wall_seconds": self.wall_ns / 1e9,
+            "stages": {stage: {"calls": self.stage_calls[index],
+                               "seconds": self.stage_ns[index] / 1e9}
+                       for index, stage in enumerate(STAGES)},
+            "exits": dict(zip(EXITS, self.exits)),
+            "latency_histogram_bounds_ns": [2 ** bucket
+                                            for bucket in range(BUCKETS)],
+            "latency_histograms": {level.name.lower():
+                                   list(self.histogram(level))
+                                   for level in EqualityLevel},
+            "identical_lines": self.identical_lines,
+            "literal_cache_misses": self.stage_calls[_FLOAT],
+        }
+
+    def report(self) -> str:
+        """
+        :return: a human-readable summary of this profile
+        """
+        lines = ["{:20s} {:>12s} {:>10s} {:>7s}".format(
+            "stage", "calls", "seconds", "share")]
+        total = sum(self.stage_ns)
+        rows = list(zip(STAGE_DESCRIPTIONS, self.stage_calls, self.stage_ns))
+        if self.wall_ns > total:
+            rows.append(("other", None, self.wall_ns - total))
+            total = self.wall_ns
+        for description, calls, ns in rows:
+            lines.append("{:20s} {:>12s} {:10.3f} {:6.1f}%".format(
+                description, "" if calls is None else str(calls), ns / 1e9,
+                100 * ns / total if total else 0))
+
+        comparisons = sum(self.exits)
+        lines.append("")
+        lines.append("{:20s} {:>12s} {:>7s}".format(
+            "comparison exit", "count", "share"))
+        for exit_point, count in zip(EXITS, self.exits):
+            lines.append("{:20s} {:12d} {:6.1f}%".format(
+                exit_point, count,
+                100 * count / comparisons if comparisons else 0))
+
+        lines.append("")
+        lines.append("{:20s} {:>12s} {:>10s} {:>10s} {:>10s}".format(
+            "latency (ns)", "count", "p50 <", "p90 <", "p99 <"))
+        for level in sorted(EqualityLevel, key=lambda level: level.value):
+            histogram = self.histogram(level)
+            count = sum(histogram)
+            if count:
+                lines.append("{:20s} {:12d} {:>10d} {:>10d} {:>10d}".format(
+                    level.description, count,
+                    *[_percentile(histogram, p) for p in (0.5, 0.9, 0.99)]))
+
+        lines.append("")
+        lines.append("identical lines counted without parsing: {}".format(
+            self.identical_lines))
+        lines.append("literals parsed (cache misses): {}".format(
+            self.stage_calls[_FLOAT]))
+        return "\n".join(lines)
+
+
+class _TimedReader:
+    """A CSV reader which records the time spent in it."""
+
+    def __init__(self, reader, profile: Profile):
+        self._reader = reader
+        self._stage_ns = profile.stage_ns
+        self._stage_calls = profile.stage_calls
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> List[str]:
+        stage_ns = self._stage_ns
+        read_before = stage_ns[_READ]
+        start = time.perf_counter_ns()
+        try:
+            return next(self._reader)
+        finally:
+            stage_ns[_CSV] += time.perf_counter_ns() - start - \
+                (stage_ns[_READ] - read_before)
+            self._stage_calls[_CSV] += 1
+
+    @property
+    def line_num(self) -> int:
+        return self._reader.line_num
+
+
+def _exit_point(literal0: Optional[ParsedLiteral],
+                literal1: Optional[ParsedLiteral]) -> int:
+    # Mirrors the tests in DecimalComparer._compare_strings after the
+    # one for identical strings.
+    if literal0 is None or literal1 is None:
+        return _PARSE_FAILURE
+    a, b = literal0.value, literal1.value
+    if a == b:
+        return _FLOAT_EQUAL
+    if math.copysign(a, b) != a:
+        return _SIGN
+    if abs(a) >= abs(b) * 10 or abs(b) >= abs(a) * 10 or \
+            math.isnan(a) or math.isnan(b):
+        return _MAGNITUDE
+    return _DIGITS
+
+
+def _percentile(histogram: array, fraction: float) -> int:
+    """
+    :return: the upper bound of the bucket containing the given fraction
+             of the histogram's counts
+    """
+    target = fraction * sum(histogram)
+    cumulative = 0
+    for bucket, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= target:
+            return 2 ** bucket
+    return 2 ** (len(histogram) - 1)
@@ -0,0 +1,173 @@
+"""
+A report of every differing field pair found in a comparison.
+
+This module is part of comparedecimal. A DifferenceReport attached to a
+DecimalComparer (as its ``report`` attribute) receives each field pair
+which isn't identical as the comparer finds it, and writes it to a file
+in CSV or JSON-lines format. Records are buffered and written in batches
+of BATCH_SIZE, and nothing else is kept apart from a count for each
+column, so memory use doesn't grow with the number of differences.
+Optional caps on the number of records written for each column and in
+total bound the size of the report; records beyond the caps are counted
+but not written.
+
+Each record holds the line number (counting from 1, or empty if the
+comparison isn't line-based), the field number (counting from 1), the
+two strings, the description of their EqualityLevel, and their relative
+difference (empty if they aren't both numeric). The relative difference
+is infinite if one value is zero and NaN if either is NaN; since JSON has
+no numbers for these, a JSON-lines report gives them as the strings
+"inf", "-inf", and "nan", as a CSV report does.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import json
+import math
+from typing import Dict, List, Optional, TextIO
+
+from .comparedecimal import EqualityLevel
+
+BATCH_SIZE = 1024
+"""the number of records buffered before they are written"""
+
+FORMATS = ("csv", "jsonl")
+"""the supported output formats"""
+
+HEADINGS = ["line", "field", "value1", "value2", "level",
+            "relative_difference"]
+"""the column names of a CSV report and the keys of a JSON-lines report"""
+
+
+def format_for_path(path: str) -> str:
+    """
+    :param path: the path of a report file
+    :return: "jsonl" if the path ends with .jsonl or .json, otherwise "csv"
+    """
+    return "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+
+
+class DifferenceReport:
+    """
+    A writer of differing field pairs to a CSV or JSON-lines file.
+
+    A report may be used as a context manager, which closes it on exit.
+    """
+
+    def __init__(self, fh: TextIO, output_format: str = "csv",
+                 unequal_only: bool = False,
+                 max_per_column: Optional[int] = None,
+                 max_total: Optional[int] = None,
+                 batch_size: int = BATCH_SIZE):
+        """
+        :param fh: a file opened for writing text; for a CSV report, it
+               should be opened with ``newline=""``
+        :param output_format: "csv" or "jsonl"
+        :param unequal_only: whether to report only unequal field pairs
+               rather than all those which aren't identical
+        :param max_per_column: the largest number of records written for
+               any column, or None for no limit
+        :param max_total: the largest number of records written, or None
+               for no limit
+        :param batch_size: the number of records buffered before they are
+               written
+        :raises ValueError: if the output format isn't supported
+        """
+        if output_format not in FORMATS:
+            raise ValueError("Unknown report format \"{}\"".format(
+                output_format))
+        self.output_format = output_format
+        self.unequal_only = unequal_only
+        self.max_per_column = max_per_column
+        self.max_total = max_total
+        self.batch_size = batch_size
+        self.written = 0  # type: int
+        """the number of records written or buffered"""
+        self.dropped = 0  # type: int
+        """the number of records not written because of the caps"""
+        self.full = max_total == 0  # type: bool
+        """whether the total cap has been reached"""
+        self._fh = fh
+        self._column_counts = {}  # type: Dict[int, int]
+        self._batch = []  # type: List[list]
+        self._csv_writer = None
+        if output_format == "csv":
+            self._csv_writer = csv.writer(fh)
+            self._csv_writer.writerow(HEADINGS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, line: Optional[int], column: int, string0: str,
+            string1: str, level: EqualityLevel,
+            relative_difference: Optional[float]) -> None:
+        """
+        Record a pair of fields which aren't identical.
+
+        :param line: the index of the fields' line, or None if unknown
+        :param column: the index of the fields' column
+        :param string0: the field from the first file
+        :param string1: the field from the second file
+        :param level: the equality level of the fields
+        :param relative_difference: the relative difference between the
+               fields' values, or None if they aren't both numeric
+        """
+        if self.unequal_only and level != EqualityLevel.UNEQUAL:
+            return
+        count = self._column_counts.get(column, 0)
+        if self.full or (self.max_per_column is not None and
+                         count >= self.max_per_column):
+            self.dropped += 1
+            return
+        self._column_counts[column] = count + 1
+        self._batch.append([None if line is None else line + 1, column + 1,
+                            string0, string1, level.description,
+                            relative_difference])
+        self.written += 1
+        if self.max_total is not None and self.written >= self.max_total:
+            self.full = True
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered records to the file.
+        """
+        if self._csv_writer is not None:
+            self._csv_writer.writerows(
+                ["" if value is None else value for value in record]
+                for record in self._batch)
+        else:
+            for record in self._batch:
+                difference = record[-1]
+                if difference is not None and not math.isfinite(difference):
+                    record[-1] = str(difference)
+            self._fh.write("".join(
+                json.dumps(dict(zip(HEADINGS, record)), allow_nan=False) +
+                "\n" for record in self._batch))
+        self._batch.clear()
+        self._fh.flush()
+
+    def close(self) -> None:
+        """
+        Write the buffered records and close the file.
+        """
+        self.flush()
+        self._fh.close()
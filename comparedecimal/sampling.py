@@ -0,0 +1,346 @@
+"""
+Estimation of the similarity of two large files by sampling their lines.
+
+This module is part of comparedecimal. The function compare_sampled
+picks lines at random positions in two files, compares the fields of the
+lines with the same line number in each file, and estimates the
+proportion of field pairs in the whole files at each equality level,
+with confidence intervals. Sampling stops when every interval is narrower
+than a target precision or when a time budget runs out.
+
+To find the line with a given number without reading the files up to it,
+each file is first scanned once to build a sparse index holding the
+number of line breaks before the start of each block of
+INDEX_BLOCK_SIZE bytes. Counting line breaks runs at close to the speed
+at which the file can be read, which is far faster than comparing it. A
+line is then found by seeking to the start of its block and skipping the
+line breaks before it.
+
+Since lines are sampled by their position in the file, a record spanning
+several lines (a quoted field containing a line break) can't be found
+reliably. Sampled lines which aren't complete records in both files are
+skipped, and the number skipped is reported.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import csv
+import locale
+import math
+import random
+import time
+from array import array
+from collections import namedtuple
+from typing import BinaryIO, Optional, Tuple
+
+from .comparedecimal import DecimalComparer, EqualityLevel
+
+INDEX_BLOCK_SIZE = 1 << 16
+"""the number of bytes between entries of the line index"""
+
+PRECISION = 0.01
+"""the default largest half-width of the confidence intervals"""
+
+TIME_BUDGET = 10.0
+"""the default maximum time spent sampling, in seconds"""
+
+MIN_SAMPLES = 100
+"""the number of lines sampled before the precision is first checked"""
+
+Z = 1.959964
+"""the standard normal quantile for 95% confidence intervals"""
+
+_LEVELS = sorted(EqualityLevel, key=lambda level: level.value)
+
+Estimate = namedtuple("Estimate", "proportion low high")
+"""
+An estimated proportion of field pairs and the bounds of its 95%
+confidence interval.
+"""
+
+SampleResult = namedtuple("SampleResult",
+                          "estimates samples skipped mismatched line_counts "
+                          "first_difference precision_reached seconds")
+"""
+The result of a sampled comparison.
+
+estimates
+  a dictionary from each EqualityLevel to its Estimate
+samples
+  the number of pairs of lines compared
+skipped
+  the number of sampled pairs of lines which weren't complete records
+mismatched
+  the number of compared pairs of lines with different numbers of fields
+line_counts
+  the numbers of lines in the two files
+first_difference
+  a string describing the difference found on the sampled line with the
+  lowest line number, or None if none of the sampled lines differed
+precision_reached
+  whether sampling stopped because the target precision was reached or
+  every line was sampled, rather than because the time budget ran out
+seconds
+  the time spent sampling, excluding the time taken to index the files
+"""
+
+
+def compare_sampled(comparer: DecimalComparer, path0: str, path1: str,
+                    precision: float = PRECISION,
+                    time_budget: float = TIME_BUDGET,
+                    max_samples: Optional[int] = None,
+                    seed: Optional[int] = None) -> SampleResult:
+    """
+    Estimate the proportions of field pairs at each equality level in two
+    files by comparing lines with random line numbers.
+
+    Lines are sampled without replacement, uniformly among the line
+    numbers present in both files. Each pair of lines is a sample of
+    several field pairs, so the proportions are estimated as ratios of
+    the number of fields at a level to the total number of fields, with
+    standard errors from the variation between lines. If every line is
+    sampled before the target precision is reached, as for small files,
+    the comparison is exact and each interval is its estimate. The
+    comparer's ``totals`` and ``column_statistics`` count the sampled
+    field pairs.
+
+    :param comparer: the comparer to classify the sampled fields, which
+           must not be in fail-fast mode
+    :param path0: the path of a delimited file
+    :param path1: the path of another delimited file
+    :param precision: stop when the half-width of every confidence
+           interval is at most this proportion
+    :param time_budget: stop after sampling for this many seconds
+    :param max_samples: if not None, stop after comparing this many
+           pairs of lines
+    :param seed: the seed for the random number generator, for
+           reproducible samples
+    :return: a SampleResult
+    :raises ValueError: if the comparer is in fail-fast mode
+    """
+    if comparer.fail_fast:
+        # Fields after the first unequal one in a line wouldn't be
+        # counted, biasing the estimates.
+        raise ValueError("Sampling can't be used in fail-fast mode")
+    encoding = locale.getpreferredencoding(False)
+    indices = [_LineIndex(path) for path in (path0, path1)]
+    line_count = min(index.line_count for index in indices)
+    rnd = random.Random(seed)
+    level_count = len(_LEVELS)
+    # Sums over samples of x (fields per line), x², y (fields at each
+    # level per line), y², and xy, for the ratio estimator's variance
+    sum_x = sum_xx = 0
+    sum_y = [0] * level_count
+    sum_yy = [0] * level_count
+    sum_xy = [0] * level_count
+    samples = skipped = mismatched = drawn = 0
+    # The line numbers moved by a Fisher-Yates shuffle of all the line
+    # numbers, performed lazily so that memory grows with the sample
+    swapped = {}
+    first_difference = None  # type: Optional[tuple]
+    precision_reached = False
+    totals = comparer.totals
+    start = time.perf_counter()
+    handles = [open(path, "rb") for path in (path0, path1)]
+    try:
+        while drawn < line_count and \
+                (max_samples is None or samples < max_samples) and \
+                time.perf_counter() - start < time_budget:
+            position = rnd.randrange(drawn, line_count)
+            line = swapped.pop(position, position)
+            if position != drawn:
+                swapped[position] = swapped.pop(drawn, drawn)
+            drawn += 1
+            rows = [_read_record(comparer, index.find(fh, line), encoding)
+                    for index, fh in zip(indices, handles)]
+            if rows[0] is None or rows[1] is None:
+                skipped += 1
+                continue
+
+            before = [totals[level] for level in _LEVELS]
+            difference = comparer.compare_string_lists(rows[0], rows[1], line)
+            samples += 1
+            if difference is not None and \
+                    (first_difference is None or line < first_difference[0]):
+                first_difference = line, difference
+            if difference is not None and difference.field_index == -1:
+                mismatched += 1
+                continue
+            counts = [totals[level] - count
+                      for level, count in zip(_LEVELS, before)]
+            x = sum(counts)
+            sum_x += x
+            sum_xx += x * x
+            for i, y in enumerate(counts):
+                sum_y[i] += y
+                sum_yy[i] += y * y
+                sum_xy[i] += x * y
+
+            if samples >= MIN_SAMPLES and all(
+                    _within(precision, *_interval(
+                        samples - mismatched, sum_x, sum_xx,
+                        sum_y[i], sum_yy[i], sum_xy[i]))
+                    for i in range(level_count)):
+                precision_reached = True
+                break
+    finally:
+        for fh in handles:
+            fh.close()
+
+    compared = samples - mismatched
+    exact = drawn == line_count and sum_x > 0
+    estimates = {}
+    for i, level in enumerate(_LEVELS):
+        if exact:
+            proportion = sum_y[i] / sum_x
+            estimates[level] = Estimate(proportion, proportion, proportion)
+        else:
+            estimates[level] = Estimate(*_interval(
+                compared, sum_x, sum_xx, sum_y[i], sum_yy[i], sum_xy[i]))
+    return SampleResult(
+        estimates=estimates, samples=samples, skipped=skipped,
+        mismatched=mismatched,
+        line_counts=[index.line_count for index in indices],
+        first_difference=None if first_difference is None else
+        comparer._describe_difference(*first_difference),
+        precision_reached=precision_reached or exact,
+        seconds=time.perf_counter() - start)
+
+
+def _interval(n: int, sum_x: int, sum_xx: int, sum_y: int, sum_yy: int,
+              sum_xy: int) -> Tuple[float, float, float]:
+    """
+    Estimate a proportion as the ratio sum_y / sum_x from n samples.
+
+    The confidence interval is the Wilson score interval for the
+    effective number of independent trials implied by the variance of
+    the ratio estimator, which lies between the number of samples (if
+    the fields of a line always agree) and the number of fields. If the
+    variance is zero, as for a level absent from the sample, the number
+    of samples is used, so that such levels don't get intervals of zero
+    width.
+
+    :return: the estimated proportion and the bounds of its interval
+    """
+    if n < 2 or sum_x == 0:
+        return math.nan, 0.0, 1.0
+    ratio = sum_y / sum_x
+    mean_x = sum_x / n
+    # The sum of squared residuals (y - ratio * x)²
+    residuals = max(0.0, sum_yy - 2 * ratio * sum_xy + ratio * ratio * sum_xx)
+    variance = residuals / (n - 1) / n / (mean_x * mean_x)
+    trials = n if variance == 0 else \
+        min(sum_x, max(n, ratio * (1 - ratio) / variance))
+    z2 = Z * Z
+    centre = (ratio + z2 / (2 * trials)) / (1 + z2 / trials)
+    half_width = Z * math.sqrt(ratio * (1 - ratio) / trials +
+                               z2 / (4 * trials * trials)) / (1 + z2 / trials)
+    return ratio, max(0.0, centre - half_width), \
+        min(1.0, centre + half_width)
+
+
+def _within(precision: float, proportion: float, low: float,
+            high: float) -> bool:
+    return proportion - low <= precision and high - proportion <= precision
+
+
+def _read_record(comparer: DecimalComparer, line: bytes, encoding: str):
+    """
+    :return: the fields of a line, or None if it isn't a complete record
+    """
+    # If the reader asks for the empty second line, the record continues
+    # beyond the end of this one.
+    reader = comparer._reader([line.decode(encoding), ""])
+    try:
+        fields = next(reader)
+    except csv.Error:
+        return None
+    return fields if reader.line_num == 1 else None
+
+
+class _LineIndex:
+    """
+    A sparse index of the line breaks in a file, for finding lines by
+    number.
+    """
+
+    def __init__(self, path: str, block_size: int = INDEX_BLOCK_SIZE):
+        self.block_size = block_size
+        self.breaks = array("q", [0])
+        """the number of line breaks before the start of each block"""
+        breaks = 0
+        last = b""
+        with open(path, "rb") as fh:
+            while True:
+                block = fh.read(block_size)
+                if not block:
+                    break
+                breaks += block.count(b"\n")
+                self.breaks.append(breaks)
+                last = block
+        self.line_count = breaks + (1 if last and
+                                    not last.endswith(b"\n") else 0)
+        """the number of lines in the file"""
+
+    def find(self, fh: BinaryIO, line: int) -> bytes:
+        """
+        Read a line from the indexed file.
+
+        :param fh: the file, opened in binary mode
+        :param line: the index of a line, counting from 0
+        :return: the line, including its terminator
+        """
+        if line == 0:
+            fh.seek(0)
+            return fh.readline()
+        # The line starts after the line-th line break, which lies in
+        # the last block starting with fewer breaks before it.
+        block = bisect.bisect_left(self.breaks, line) - 1
+        position = block * self.block_size
+        fh.seek(position)
+        data = fh.read(self.block_size)
+        offset = -1
+        for _ in range(line - self.breaks[block]):
+            offset = data.index(b"\n", offset + 1)
+        fh.seek(position + offset + 1)
+        return fh.readline()
+
+
+def format_estimates(result: SampleResult) -> str:
+    """
+    :param result: the result of a sampled comparison
+    :return: a human-readable table of the estimated proportions
+    """
+    sampled_all = result.samples + result.skipped == min(result.line_counts)
+    lines = ["Sampled {} of {} lines in {:.1f} s ({})".format(
+        result.samples, min(result.line_counts), result.seconds,
+        "every line sampled" if sampled_all
+        else "target precision reached" if result.precision_reached
+        else "stopped before reaching target precision")]
+    if result.skipped:
+        lines.append("{} sampled lines skipped as incomplete records".format(
+            result.skipped))
+    if result.mismatched:
+        lines.append("{} sampled lines with differing numbers of "
+                     "fields".format(result.mismatched))
+    lines.append("{:>9s} {:>19s}".format("estimate", "95% interval"))
+    for level in _LEVELS:
+        estimate = result.estimates[level]
+        lines.append("{:8.2f}% [{:6.2f}%, {:6.2f}%] {}".format(
+            100 * estimate.proportion, 100 * estimate.low,
+            100 * estimate.high, level.description))
+    return "\n".join(lines)
@@ -0,0 +1,293 @@
+"""
+A server comparing pairs of delimited files for many short-lived clients.
+
+This module is part of comparedecimal, and provides the command-line
+tools comparecsv-server and comparecsv-client. Running comparecsv on a
+small file takes far longer to start the interpreter and import modules
+than to compare the file, so a pipeline comparing many small files can
+instead start one server and send it requests over a Unix socket.
+
+The protocol is line-based JSON. A client sends one request per line,
+each an object with the members
+
+file1, file2
+  the paths of the files to compare (relative paths are resolved by the
+  server, so absolute paths should be used)
+delimiter, threshold, fail_fast
+  optional settings as for comparecsv (by default ",", 0.01, and false)
+id
+  an optional value which is copied to the result
+
+and closes its side of the connection when it has sent its requests. The
+server replies with one line per request, in the order in which the
+comparisons finish, each an object with the members id, totals (a count
+for each equality level, keyed by its description), and first_difference
+(as printed by comparecsv, or null if the files contain the same values),
+or with the members id and error if the request failed.
+
+Comparisons are run by a pool of worker processes, each of which keeps a
+DecimalComparer for each of the combinations of settings it has used most
+recently, so the cache of parsed strings stays warm between requests.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import errno
+import functools
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from .comparedecimal import DecimalComparer, EqualityLevel
+from .compressed import open_lines
+
+
+def default_socket_path() -> str:
+    """
+    :return: the path of the socket used if none is given: comparecsv.sock
+             in the user's runtime directory if there is one, or else in
+             the temporary directory with the user ID in its name
+    """
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_directory:
+        return os.path.join(runtime_directory, "comparecsv.sock")
+    return os.path.join(tempfile.gettempdir(),
+                        "comparecsv-{}.sock".format(os.getuid()))
+
+
+def main():
+    """
+    Run a comparison server until interrupted.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare pairs of delimited files sent over a Unix "
+                    "socket",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--socket", type=str,
+                        default=default_socket_path(),
+                        help="path of the socket to listen on")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    args = parser.parse_args()
+
+    def interrupt(signal_number, frame):
+        raise KeyboardInterrupt
+
+    # Shut down cleanly, removing the socket, when terminated.
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        server = ComparisonServer(args.socket, args.jobs)
+    except OSError as error:
+        parser.error(str(error))
+    with server:
+        print("Listening on", args.socket, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def client_main():
+    """
+    Send comparison requests to a server and write the results to the
+    standard output as JSON lines.
+
+    Pairs of files are taken from the command line; if none are given,
+    requests are read from the standard input as JSON lines.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        description="Send pairs of delimited files to comparecsv-server "
+                    "for comparison",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--socket", type=str,
+                        default=default_socket_path(),
+                        help="path of the server's socket")
+    parser.add_argument("-d", "--delimiter", type=str, default=",",
+                        help="delimiter between fields")
+    parser.add_argument("-t", "--threshold", type=float, default=0.01,
+                        help="threshold for considering values \"close\", "
+                             "as a decimal fraction of the smaller value")
+    parser.add_argument("FILE", type=str, nargs="*",
+                        help="files to compare, in pairs")
+    args = parser.parse_args()
+    if len(args.FILE) % 2 != 0:
+        parser.error("files must be given in pairs")
+
+    if args.FILE:
+        separator = bytes(args.delimiter, "utf-8").decode("unicode_escape")
+        requests = [{"id": i, "file1": os.path.abspath(path0),
+                     "file2": os.path.abspath(path1),
+                     "delimiter": separator, "threshold": args.threshold}
+                    for i, (path0, path1)
+                    in enumerate(zip(args.FILE[::2], args.FILE[1::2]))]
+    else:
+        requests = (json.loads(line) for line in sys.stdin if line.strip())
+    for result in send_requests(requests, args.socket):
+        print(json.dumps(result), flush=True)
+
+
+def send_requests(requests: Iterable[dict],
+                  socket_path: Optional[str] = None) -> Iterator[dict]:
+    """
+    Send comparison requests to a server and yield the results.
+
+    :param requests: request objects, as described in the module
+           documentation
+    :param socket_path: the path of the server's socket, or None for
+           the default path
+    :return: an iterator over the results, in the order in which the
+             server sends them
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or default_socket_path())
+        with connection.makefile("w") as writer:
+            for request in requests:
+                writer.write(json.dumps(request) + "\n")
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile("r") as reader:
+            for line in reader:
+                yield json.loads(line)
+
+
+class ComparisonServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    """
+    A server which compares pairs of files for clients connecting to a
+    Unix socket, using a pool of worker processes.
+
+    Each connection is handled by its own thread, which submits the
+    requests to the pool as they arrive. Closing the server shuts down
+    the pool and removes the socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, jobs: Optional[int] = None):
+        """
+        :param socket_path: the path of the socket to listen on; a stale
+               socket left at this path by a server which has exited is
+               replaced
+        :param jobs: the number of worker processes, or None for the
+               number of processors
+        :raises OSError: if another server is listening on the socket
+        """
+        if os.path.exists(socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(socket_path)
+                except ConnectionRefusedError:
+                    os.unlink(socket_path)
+                else:
+                    raise OSError(errno.EADDRINUSE,
+                                  "Another server is listening on",
+                                  socket_path)
+        self.socket_path = socket_path
+        self.executor = ProcessPoolExecutor(max_workers=jobs)
+        super().__init__(socket_path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # Results are passed back to this thread to be sent, rather than
+        # sent by the future's callback, so that only one thread writes
+        # to the connection and a slow client can't stall the pool.
+        results = queue.Queue()  # type: queue.Queue
+        submitted = 0
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                identifier = request.get("id")
+                arguments = (request["file1"], request["file2"],
+                             request.get("delimiter", ","),
+                             float(request.get("threshold", 0.01)),
+                             bool(request.get("fail_fast", False)))
+            except (ValueError, KeyError, TypeError, AttributeError) as error:
+                results.put({"id": None, "error": "Invalid request: {}".format(
+                    error)})
+                submitted += 1
+                continue
+            future = self.server.executor.submit(_compare_files, *arguments)
+            future.add_done_callback(
+                lambda done, identifier=identifier:
+                results.put(_result(identifier, done)))
+            submitted += 1
+        for _ in range(submitted):
+            result = results.get()
+            try:
+                self.wfile.write((json.dumps(result) + "\n").encode())
+                self.wfile.flush()
+            except OSError:
+                # The client has gone; its other results are discarded.
+                pass
+
+
+def _result(identifier, future: Future) -> dict:
+    try:
+        totals, first_difference = future.result()
+    except Exception as error:
+        return {"id": identifier, "error": str(error)}
+    return {"id": identifier, "totals": totals,
+            "first_difference": first_difference}
+
+
+# The number of warm comparers kept by each worker process
+COMPARER_CACHE_SIZE = 16
+
+
+@functools.lru_cache(maxsize=COMPARER_CACHE_SIZE)
+def _comparer(separator: str, closeness_threshold: float,
+              fail_fast: bool) -> DecimalComparer:
+    """
+    :return: a comparer with the given settings, reused for later requests
+             with the same settings until COMPARER_CACHE_SIZE comparers
+             with other settings have been used more recently
+    """
+    return DecimalComparer(separator=separator,
+                           closeness_threshold=closeness_threshold,
+                           fail_fast=fail_fast)
+
+
+def _compare_files(path0: str, path1: str, separator: str,
+                   closeness_threshold: float, fail_fast: bool) ->\
+        Tuple[Dict[str, int], Optional[str]]:
+    comparer = _comparer(separator, closeness_threshold, fail_fast)
+    comparer.totals = {level: 0 for level in EqualityLevel}
+    with open_lines(path0) as fh0, open_lines(path1) as fh1:
+        first_difference = comparer.compare_streams(fh0, fh1)
+    return {level.description: count for level, count
+            in sorted(comparer.totals.items(),
+                      key=lambda item: item[0].value)}, first_difference
@@ -0,0 +1,230 @@
+"""
+Vectorized comparison of whole columns of decimal strings using NumPy.
+
+This module is part of comparedecimal. It requires NumPy, which is an
+optional dependency of the package; it is normally used via
+DecimalComparer.compare_columns rather than imported directly.
+
+The function classify_columns reproduces DecimalComparer._compare_strings
+for every pair of strings in two columns, but performs the parsing and
+the numerical comparison as array operations. Only pairs which are
+outside the scope of the array code -- strings which are not plain
+decimal literals (e.g. "foo", "nan", " 1") or which have more
+significant figures than fit in a 64-bit integer -- are handed back to
+_compare_strings one at a time.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Dict, Sequence
+
+import numpy as np
+
+from .comparedecimal import DecimalComparer, EqualityLevel
+
+# Padded mantissas are multiplied by up to 10 in the power-of-ten
+# straddle correction, so 17 significant figures is the most that can be
+# handled without overflowing an int64.
+_MAX_SIG_FIGS = 17
+_BLOCK_SIZE = 8192
+_POWERS_OF_TEN = 10 ** np.arange(_MAX_SIG_FIGS + 1, dtype=np.int64)
+
+_UNEQUAL = EqualityLevel.UNEQUAL.value
+_CLOSE = EqualityLevel.CLOSE.value
+_COMPATIBLE = EqualityLevel.COMPATIBLE.value
+_NUMERICALLY_EQUAL = EqualityLevel.NUMERICALLY_EQUAL.value
+_IDENTICAL = EqualityLevel.IDENTICAL.value
+
+
+def classify_columns(comparer: DecimalComparer,
+                     column0: Sequence[str],
+                     column1: Sequence[str]) -> np.ndarray:
+    """
+    Compare two columns of strings element by element.
+
+    The result for each pair is the same as that of
+    ``comparer._compare_strings``. The comparer's ``totals`` attribute is
+    not updated.
+
+    :param comparer: the comparer supplying the closeness threshold, and
+           used for any pairs which can't be handled by array operations
+    :param column0: a sequence of strings
+    :param column1: another sequence of strings, of the same length
+    :return: an int8 array containing the ``EqualityLevel`` value
+           for each pair of strings
+    """
+    strings0 = np.asarray(column0, dtype=str)
+    strings1 = np.asarray(column1, dtype=str)
+    if strings0.shape != strings1.shape or strings0.ndim != 1:
+        raise ValueError("Columns must be one-dimensional and of equal length")
+
+    levels = np.full(strings0.shape, _IDENTICAL, dtype=np.int8)
+    differing = np.flatnonzero(strings0 != strings1)
+    if len(differing) == 0:
+        return levels
+
+    # Working in blocks keeps the code-point matrices in cache.
+    for start in range(0, len(differing), _BLOCK_SIZE):
+        block = differing[start:start + _BLOCK_SIZE]
+        levels[block] = _classify_block(comparer,
+                                        strings0[block], strings1[block])
+    return levels
+
+
+def _classify_block(comparer: DecimalComparer,
+                    strings0: np.ndarray, strings1: np.ndarray) -> np.ndarray:
+    levels = np.empty(strings0.shape, dtype=np.int8)
+    valid0, digits0, sig_figs0 = _parse_literals(strings0)
+    valid1, digits1, sig_figs1 = _parse_literals(strings1)
+    vectorizable = valid0 & valid1
+
+    # Any pair with a string not in plain decimal form is left to the
+    # scalar code, which will also give the correct answer for the
+    # unparseable and non-finite cases.
+    for i in np.flatnonzero(~vectorizable):
+        levels[i] = comparer._compare_strings(
+            str(strings0[i]), str(strings1[i])).value
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        levels[vectorizable] = _classify_numbers(
+            comparer.closeness_threshold,
+            strings0[vectorizable].astype(np.float64),
+            strings1[vectorizable].astype(np.float64),
+            digits0[vectorizable], digits1[vectorizable],
+            sig_figs0[vectorizable], sig_figs1[vectorizable])
+    return levels
+
+
+def count_levels(levels: np.ndarray) -> Dict[EqualityLevel, int]:
+    """
+    Count the occurrences of each equality level in an array of levels.
+
+    :param levels: an array of ``EqualityLevel`` values, as returned by
+           classify_columns
+    :return: a dictionary mapping each ``EqualityLevel`` to its count
+    """
+    counts = np.bincount(levels, minlength=len(EqualityLevel) + 1)
+    return {level: int(counts[level.value]) for level in EqualityLevel}
+
+
+def _parse_literals(strings: np.ndarray):
+    """
+    Parse an array of strings as decimal literals.
+
+    A string is accepted only if it matches the regular expression used by
+    DecimalComparer._extract_mantissa_digits and has at most
+    _MAX_SIG_FIGS significant figures. The parsing is done on a matrix
+    of the strings' code points, one row per string, so that no
+    per-string Python code is run.
+
+    :return: a tuple of three arrays: a boolean array of accepted strings,
+             the mantissa digits as int64, and the number of significant
+             figures
+    """
+    if strings.dtype.itemsize == 0:
+        strings = strings.astype("<U1")
+    codes = strings.view(np.uint32).reshape(len(strings), -1)
+    columns = np.arange(codes.shape[1])[np.newaxis, :]
+
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    is_sign = (codes == ord("+")) | (codes == ord("-"))
+    is_point = codes == ord(".")
+    is_exponent = (codes == ord("e")) | (codes == ord("E"))
+    present = codes != 0
+    lengths = present.sum(axis=1)
+    # NumPy pads strings with NULs, so an embedded NUL would make
+    # the lengths wrong; such strings are not numbers in any case.
+    valid = (present == (columns < lengths[:, np.newaxis])).all(axis=1)
+
+    has_exponent = is_exponent.any(axis=1)
+    valid &= is_exponent.sum(axis=1) <= 1
+    exponent_pos = np.where(has_exponent, is_exponent.argmax(axis=1), lengths)
+    in_mantissa = columns < exponent_pos[:, np.newaxis]
+
+    # Mantissa: optional sign, then digits with at most one point, and
+    # at least one digit after the point (or at all, if there's no point).
+    mantissa_start = is_sign[:, 0].astype(np.int64)
+    in_unsigned_mantissa = in_mantissa & \
+        (columns >= mantissa_start[:, np.newaxis])
+    valid &= ~(in_unsigned_mantissa & ~is_digit & ~is_point).any(axis=1)
+    mantissa_points = is_point & in_mantissa
+    valid &= mantissa_points.sum(axis=1) <= 1
+    point_pos = np.where(mantissa_points.any(axis=1),
+                         mantissa_points.argmax(axis=1), mantissa_start - 1)
+    valid &= exponent_pos - point_pos > 1
+
+    # Exponent: optional sign, then at least one digit.
+    after_exponent = np.minimum(exponent_pos + 1, codes.shape[1] - 1)
+    exponent_sign = has_exponent & (exponent_pos + 1 < lengths) & \
+        np.take_along_axis(is_sign, after_exponent[:, np.newaxis],
+                           axis=1)[:, 0]
+    exponent_start = exponent_pos + 1 + exponent_sign
+    in_exponent_digits = (columns >= exponent_start[:, np.newaxis]) & \
+        (columns < lengths[:, np.newaxis])
+    valid &= ~(in_exponent_digits & ~is_digit).any(axis=1)
+    valid &= ~has_exponent | (lengths > exponent_start)
+
+    # Significant digits run from the first non-zero mantissa digit.
+    nonzero_digits = is_digit & in_mantissa & (codes != ord("0"))
+    first_nonzero = np.where(nonzero_digits.any(axis=1),
+                             nonzero_digits.argmax(axis=1), codes.shape[1])
+    significant = is_digit & in_mantissa & \
+        (columns >= first_nonzero[:, np.newaxis])
+    sig_figs = significant.sum(axis=1)
+    valid &= sig_figs <= _MAX_SIG_FIGS
+
+    places = np.cumsum(significant[:, ::-1], axis=1)[:, ::-1] - 1
+    places = np.clip(places, 0, _MAX_SIG_FIGS)
+    digit_values = np.where(significant, codes.astype(np.int64) - ord("0"), 0)
+    digits = (digit_values * _POWERS_OF_TEN[places]).sum(axis=1)
+    return valid, digits, sig_figs.astype(np.int64)
+
+
+def _classify_numbers(closeness_threshold: float,
+                      floats0: np.ndarray, floats1: np.ndarray,
+                      digits0: np.ndarray, digits1: np.ndarray,
+                      sig_figs0: np.ndarray, sig_figs1: np.ndarray) ->\
+        np.ndarray:
+    # Each step mirrors a decision in DecimalComparer._compare_strings; see
+    # the comments there for the reasoning behind them.
+    positives0 = np.abs(floats0)
+    positives1 = np.abs(floats1)
+
+    max_sig_figs = np.maximum(sig_figs0, sig_figs1)
+    min_sig_figs = np.minimum(sig_figs0, sig_figs1)
+    max_diff = 10 ** (max_sig_figs - min_sig_figs) // 2
+    ints0 = digits0 * 10 ** (max_sig_figs - sig_figs0)
+    ints1 = digits1 * 10 ** (max_sig_figs - sig_figs1)
+
+    ints0 = np.where((ints0 * 9 < ints1) & (positives0 * 9 >= positives1),
+                     ints0 * 10, ints0)
+    ints1 = np.where((ints1 * 9 < ints0) & (positives1 * 9 >= positives0),
+                     ints1 * 10, ints1)
+    actual_diff = np.abs(ints0 - ints1)
+
+    close = np.maximum(positives0, positives1) <= \
+        np.minimum(positives0, positives1) * (1 + closeness_threshold)
+
+    return np.select(
+        [floats0 == floats1,
+         np.copysign(floats0, floats1) != floats0,
+         (positives0 >= positives1 * 10) | (positives1 >= positives0 * 10),
+         actual_diff == 0,
+         actual_diff <= max_diff,
+         close],
+        [_NUMERICALLY_EQUAL, _UNEQUAL, _UNEQUAL,
+         _NUMERICALLY_EQUAL, _COMPATIBLE, _CLOSE],
+        default=_UNEQUAL).astype(np.int8)
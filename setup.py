@@ -25,7 +25,12 @@ setuptools.setup(
                  "Programming Language :: Python :: 3",
                  "Intended Audience :: Science/Research"
                  ],
+    extras_require={"numpy": ["numpy"], "zstd": ["zstandard"],
+                    "arrow": ["pyarrow", "numpy"]},
     entry_points={"console_scripts":
-                  ["comparecsv=comparedecimal.comparedecimal:main"]
+                  ["comparecsv=comparedecimal.comparedecimal:main",
+                   "comparecsv-dedupe=comparedecimal.dedupe:main",
+                   "comparecsv-server=comparedecimal.server:main",
+                   "comparecsv-client=comparedecimal.server:client_main"]
                   }
 )
@@ -0,0 +1,65 @@
+"""
+Helpers shared by the tests.
+
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import EqualityLevel
+import os
+import tempfile
+import unittest
+
+
+class TempDirTestCase(unittest.TestCase):
+    """A test case with a temporary directory for its files."""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _write(self, name, data):
+        """
+        Write a file in the temporary directory.
+
+        :param name: the name of the file
+        :param data: the contents of the file: bytes, a string, or a list
+               of lines, written without newline translation
+        :return: the path of the file
+        """
+        path = os.path.join(self.tempdir.name, name)
+        if isinstance(data, bytes):
+            with open(path, "wb") as fh:
+                fh.write(data)
+        else:
+            with open(path, "w", newline="") as fh:
+                fh.write("".join(data))
+        return path
+
+
+def summarize(statistics):
+    """
+    :param statistics: a ColumnStatistics object
+    :return: a list of the counts, largest relative difference, and first
+             unequal line for each column, for comparing two objects
+    """
+    return [([statistics.count(column, level) for level in EqualityLevel],
+             statistics.max_relative_difference(column),
+             statistics.first_unequal_line(column))
+            for column in range(statistics.column_count)]
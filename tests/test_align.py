@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import align as align_module
+from comparedecimal.align import Block, align, compare_aligned
+import io
+import random
+import unittest
+from unittest import mock
+
+
+def _compare(lines0, lines1, **kwargs):
+    comparer = DecimalComparer(**kwargs)
+    result = compare_aligned(comparer, io.StringIO("".join(lines0)),
+                             io.StringIO("".join(lines1)))
+    return result, comparer
+
+
+class TestAlign(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(42)
+        self.lines = ["{},{}\n".format(i, rnd.random()) for i in range(100)]
+
+    def test_same_as_streams_without_insertions(self):
+        lines1 = ["{},{:.4f}\n".format(i, float(line.split(",")[1]))
+                  if i % 7 == 0 else line
+                  for i, line in enumerate(self.lines)]
+        lines1[50] = "50,2\n"
+        result, comparer = _compare(self.lines, lines1, per_column=True)
+        streamed = DecimalComparer(per_column=True)
+        expected = streamed.compare_line_lists(self.lines, lines1)
+        self.assertEqual([], result.blocks)
+        self.assertEqual(expected, result.first_difference)
+        self.assertEqual(streamed.totals, comparer.totals)
+        self.assertEqual(
+            streamed.column_statistics.count(1, EqualityLevel.IDENTICAL),
+            comparer.column_statistics.count(1, EqualityLevel.IDENTICAL))
+
+    def test_inserted_and_deleted_blocks(self):
+        lines1 = self.lines[:10] + ["x,1\n", "y,2\n"] + self.lines[10:40] + \
+            self.lines[45:]
+        result, comparer = _compare(self.lines, lines1)
+        self.assertEqual([Block(10, 10, 10, 12), Block(40, 45, 42, 42)],
+                         result.blocks)
+        self.assertIsNone(result.first_difference)
+        self.assertEqual(2 * 95, comparer.totals[EqualityLevel.IDENTICAL])
+
+    def test_changed_precision_next_to_deletion(self):
+        # The changed rows have no exact anchors, so they are aligned by
+        # their normalized forms.
+        lines1 = self.lines[:20] + \
+            ["{},{:.3f}\n".format(i, float(self.lines[i].split(",")[1]))
+             for i in range(21, 24)] + self.lines[24:]
+        result, comparer = _compare(self.lines, lines1)
+        self.assertEqual([Block(20, 21, 20, 20)], result.blocks)
+        self.assertIsNone(result.first_difference)
+        self.assertEqual(0, comparer.totals[EqualityLevel.UNEQUAL])
+
+    def test_first_difference_uses_first_file_line(self):
+        lines1 = ["new,0\n"] + self.lines[:30] + ["30,-1\n"] + self.lines[31:]
+        result, _ = _compare(self.lines, lines1)
+        self.assertEqual([Block(0, 0, 0, 1)], result.blocks)
+        self.assertTrue(result.first_difference.startswith(
+            "On line 31: field 2 differs"))
+
+    def test_moved_block(self):
+        lines1 = self.lines[:10] + self.lines[60:70] + self.lines[10:60] + \
+            self.lines[70:]
+        result, comparer = _compare(self.lines, lines1)
+        deleted = sum(block.end0 - block.start0 for block in result.blocks)
+        inserted = sum(block.end1 - block.start1 for block in result.blocks)
+        self.assertEqual((10, 10), (deleted, inserted))
+        self.assertEqual(0, comparer.totals[EqualityLevel.UNEQUAL])
+
+    def test_fail_fast_skips_comparison(self):
+        result, comparer = _compare(self.lines, self.lines[1:],
+                                    fail_fast=True)
+        self.assertEqual([Block(0, 1, 0, 0)], result.blocks)
+        self.assertEqual(0, sum(comparer.totals.values()))
+
+    def test_align_random_edits(self):
+        rnd = random.Random(1)
+        for _ in range(50):
+            hashes0 = [rnd.randrange(30) for _ in range(rnd.randrange(40))]
+            hashes1 = list(hashes0)
+            for _ in range(rnd.randrange(5)):
+                position = rnd.randrange(len(hashes1) + 1)
+                if rnd.random() < 0.5:
+                    del hashes1[position:position + rnd.randrange(1, 4)]
+                else:
+                    hashes1[position:position] = [rnd.randrange(30)]
+            blocks, gaps = align(hashes0, hashes1)
+            # Blocks and gaps must tile both sequences in order, with
+            # equal hashes in between.
+            position0 = position1 = 0
+            for block in sorted(blocks + gaps):
+                self.assertEqual(hashes0[position0:block.start0],
+                                 hashes1[position1:block.start1])
+                self.assertTrue(block.start0 == block.end0 or
+                                block.start1 == block.end1 or
+                                block in gaps)
+                position0, position1 = block.end0, block.end1
+            self.assertEqual(hashes0[position0:], hashes1[position1:])
+
+    def test_range_larger_than_anchor_table(self):
+        rnd = random.Random(3)
+        lines = ["{},{}\n".format(i, rnd.random()) for i in range(2000)]
+        lines1 = lines[:100] + ["x,1\n"] + lines[100:900] + \
+            lines[903:1500] + ["y,2\n", "z,3\n"] + lines[1500:]
+        expected = [Block(100, 100, 100, 101), Block(900, 903, 901, 901),
+                    Block(1500, 1500, 1498, 1500)]
+        with mock.patch.object(align_module, "ANCHOR_TABLE_SIZE", 64):
+            result, comparer = _compare(lines, lines1)
+        self.assertEqual(expected, result.blocks)
+        self.assertEqual(2 * 1997, comparer.totals[EqualityLevel.IDENTICAL])
+        with mock.patch.object(align_module, "ANCHOR_TABLE_SIZE", 64):
+            anchors = align_module._unique_anchors(
+                range(0, 1800, 3), 0, 600, range(0, 1800, 3), 0, 600)
+        # Only hashes which are multiples of the stride 19 are candidates.
+        self.assertEqual([(i, i) for i in range(0, 600, 19)], anchors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import columnar
+import decimal
+import os
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TestDetectFormat(unittest.TestCase):
+
+    def test_text(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "0.csv")
+            with open(path, "w") as fh:
+                fh.write("PAR,1\n")
+            self.assertIsNone(columnar.detect_format(path))
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow not installed")
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.table = pyarrow.table({
+            "x": pyarrow.array([1.5, 0.0, 2.0, None, float("nan")]),
+            "n": pyarrow.array([1, 2, 3, 4, 5]),
+            "s": pyarrow.array(["a", "b", "c", "", None]),
+            "d": pyarrow.array([decimal.Decimal("1.50")] * 5,
+                               type=pyarrow.decimal128(5, 2)),
+            "f": pyarrow.array([0.1] * 5, type=pyarrow.float32()),
+        })
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tempdir.name, name)
+
+    def _write_arrow(self, name, table, stream=False):
+        path = self._path(name)
+        with pyarrow.OSFile(path, "wb") as fh:
+            writer = (pyarrow.ipc.new_stream if stream else
+                      pyarrow.ipc.new_file)(fh, table.schema)
+            writer.write_table(table)
+            writer.close()
+        return path
+
+    def _write_parquet(self, name, table):
+        path = self._path(name)
+        pyarrow.parquet.write_table(table, path)
+        return path
+
+    def _compare(self, path0, path1, **options):
+        comparer = DecimalComparer(**options)
+        result = columnar.compare_tables(comparer, path0, path1,
+                                         slice_rows=2)
+        return result, [comparer.totals[level] for level in EqualityLevel]
+
+    def test_formats(self):
+        arrow = self._write_arrow("0.arrow", self.table)
+        self.assertEqual("arrow", columnar.detect_format(arrow))
+        stream = self._write_arrow("0.arrows", self.table, stream=True)
+        self.assertEqual("arrow-stream", columnar.detect_format(stream))
+        parquet = self._write_parquet("0.parquet", self.table)
+        self.assertEqual("parquet", columnar.detect_format(parquet))
+        for path0, path1 in (arrow, stream), (stream, parquet):
+            self.assertEqual((None, [0, 0, 0, 0, 25]),
+                             self._compare(path0, path1))
+
+    def test_differences(self):
+        table = self.table.set_column(0, "x", pyarrow.array(
+            [1.5, -0.0, 2.1, None, float("nan")]))
+        self.assertEqual(
+            ("On line 3: field 1 differs (2.0, 2.1)", [1, 0, 0, 1, 23]),
+            self._compare(self._write_arrow("0.arrow", self.table),
+                          self._write_parquet("1.parquet", table)))
+
+    def test_text(self):
+        path = self._path("0.csv")
+        with open(path, "w") as fh:
+            fh.write("x,n,s,d,f\n1.50,1,a,1.5,0.1\n0,2,b,1.50,0.100\n"
+                     "2.0,3,c,1.5,0.1\n,4,,1.5,0.1\nnan,5,,1.5,0.1\n")
+        self.assertEqual(
+            (None, [0, 0, 0, 7, 18]),
+            self._compare(path, self._write_parquet("1.parquet", self.table)))
+        comparer = DecimalComparer(per_column=True, columns=[0])
+        self.assertIsNone(columnar.compare_tables(
+            comparer, path, self._write_parquet("1.parquet", self.table)))
+        statistics = comparer.column_statistics
+        self.assertEqual(
+            [0, 0, 0, 2, 3],
+            [statistics.count(0, level) for level in EqualityLevel])
+        self.assertEqual(1, statistics.column_count)
+
+    def test_numbers(self):
+        table0 = pyarrow.table({"x": pyarrow.array(
+            [1e18, 1.0, 2.0, 3.0, -1.0, 0.0, 5.0])})
+        table1 = pyarrow.table({"x": pyarrow.array(
+            [1.5e18, 1.0, 2.001, 30.0, 1.0, 1.0, 5.5])})
+        table2 = pyarrow.table({"x": pyarrow.array(
+            [10 ** 18, 1, 2, 3, -1, 0, 5])})
+        path0 = self._write_arrow("0.arrow", table0)
+        self.assertEqual(
+            ("On line 1: field 1 differs (1.0e+18, 1.5e+18)",
+             [5, 0, 1, 0, 1]),
+            self._compare(path0, self._write_arrow("1.arrow", table1)))
+        self.assertEqual(
+            (None, [0, 0, 0, 7, 0]),
+            self._compare(path0, self._write_arrow("2.arrow", table2)))
+
+    def test_text_slices(self):
+        path = self._path("0.csv")
+        with open(path, "w") as fh:
+            fh.write("x,y\n" + "".join("{},{}\n".format(i, i)
+                                       for i in range(5)))
+        path1 = self._path("1.csv")
+        with open(path1, "w") as fh:
+            fh.write("x,y\n" + "".join("{},{}\n".format(i, i)
+                                       for i in range(6)))
+        self.assertEqual(("Unequal numbers of lines (5, 6)", [0, 0, 0, 0, 10]),
+                         self._compare(path, path1))
+        with open(path1, "a") as fh:
+            fh.write("6\n")
+        with self.assertRaises(ValueError):
+            self._compare(path, path1)
+
+    def test_column_names(self):
+        names = ["x", "n", "s", "d", "f"]
+        self.assertEqual(names, columnar.column_names(
+            self._write_arrow("0.arrow", self.table)))
+        self.assertEqual(names, columnar.column_names(
+            self._write_arrow("0.arrows", self.table, stream=True)))
+        self.assertEqual(names, columnar.column_names(
+            self._write_parquet("0.parquet", self.table)))
+
+    def test_shapes(self):
+        arrow = self._write_arrow("0.arrow", self.table)
+        self.assertEqual(
+            "Unequal numbers of lines (5, 3)",
+            self._compare(arrow, self._write_arrow(
+                "1.arrow", self.table.slice(0, 3)))[0])
+        self.assertEqual(
+            "Differing numbers of columns (5, 4)",
+            self._compare(arrow, self._write_arrow(
+                "2.arrow", self.table.drop_columns(["f"])))[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,10 +19,25 @@ You should have received a copy of the GNU General Public License
 along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from comparedecimal import DecimalComparer, EqualityLevel, FieldDifference
+from comparedecimal import DecimalComparer, EqualityLevel, FieldDifference, \
+    ParsedLiteral, column_indices
+from tests import TempDirTestCase
+import os
+import subprocess
+import sys
 import unittest
 import random
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 class TestCompareCsv(unittest.TestCase):
 
@@ -93,6 +108,10 @@ class TestCompareCsv(unittest.TestCase):
         check(EqualityLevel.UNEQUAL, "2.0", "1.94")
         check(EqualityLevel.COMPATIBLE, "1.99", "1.995")
         check(EqualityLevel.COMPATIBLE, "0.05", "5.40000014e-02")
+        check(EqualityLevel.UNEQUAL, "1", "nan")
+        check(EqualityLevel.UNEQUAL, "nan", "1")
+        check(EqualityLevel.UNEQUAL, "nan", "NaN")
+        check(EqualityLevel.IDENTICAL, "nan", "nan")
 
         rnd = random.Random(42)
         for _ in range(10000):
@@ -103,6 +122,17 @@ class TestCompareCsv(unittest.TestCase):
             level = comparer.compare_strings(formatted0, formatted1)
             self.assertGreater(level.value, EqualityLevel.CLOSE.value)
 
+    def test_parsed_literal_cache(self):
+        comparer = DecimalComparer(",", 0.01, cache_size=2)
+        comparer.compare_strings("1.0", "1")
+        comparer.compare_strings("1.0", "1.00")
+        info = comparer.cache_info()
+        self.assertEqual((1, 3, 2, 2), (info.hits, info.misses,
+                                        info.maxsize, info.currsize))
+        self.assertEqual(ParsedLiteral(1.0, "10", 2),
+                         comparer._parse_literal("1.0"))
+        self.assertIsNone(comparer._parse_literal("foo"))
+
     def test_sig_figs(self):
         self.assertEqual(5, DecimalComparer._sig_figs("12.345"))
         self.assertEqual(3, DecimalComparer._sig_figs("0.0123"))
@@ -137,6 +167,247 @@ class TestCompareCsv(unittest.TestCase):
                 ["one\t\"two\"\tthree"]
             ))
 
+    def test_compare_streams_numerically_unequal(self):
+        self.assertEqual(
+            "On line 3: field 2 differs (3.1, 3.0)",
+            self.comparer.compare_streams(
+                iter(["same1\n", "same2\tsame2\n", "same\t3.1\t0\n"]),
+                iter(["same1\n", "same2\tsame2\n", "same\t3.0\t0.0\n"]),
+            ))
+        self._check_totals_counts(1, 0, 0, 1, 4)
+
+    def test_compare_streams_unequal_line_counts(self):
+        self.assertEqual(
+            "Unequal numbers of lines (3, 2)",
+            self.comparer.compare_streams(
+                iter(["a\n", "b\tc\n", "d\n"]),
+                iter(["a\n", "b\tx\n"]),
+            ))
+        self._check_totals_counts(1, 0, 0, 0, 2)
+
+    def test_compare_streams_quoted_newline(self):
+        self.assertIsNone(
+            self.comparer.compare_streams(
+                iter(["1\t\"two\n", "lines\"\n", "3\n"]),
+                iter(["1.0\t\"two\n", "lines\"\n", "3\n"]),
+            ))
+        self._check_totals_counts(0, 0, 0, 1, 2)
+
+    def test_count_fields(self):
+        comparer = DecimalComparer(",")
+        self.assertEqual(3, comparer._count_fields("a, b,c\n"))
+        self.assertEqual(2, comparer._count_fields("a,\r\n"))
+        self.assertEqual(0, comparer._count_fields("\n"))
+        self.assertEqual(1, comparer._count_fields(" \n"))
+        self.assertEqual(2, comparer._count_fields("\"a,b\", \"c\"\"\"\n"))
+        self.assertIsNone(comparer._count_fields("a,\"b\n"))
+        self.assertIsNone(comparer._count_fields("a\rb\n"))
+
+    def test_compare_streams_identical_lines_totals(self):
+        lines = ["1,\"2,3\",4\n", "\n", "5, 6\n", "\"7\n", "8\",9\n"]
+        self.comparer = DecimalComparer(",")
+        self.assertIsNone(self.comparer.compare_streams(lines, lines))
+        self._check_totals_counts(0, 0, 0, 0, 7)
+
+    def test_compare_streams_fail_fast(self):
+        comparer = DecimalComparer(",", fail_fast=True)
+        lines1 = iter(["1,2\n", "3,4\n", "5,6\n", "7,8\n"])
+        self.assertEqual(
+            "On line 2: field 1 differs (9, 3)",
+            comparer.compare_streams(
+                iter(["1,2\n", "9,4\n", "5,6\n", "7,8\n"]), lines1))
+        self.assertEqual("5,6\n", next(lines1))
+        self.assertEqual(1, comparer.totals[EqualityLevel.UNEQUAL])
+        self.assertEqual(2, comparer.totals[EqualityLevel.IDENTICAL])
+
+    def test_compare_streams_fail_fast_line_counts(self):
+        comparer = DecimalComparer(",", fail_fast=True)
+        lines0 = iter(["1\n", "2\n", "3\n", "4\n"])
+        self.assertEqual(
+            "Unequal numbers of lines (at least 2, 1)",
+            comparer.compare_streams(lines0, iter(["1\n"])))
+        self.assertEqual("3\n", next(lines0))
+
+    def test_column_statistics(self):
+        comparer = DecimalComparer(",", 0.01, per_column=True)
+        comparer.compare_streams(
+            ["a,1,2\n", "a,1,2\n", "b,1.01,3\n", "c,1.5\n"],
+            ["a,1,2\n", "a,1.0,2\n", "b,1.0,4\n", "c,1.5\n"])
+        statistics = comparer.column_statistics
+        self.assertEqual(3, statistics.column_count)
+        self.assertEqual(
+            [0, 0, 0, 0, 4],
+            [statistics.count(0, level) for level in EqualityLevel])
+        self.assertEqual(
+            [0, 0, 1, 1, 2],
+            [statistics.count(1, level) for level in EqualityLevel])
+        self.assertEqual(
+            [1, 0, 0, 0, 2],
+            [statistics.count(2, level) for level in EqualityLevel])
+        self.assertIsNone(statistics.first_unequal_line(1))
+        self.assertEqual(3, statistics.first_unequal_line(2))
+        self.assertAlmostEqual(0.01, statistics.max_relative_difference(1))
+        self.assertAlmostEqual(1 / 3, statistics.max_relative_difference(2))
+
+    def test_columns(self):
+        lines0 = ["a,1,2,x\n", "b, 1,3,y\n", "c,\"1\",4,z\n", "d,1\n",
+                  "e,1,5,\"p\nq\"\n"]
+        lines1 = ["a,1,2,x\n", "b,1.0,4,y\n", "c,1.0,4,w\n", "d,2\n",
+                  "e,1,5,\"p\nr\"\n"]
+        for columns, exclude_columns, expected in (
+                ([1], None, [1, 0, 0, 2, 2]),
+                ([1, 2, 7], [2], [1, 0, 0, 2, 2]),
+                (None, [0, 2, 3], [1, 0, 0, 2, 2]),
+                ([3, 0], None, [2, 0, 0, 0, 7])):
+            comparer = DecimalComparer(",", columns=columns,
+                                       exclude_columns=exclude_columns)
+            differences = [comparer.compare_streams([line0], [line1])
+                           for line0, line1 in zip(lines0, lines1)]
+            if columns == [3, 0]:
+                self.assertEqual(
+                    [None, None, "On line 1: field 4 differs (z, w)", None,
+                     "On line 1: field 4 differs (p\nq, p\nr)"],
+                    differences)
+            else:
+                self.assertEqual(
+                    [None, None, None, "On line 1: field 2 differs (1, 2)",
+                     None], differences)
+            self.assertEqual(expected, [comparer.totals[level]
+                                        for level in EqualityLevel])
+
+    def test_columns_field_counts(self):
+        comparer = DecimalComparer(",", columns=[0])
+        self.assertEqual("Differing numbers of fields on line 1",
+                         comparer.compare_streams(["1,2\n"], ["1.0\n"]))
+        self.assertEqual(
+            FieldDifference(field_index=-1, string0="2", string1="1"),
+            comparer.compare_string_lists(["1", "2"], ["1.0"]))
+
+    def test_columns_statistics(self):
+        comparer = DecimalComparer(",", per_column=True, columns=[0, 2])
+        comparer.compare_streams(["1,2,3\n", "4,5,6\n"],
+                                 ["1,2,3\n", "4,7,9\n"])
+        statistics = comparer.column_statistics
+        self.assertEqual(
+            [0, 0, 0, 0, 2],
+            [statistics.count(0, level) for level in EqualityLevel])
+        self.assertEqual(
+            [0, 0, 0, 0, 0],
+            [statistics.count(1, level) for level in EqualityLevel])
+        self.assertEqual(
+            [1, 0, 0, 0, 1],
+            [statistics.count(2, level) for level in EqualityLevel])
+
+    def test_column_indices(self):
+        self.assertEqual([2, 0, 1],
+                         column_indices(["a", "b", "c"], ["c", 0, "b"]))
+        with self.assertRaises(ValueError):
+            column_indices(["a", "b"], ["d"])
+
+
+@unittest.skipIf(numpy is None, "NumPy not installed")
+class TestCompareColumns(unittest.TestCase):
+
+    def test_compare_columns_matches_compare_strings(self):
+        rnd = random.Random(42)
+        specials = ["foo", "inf", "-inf", "1e999", "0", "-0", "0.000",
+                    "+.5", ".5", "1e", "e5", "+-1", "1.2.3", "", "nan",
+                    "NaN", "-nan",
+                    "12345678901234567890", "9.9952E-8", "1.00E-07"]
+        column0, column1 = [], []
+        for _ in range(20000):
+            value = (rnd.random() - 0.5) * 10**rnd.randint(-8, 8)
+            other = value * rnd.choice([1, 1, 1.001, 1.005, 1.02, 3, -1])
+            for column, number in (column0, value), (column1, other):
+                if rnd.random() < 0.05:
+                    column.append(rnd.choice(specials))
+                else:
+                    column.append("{:.{prec}{fmt}}".format(
+                        number, prec=rnd.randint(1, 18),
+                        fmt=rnd.choice("eEg")))
+
+        comparer = DecimalComparer(",", 0.01)
+        levels = comparer.compare_columns(column0, column1)
+        expected = DecimalComparer(",", 0.01)
+        for i in range(len(column0)):
+            self.assertEqual(
+                expected.compare_strings(column0[i], column1[i]).value,
+                levels[i], (column0[i], column1[i]))
+        self.assertEqual(expected.totals, comparer.totals)
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestMain(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.paths = [self._write("0.csv", "1,2\n3,4\n5,6\n"),
+                      self._write("1.csv", "1,2\n3,5\n5,6\n")]
+
+    def _run(self, *arguments):
+        """Run comparecsv in a new process, returning its output."""
+        return self._run_process(*arguments).stdout
+
+    def _run_process(self, *arguments, status=0):
+        process = subprocess.run(
+            [sys.executable] + list(arguments) + self.paths,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, cwd=_ROOT)
+        self.assertEqual(status, process.returncode, process.stderr)
+        return process
+
+    def test_script(self):
+        script = os.path.join(_ROOT, "comparedecimal", "comparedecimal.py")
+        output = self._run(script)
+        self.assertIn("         1 unequal\n", output)
+        self.assertIn("First difference: On line 2: field 2 differs (4, 5)",
+                      output)
+
+    def test_module(self):
+        # Run with -m, the module is loaded twice: as __main__ and as
+        # part of the package. The worker and helper modules must still
+        # see the same EqualityLevel as main's comparer.
+        module = ["-m", "comparedecimal.comparedecimal"]
+        cache = os.path.join(self.tempdir.name, "cache")
+        for options in ["--jobs", "2"], ["--mmap"], ["--cache", cache]:
+            output = self._run(*module + options)
+            self.assertIn("         1 unequal\n", output, options)
+        report = os.path.join(self.tempdir.name, "report.csv")
+        output = self._run(*module + ["--mmap", "--report", report])
+        self.assertIn("First difference: On line 2", output)
+        output = self._run(*module + ["--sample", "--per-column",
+                                      "--time-budget", "0.1"])
+        self.assertIn("First difference: On line 2", output)
+        self.assertIn("Field pairs in the sampled lines:\n", output)
+        self.assertIn("Sampled 3 of 3 lines", output)
+
+    def test_incompatible_options(self):
+        for options in (["--key", "1", "--align"], ["--key", "1", "-j", "2"],
+                        ["--key", "1", "--mmap"], ["-j", "2", "--mmap"],
+                        ["--align", "-j", "2"], ["--align", "--mmap"],
+                        ["--sample", "-j", "2"]):
+            process = self._run_process(
+                "-m", "comparedecimal.comparedecimal", *options, status=2)
+            self.assertIn("can't be used with", process.stderr)
+
+    def test_key_examples(self):
+        self.paths = [self._write("0.tsv", "a\tb\t1\n"),
+                      self._write("1.tsv", "a\tc\t1\n")]
+        output = self._run("-m", "comparedecimal.comparedecimal",
+                           "-d", "\\t", "--key", "1,2")
+        self.assertIn("1 rows only in {}, e.g. keys: a\tb\n".format(
+            self.paths[0]), output)
+
+    @unittest.skipIf(zstandard is not None, "zstandard installed")
+    def test_missing_zstandard(self):
+        self.paths[0] = self._write("0.csv.zst", b"\x28\xb5\x2f\xfd")
+        process = self._run_process("-m", "comparedecimal.comparedecimal",
+                                    status=2)
+        self.assertIn("requires the zstandard package", process.stderr)
+        self.assertNotIn("Traceback", process.stderr)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer
+from comparedecimal import compressed
+from tests import TempDirTestCase
+import bz2
+import gzip
+import io
+import lzma
+import unittest
+
+
+class TestCompressed(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = "".join("{},{}\r\n".format(i, i / 3)
+                            for i in range(20000)).encode()
+
+    def test_formats(self):
+        plain = self._write("plain.csv", self.data)
+        with open(plain) as fh:
+            expected = list(fh)
+        for name, compress, compression in (
+                ("a.csv.gz", gzip.compress, "gzip"),
+                ("a.csv.bz2", bz2.compress, "bzip2"),
+                ("a.csv.xz", lzma.compress, "xz")):
+            path = self._write(name, compress(self.data))
+            self.assertEqual(compression,
+                             compressed.detect_compression(path))
+            for read_ahead in True, False:
+                with compressed.open_lines(path, block_size=1000,
+                                           queue_blocks=2,
+                                           read_ahead=read_ahead) as lines:
+                    self.assertEqual(read_ahead, isinstance(
+                        getattr(lines.buffer, "raw", None),
+                        compressed.ReadAheadStream))
+                    self.assertEqual(expected, list(lines))
+        self.assertIsNone(compressed.detect_compression(plain))
+
+    def test_compare_compressed_with_plain(self):
+        path0 = self._write("0.csv.gz", gzip.compress(self.data))
+        path1 = self._write("1.csv", self.data)
+        comparer = DecimalComparer()
+        with compressed.open_lines(path0) as fh0, \
+                compressed.open_lines(path1) as fh1:
+            self.assertIsNone(comparer.compare_streams(fh0, fh1))
+        self.assertEqual(40000, sum(comparer.totals.values()))
+
+    def test_close_before_end(self):
+        path = self._write("a.csv.gz", gzip.compress(self.data))
+        lines = compressed.open_lines(path, block_size=100, queue_blocks=1,
+                                      read_ahead=True)
+        self.assertEqual("0,0.0\n", next(lines))
+        lines.close()
+        self.assertFalse(lines.buffer.raw._thread.is_alive())
+
+    def test_corrupt_data(self):
+        data = gzip.compress(self.data)
+        path = self._write("a.csv.gz", data[:len(data) // 2])
+        with compressed.open_lines(path, read_ahead=True) as lines:
+            with self.assertRaises(EOFError):
+                list(lines)
+
+    def test_read_ahead_stream(self):
+        stream = compressed.ReadAheadStream(io.BytesIO(b"a\nb\r\n\nc"),
+                                            block_size=1, queue_blocks=1)
+        with io.TextIOWrapper(io.BufferedReader(stream, 2)) as lines:
+            self.assertEqual(["a\n", "b\n", "\n", "c"], list(lines))
+            self.assertEqual([], list(lines))
+        self.assertTrue(stream.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import dedupe
+from tests import TempDirTestCase
+import random
+import unittest
+
+
+class TestDedupe(TempDirTestCase):
+
+    def _write(self, name, rows):
+        return super()._write(name, [",".join(row) + "\n" for row in rows])
+
+    def test_find_duplicates(self):
+        rnd = random.Random(42)
+        values = [[rnd.uniform(-100, 100) for _ in range(3)]
+                  for _ in range(20)]
+
+        def formatted(precision, scale=1.0):
+            return [["{:.{}g}".format(value * scale, precision)
+                     for value in row] for row in values]
+
+        paths = [
+            self._write("a.csv", formatted(10)),
+            self._write("b.csv", formatted(3)),
+            self._write("c.csv", formatted(10, scale=2)),
+            self._write("d.csv", formatted(10)[:-1]),
+            self._write("e.csv", [["x"] + row for row in formatted(10)]),
+            self._write("f.csv", [["x"] + row for row in formatted(5)]),
+            self._write("g.txt", formatted(10)),
+        ]
+        found = list(dedupe.find_files([self.tempdir.name], "*.csv"))
+        self.assertEqual(paths[:6], found)
+        self.assertEqual([paths[0:2], paths[4:6]],
+                         dedupe.find_duplicates(found))
+
+    def test_value_cells_straddle_boundary(self):
+        # Compatible values on either side of a cell boundary must still
+        # share at least one cell.
+        for pair in [("1", "1.49"), ("0.95", "1"), ("1", "1.0"),
+                     ("9.99", "10.0"), ("9.9952E-8", "1.00E-07"),
+                     ("123", "123.4"), ("1e3", "1400"), ("3.0", "3.03"),
+                     ("2", "1.5")]:
+            for strings in pair, pair[::-1]:
+                cells = [set(dedupe.value_cells(dedupe.describe_value(s)))
+                         for s in strings]
+                self.assertTrue(cells[0] & cells[1], strings)
+        self.assertFalse(
+            set(dedupe.value_cells(dedupe.describe_value("1.00"))) &
+            set(dedupe.value_cells(dedupe.describe_value("1.10"))))
+
+    def test_nan(self):
+        # NaN only matches an identical string, including in rows which
+        # aren't part of the fingerprints.
+        rows = [[str(row), "1"] for row in range(dedupe.SAMPLE_ROWS + 1)]
+        paths = [self._write("a.csv", rows + [["1", "1"]]),
+                 self._write("b.csv", rows + [["1", "nan"]]),
+                 self._write("c.csv", rows + [["1", "nan"]]),
+                 self._write("d.csv", [["nan"]]),
+                 self._write("e.csv", [["NaN"]]),
+                 self._write("f.csv", [["1"]])]
+        self.assertEqual([paths[1:3]], dedupe.find_duplicates(paths))
+        self.assertFalse(
+            set(dedupe.value_cells(dedupe.describe_value("nan"))) &
+            set(dedupe.value_cells(dedupe.describe_value("NaN"))))
+
+    def test_non_transitive(self):
+        # a matches b and b matches c, but a doesn't match c; c is
+        # checked before b, so b must be compared with both.
+        paths = [self._write("a.csv", [["1.0"]]),
+                 self._write("c.csv", [["1.4"]]),
+                 self._write("b.csv", [["1"]])]
+        self.assertEqual([paths], dedupe.find_duplicates(paths))
+
+    def test_distinct_files(self):
+        # Files with the same layout and the same first value, and the
+        # same index column, shouldn't all be compared with each other.
+        rnd = random.Random(42)
+        paths = [self._write("{}.csv".format(i),
+                             [["id", "value"]] +
+                             [[str(row), "{:.6f}".format(rnd.random())]
+                              for row in range(20)])
+                 for i in range(300)]
+        comparisons = []
+        files_match = dedupe._files_match
+
+        def counting_files_match(*args):
+            comparisons.append(args)
+            return files_match(*args)
+
+        dedupe._files_match = counting_files_match
+        try:
+            self.assertEqual([], dedupe.find_duplicates(paths))
+        finally:
+            dedupe._files_match = files_match
+        self.assertLess(len(comparisons), 3 * len(paths))
+
+if __name__ == "__main__":
+    unittest.main()
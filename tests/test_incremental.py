@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal.incremental import compare_cached
+from tests import TempDirTestCase, summarize
+import os
+import unittest
+
+
+class TestIncremental(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = os.path.join(self.tempdir.name, "cache")
+
+    def _write(self, name, lines):
+        path = super()._write(name, lines)
+        # Make sure that a rewrite is noticed even on file systems with
+        # coarse modification times.
+        status = os.stat(path)
+        os.utime(path, ns=(status.st_atime_ns,
+                           status.st_mtime_ns + len(lines) * 1000))
+        return path
+
+    def _check_same_as_serial(self, lines0, lines1):
+        path0 = self._write("0.csv", lines0)
+        path1 = self._write("1.csv", lines1)
+        serial = DecimalComparer(per_column=True)
+        with open(path0) as fh0, open(path1) as fh1:
+            expected = serial.compare_streams(fh0, fh1)
+        cached = DecimalComparer(per_column=True)
+        result = compare_cached(cached, path0, path1, self.cache,
+                                records_per_chunk=3)
+        self.assertEqual(expected, result.first_difference)
+        self.assertEqual(serial.totals, cached.totals)
+        self.assertEqual(summarize(serial.column_statistics),
+                         summarize(cached.column_statistics))
+        return result
+
+    def test_reuse(self):
+        lines0 = ["{},{}\n".format(i, i) for i in range(20)]
+        lines1 = ["{}.0,{}\n".format(i, i) for i in range(20)]
+        result = self._check_same_as_serial(lines0, lines1)
+        self.assertEqual((0, 7), (result.reused, result.compared))
+        result = self._check_same_as_serial(lines0, lines1)
+        self.assertEqual((7, 0), (result.reused, result.compared))
+        lines1[7] = "7,8\n"
+        lines1[15] = "15,99\n"
+        result = self._check_same_as_serial(lines0, lines1)
+        self.assertEqual("On line 8: field 2 differs (7, 8)",
+                         result.first_difference)
+        self.assertEqual((5, 2), (result.reused, result.compared))
+
+    def test_settings_change(self):
+        path0 = self._write("0.csv", ["1,2.51\n"])
+        path1 = self._write("1.csv", ["1,2.52\n"])
+        compare_cached(DecimalComparer(), path0, path1, self.cache)
+        comparer = DecimalComparer(closeness_threshold=0.0001)
+        result = compare_cached(comparer, path0, path1, self.cache)
+        self.assertEqual(1, result.compared)
+        self.assertEqual(1, comparer.totals[EqualityLevel.UNEQUAL])
+
+    def test_corrupt_cache(self):
+        lines = ["{},{}\n".format(i, i) for i in range(10)]
+        self._check_same_as_serial(lines, lines)
+        for name in os.listdir(self.cache):
+            with open(os.path.join(self.cache, name), "r+") as fh:
+                fh.seek(20)
+                fh.write("}")
+        result = self._check_same_as_serial(lines, lines)
+        self.assertEqual(4, result.compared)
+        result = self._check_same_as_serial(lines, lines)
+        self.assertEqual(4, result.reused)
+
+    def test_preserved_times(self):
+        # A file replaced by one of the same size with the same times,
+        # as rsync -t does, must still be scanned again.
+        lines = ["{},{}\n".format(i, i) for i in range(10)]
+        self._check_same_as_serial(lines, lines)
+        path = os.path.join(self.tempdir.name, "1.csv")
+        status = os.stat(path)
+        replacement = os.path.join(self.tempdir.name, "replacement")
+        with open(replacement, "w") as fh:
+            fh.writelines(lines[:4] + ["4,9\n"] + lines[5:])
+        os.utime(replacement, ns=(status.st_atime_ns, status.st_mtime_ns))
+        os.replace(replacement, path)
+        result = compare_cached(DecimalComparer(per_column=True),
+                                os.path.join(self.tempdir.name, "0.csv"),
+                                path, self.cache, records_per_chunk=3)
+        self.assertEqual("On line 5: field 2 differs (4, 9)",
+                         result.first_difference)
+
+    def test_unequal_line_counts(self):
+        lines = ["{}\n".format(i) for i in range(10)]
+        result = self._check_same_as_serial(lines, lines[:8])
+        self.assertEqual("Unequal numbers of lines (10, 8)",
+                         result.first_difference)
+
+    def test_fail_fast(self):
+        path0 = self._write("0.csv", ["1\n", "2\n", "3\n", "4\n"])
+        path1 = self._write("1.csv", ["1\n", "5\n", "3\n", "7\n"])
+        comparer = DecimalComparer(fail_fast=True)
+        result = compare_cached(comparer, path0, path1, self.cache,
+                                records_per_chunk=2)
+        self.assertEqual("On line 2: field 1 differs (2, 5)",
+                         result.first_difference)
+        self.assertEqual(1, comparer.totals[EqualityLevel.UNEQUAL])
+
+    def test_empty(self):
+        self.assertIsNone(self._check_same_as_serial([], []).first_difference)
+
+
+if __name__ == "__main__":
+    unittest.main()
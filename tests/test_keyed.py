@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import keyed
+from tests import TempDirTestCase
+import random
+import unittest
+
+
+class TestKeyed(TempDirTestCase):
+
+    def _compare_both_ways(self, lines0, lines1, key_columns, **options):
+        """Compare using the hash join and the merge join (with and without
+        several merge passes), and check that they agree."""
+        path0 = self._write("0.csv", lines0)
+        path1 = self._write("1.csv", lines1)
+        results = []
+        for max_index_rows, run_rows, fan_in in (
+                (keyed.MAX_INDEX_ROWS, 100, keyed.MERGE_FAN_IN),
+                (0, 3, keyed.MERGE_FAN_IN), (0, 1, 2)):
+            comparer = DecimalComparer(**options)
+            result = keyed.compare_keyed(comparer, path0, path1, key_columns,
+                                         max_index_rows, run_rows, fan_in)
+            results.append((result.first_difference, result.unmatched,
+                            sorted(result.examples[0]),
+                            sorted(result.examples[1]), comparer.totals))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        return results[0]
+
+    def test_reordered_rows(self):
+        lines0 = ["{},{}\n".format(i, i / 7) for i in range(50)]
+        lines1 = ["{},{:.3f}\n".format(i, i / 7) for i in range(50)]
+        random.Random(1).shuffle(lines1)
+        difference, unmatched, _, _, totals = \
+            self._compare_both_ways(lines0, lines1, [0])
+        self.assertIsNone(difference)
+        self.assertEqual([0, 0], unmatched)
+        self.assertEqual(100, sum(totals.values()))
+        self.assertEqual(0, totals[EqualityLevel.UNEQUAL])
+
+    def test_unmatched_keys(self):
+        lines0 = ["a,1\n", "b,2\n", "c,3\n"]
+        lines1 = ["d,4\n", "c,3\n", "a,1\n"]
+        difference, unmatched, examples0, examples1, totals = \
+            self._compare_both_ways(lines0, lines1, [0])
+        self.assertIsNone(difference)
+        self.assertEqual([1, 1], unmatched)
+        self.assertEqual([("b",)], examples0)
+        self.assertEqual([("d",)], examples1)
+        self.assertEqual(4, totals[EqualityLevel.IDENTICAL])
+
+    def test_first_difference_by_line_of_first_file(self):
+        lines0 = ["x,1,1\n", "y,2,2\n", "x,2,3\n", "z,1,9\n"]
+        lines1 = ["z,1,8\n", "x,2,7\n", "y,2,2\n", "x,1,1\n"]
+        difference, unmatched, _, _, totals = \
+            self._compare_both_ways(lines0, lines1, [0, 1])
+        self.assertEqual("On line 3: field 3 differs (3, 7)", difference)
+        self.assertEqual([0, 0], unmatched)
+        self.assertEqual(2, totals[EqualityLevel.UNEQUAL])
+
+    def test_fail_fast(self):
+        lines0 = ["a,1,1\n", "b,2,2\n", "c,3,3\n"]
+        lines1 = ["c,3,9\n", "b,5,5\n", "a,1,1\n"]
+        difference, _, _, _, totals = \
+            self._compare_both_ways(lines0, lines1, [0], fail_fast=True)
+        self.assertEqual("On line 2: field 2 differs (2, 5)", difference)
+        self.assertEqual(1, totals[EqualityLevel.UNEQUAL])
+        self.assertEqual(4, totals[EqualityLevel.IDENTICAL])
+
+    def test_duplicate_keys_paired_in_order(self):
+        lines0 = ["a,1\n", "a,2\n", "a,3\n"]
+        lines1 = ["a,1\n", "b,0\n", "a,2\n"]
+        difference, unmatched, examples0, examples1, _ = \
+            self._compare_both_ways(lines0, lines1, [0])
+        self.assertIsNone(difference)
+        self.assertEqual([1, 1], unmatched)
+        self.assertEqual([("a",)], examples0)
+        self.assertEqual([("b",)], examples1)
+
+    def test_quoted_fields(self):
+        lines0 = ['"k 1", 1.0\n', '"k\n2", 2.0\n']
+        lines1 = ['"k\n2", 2\n', '"k 1", 1\n']
+        difference, unmatched, _, _, totals = \
+            self._compare_both_ways(lines0, lines1, [0])
+        self.assertIsNone(difference)
+        self.assertEqual([0, 0], unmatched)
+        self.assertEqual(2, totals[EqualityLevel.NUMERICALLY_EQUAL])
+
+    def test_missing_key_column(self):
+        lines0 = ["a,1\n", "\n"]
+        lines1 = ["\n", "a,1\n", "b\n"]
+        _, unmatched, _, examples1, _ = \
+            self._compare_both_ways(lines0, lines1, [0, 1])
+        self.assertEqual([0, 1], unmatched)
+        self.assertEqual([("b", None)], examples1)
+
+
+if __name__ == "__main__":
+    unittest.main()
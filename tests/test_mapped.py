@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer
+from comparedecimal import mapped
+from tests import TempDirTestCase, summarize
+import random
+import unittest
+
+
+class TestMapped(TempDirTestCase):
+
+    def _check_same_as_streams(self, data0, data1, **options):
+        path0 = self._write("0.csv", data0)
+        path1 = self._write("1.csv", data1)
+        streamed = DecimalComparer(per_column=True, **options)
+        with open(path0) as fh0, open(path1) as fh1:
+            expected = streamed.compare_streams(fh0, fh1)
+        comparer = DecimalComparer(per_column=True, **options)
+        actual = mapped.compare_mapped(comparer, path0, path1)
+        self.assertEqual(expected, actual, (data0, data1))
+        self.assertEqual(streamed.totals, comparer.totals, (data0, data1))
+        self.assertEqual(summarize(streamed.column_statistics),
+                         summarize(comparer.column_statistics))
+        return actual
+
+    def test_identical(self):
+        data = "".join("{},{}\n".format(i, i / 7) for i in range(10000))
+        self.assertIsNone(self._check_same_as_streams(data, data))
+
+    def test_differing_fields(self):
+        self.assertEqual(
+            "On line 2: field 3 differs (3, 4)",
+            self._check_same_as_streams("a,b\n1, 2,3\n5,6\n",
+                                        "a,b\n1.0,2,4\n5,6.0\n"))
+
+    def test_empty(self):
+        self.assertIsNone(self._check_same_as_streams("", ""))
+        self.assertEqual("Unequal numbers of lines (0, 1)",
+                         self._check_same_as_streams("", "1"))
+
+    def test_random(self):
+        rnd = random.Random(42)
+        fields = ["1", "1.0", "2", " 3", "foo", "\"q,x\"", "\"a\nb\"",
+                  "\"\"", "", "1e3", "1000"]
+
+        def line():
+            if rnd.random() < 0.05:
+                return "\n"
+            return ",".join(rnd.choice(fields)
+                            for _ in range(rnd.randint(1, 4))) + \
+                rnd.choice(["\n", "\r\n"])
+
+        old_sizes = mapped.BLOCK_SIZE, mapped.MIN_WINDOW
+        mapped.BLOCK_SIZE, mapped.MIN_WINDOW = 40, 8
+        try:
+            for i in range(1000):
+                lines0 = [line() for _ in range(rnd.randint(0, 8))]
+                lines1 = [x if rnd.random() < 0.7 else line()
+                          for x in lines0]
+                if rnd.random() < 0.2:
+                    lines1 = lines1[:-1]
+                data0 = "".join(lines0)
+                if rnd.random() < 0.3:
+                    data0 = data0.rstrip("\r\n")
+                options = [{}, {"columns": [0, 2]},
+                           {"exclude_columns": [1]}][i % 3]
+                self._check_same_as_streams(data0, "".join(lines1),
+                                            **options)
+        finally:
+            mapped.BLOCK_SIZE, mapped.MIN_WINDOW = old_sizes
+
+    def test_scattered_differences(self):
+        # Only the differing lines should be split into fields; the
+        # identical lines between them are skipped in runs.
+        rnd = random.Random(42)
+        lines0, lines1 = [], []
+        for i in range(20000):
+            line = "{},{:.6f},{:.6f}\n".format(i, rnd.random(), rnd.random())
+            lines0.append(line)
+            lines1.append(line.replace(",0.", ",1.", 1)
+                          if rnd.random() < 0.01 else line)
+        differing = sum(a != b for a, b in zip(lines0, lines1))
+        compared = []
+        compare_records = mapped._MappedComparison._compare_records
+
+        def counting_compare_records(comparison, line):
+            compared.append(line)
+            return compare_records(comparison, line)
+
+        mapped._MappedComparison._compare_records = counting_compare_records
+        try:
+            self._check_same_as_streams("".join(lines0), "".join(lines1))
+        finally:
+            mapped._MappedComparison._compare_records = compare_records
+        self.assertEqual(differing, len(compared))
+
+
+if __name__ == "__main__":
+    unittest.main()
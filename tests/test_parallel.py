@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer
+from comparedecimal import parallel
+from comparedecimal.parallel import compare_files
+from tests import TempDirTestCase, summarize
+import unittest
+
+
+class TestParallel(TempDirTestCase):
+
+    def _check_same_as_serial(self, lines0, lines1, **options):
+        path0 = self._write("0.csv", lines0)
+        path1 = self._write("1.csv", lines1)
+        serial = DecimalComparer(per_column=True, **options)
+        with open(path0) as fh0, open(path1) as fh1:
+            expected = serial.compare_streams(fh0, fh1)
+        results = []
+        # Small blocks put several chunk boundaries in each block, and
+        # spread others over several blocks.
+        for block_size in parallel.SCAN_BLOCK_SIZE, 16:
+            comparer = DecimalComparer(per_column=True, **options)
+            original, parallel.SCAN_BLOCK_SIZE = \
+                parallel.SCAN_BLOCK_SIZE, block_size
+            try:
+                actual = compare_files(comparer, path0, path1, jobs=2,
+                                       records_per_chunk=3)
+            finally:
+                parallel.SCAN_BLOCK_SIZE = original
+            self.assertEqual(expected, actual)
+            self.assertEqual(serial.totals, comparer.totals)
+            if not options.get("fail_fast"):
+                self.assertEqual(summarize(serial.column_statistics),
+                                 summarize(comparer.column_statistics))
+        return actual
+
+    def test_equal(self):
+        lines = ["{},{}\n".format(i, i * 1.5) for i in range(20)]
+        self.assertIsNone(self._check_same_as_serial(lines, lines))
+
+    def test_first_difference_is_earliest(self):
+        lines0 = ["{},{}\n".format(i, i) for i in range(20)]
+        lines1 = list(lines0)
+        lines1[7] = "7,8\n"
+        lines1[15] = "15,99\n"
+        self.assertEqual("On line 8: field 2 differs (7, 8)",
+                         self._check_same_as_serial(lines0, lines1))
+
+    def test_quoted_newlines(self):
+        lines0 = ["{},\"a\nb\"\n".format(i) for i in range(10)]
+        lines1 = ["{}.0,\"a\nb\"\n".format(i) for i in range(10)]
+        lines1[9] = "9,\"a\nc\"\n"
+        self.assertEqual("On line 10: field 2 differs (a\nb, a\nc)",
+                         self._check_same_as_serial(lines0, lines1))
+
+    def test_line_endings(self):
+        lines0 = ["{},{}\r\n".format(i, i * 1.5) for i in range(20)]
+        lines1 = ["{},{}\n".format(i, i * 1.5) for i in range(19)] + ["19"]
+        self.assertEqual("Differing numbers of fields on line 20",
+                         self._check_same_as_serial(lines0, lines1))
+
+    def test_fail_fast(self):
+        lines0 = ["{},{}\n".format(i, i) for i in range(20)]
+        lines1 = lines0[:15]
+        lines1[10] = "10,11\n"
+        self.assertEqual("On line 11: field 2 differs (10, 11)",
+                         self._check_same_as_serial(lines0, lines1,
+                                                    fail_fast=True))
+
+    def test_unequal_line_counts(self):
+        lines = ["{}\n".format(i) for i in range(10)]
+        self.assertEqual("Unequal numbers of lines (10, 8)",
+                         self._check_same_as_serial(lines, lines[:8]))
+
+    def test_empty(self):
+        self.assertIsNone(self._check_same_as_serial([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import parallel, profiling
+import json
+import os
+import tempfile
+import unittest
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.lines0 = ["a,1,1,1.5,-1,1,x\n", "1,2,3,4,5,6,7\n", '"q",1\n']
+        self.lines1 = ["b,1,1.0,1.49,1,10,x\n", "1,2,3,4,5,6,7\n", '"q",1\n']
+
+    def test_disabled_by_default(self):
+        comparer = DecimalComparer()
+        self.assertIsNone(comparer.profile)
+        self.assertNotIn("_compare_strings", vars(comparer))
+
+    def test_same_results_as_unprofiled(self):
+        plain = DecimalComparer()
+        expected = plain.compare_line_lists(self.lines0, self.lines1)
+        comparer = DecimalComparer(profile=True)
+        self.assertEqual(expected,
+                         comparer.compare_line_lists(self.lines0, self.lines1))
+        self.assertEqual(plain.totals, comparer.totals)
+
+    def test_exits(self):
+        comparer = DecimalComparer(profile=True)
+        comparer.compare_line_lists(self.lines0, self.lines1)
+        exits = comparer.profile.to_dict()["exits"]
+        self.assertEqual({"identical": 1 + 1, "parse failure": 1,
+                          "float equal": 1, "sign": 1, "magnitude": 1,
+                          "digits": 1}, exits)
+        self.assertEqual(2, comparer.profile.identical_lines)
+
+    def test_stages_and_histograms(self):
+        comparer = DecimalComparer(profile=True)
+        comparer.compare_line_lists(self.lines0, self.lines1)
+        profile = comparer.profile.to_dict()
+        self.assertEqual(6, profile["stages"]["read"]["calls"])
+        self.assertEqual(3, profile["stages"]["csv"]["calls"])
+        self.assertEqual(7, profile["stages"]["compare"]["calls"])
+        self.assertEqual(8, profile["literal_cache_misses"])
+        self.assertEqual(
+            comparer.totals[EqualityLevel.UNEQUAL],
+            sum(profile["latency_histograms"]["unequal"]))
+        self.assertEqual(
+            len(profile["latency_histogram_bounds_ns"]),
+            len(profile["latency_histograms"]["compatible"]))
+        json.dumps(profile)
+        self.assertIn("comparison exit", comparer.profile.report())
+
+    def test_merge_from_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, lines in ("0.csv", self.lines0 * 10), \
+                    ("1.csv", self.lines1 * 10):
+                paths.append(os.path.join(directory, name))
+                with open(paths[-1], "w") as fh:
+                    fh.writelines(lines)
+            comparer = DecimalComparer(profile=True)
+            parallel.compare_files(comparer, paths[0], paths[1], jobs=2,
+                                   records_per_chunk=7)
+        self.assertEqual(20, comparer.profile.exits[
+            profiling.EXITS.index("identical")])
+        self.assertEqual(70, sum(comparer.profile.histograms))
+
+
+if __name__ == "__main__":
+    unittest.main()
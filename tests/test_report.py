@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer
+from comparedecimal.mapped import compare_mapped
+from comparedecimal.report import DifferenceReport, format_for_path
+from tests import TempDirTestCase
+import csv
+import io
+import json
+import os
+import unittest
+
+
+class TestReport(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.paths = [
+            self._write("0.csv", "1,2,a\n3,4.00,b\n5,6,c\n7,8,d\n"),
+            self._write("1.csv", "1,2,a\n3,4.02,x\n5,-6,c\n7,8,d\n")]
+
+    def _compare(self, **options):
+        path = os.path.join(self.tempdir.name, "report")
+        report = DifferenceReport(open(path, "w", newline=""), **options)
+        comparer = DecimalComparer(report=report)
+        with open(self.paths[0]) as fh0, open(self.paths[1]) as fh1:
+            comparer.compare_streams(fh0, fh1)
+        report.close()
+        with open(path, newline="") as fh:
+            return report, fh.read()
+
+    def test_csv(self):
+        report, text = self._compare(batch_size=1)
+        self.assertEqual(
+            [["line", "field", "value1", "value2", "level",
+              "relative_difference"],
+             ["2", "2", "4.00", "4.02", "close", "0.004999999999999893"],
+             ["2", "3", "b", "x", "unequal", ""],
+             ["3", "2", "6", "-6", "unequal", "2.0"]],
+            list(csv.reader(io.StringIO(text))))
+        self.assertEqual((3, 0), (report.written, report.dropped))
+
+    def test_jsonl(self):
+        report, text = self._compare(output_format="jsonl",
+                                     unequal_only=True)
+        self.assertEqual(
+            [{"line": 2, "field": 3, "value1": "b", "value2": "x",
+              "level": "unequal", "relative_difference": None},
+             {"line": 3, "field": 2, "value1": "6", "value2": "-6",
+              "level": "unequal", "relative_difference": 2.0}],
+            [json.loads(line) for line in text.splitlines()])
+
+    def test_non_finite(self):
+        self.paths = [self._write("0.csv", "0,nan,1\n"),
+                      self._write("1.csv", "1,1,1.0\n")]
+        _, text = self._compare(output_format="jsonl")
+        self.assertEqual(["inf", "nan", 0.0],
+                         [json.loads(line)["relative_difference"]
+                          for line in text.splitlines()])
+        _, text = self._compare()
+        self.assertEqual(["inf", "nan", "0.0"],
+                         [row[-1] for row in
+                          list(csv.reader(io.StringIO(text)))[1:]])
+
+    def test_caps(self):
+        report, text = self._compare(output_format="jsonl",
+                                     max_per_column=1)
+        self.assertEqual([(2, 2), (2, 3)],
+                         [(record["line"], record["field"]) for record in
+                          map(json.loads, text.splitlines())])
+        self.assertEqual((2, 1), (report.written, report.dropped))
+        report, text = self._compare(output_format="jsonl", max_total=1)
+        self.assertEqual(1, len(text.splitlines()))
+        self.assertEqual((1, 2), (report.written, report.dropped))
+        self.assertTrue(report.full)
+
+    def test_mapped(self):
+        _, expected = self._compare()
+        path = os.path.join(self.tempdir.name, "mapped")
+        with DifferenceReport(open(path, "w", newline="")) as report:
+            compare_mapped(DecimalComparer(report=report), *self.paths)
+        with open(path, newline="") as fh:
+            self.assertEqual(expected, fh.read())
+
+    def test_format(self):
+        self.assertEqual("jsonl", format_for_path("report.JSONL"))
+        self.assertEqual("csv", format_for_path("report.txt"))
+        with self.assertRaises(ValueError):
+            DifferenceReport(io.StringIO(), "xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import sampling
+from tests import TempDirTestCase
+import random
+import unittest
+
+
+class TestSampling(TempDirTestCase):
+
+    def test_line_index(self):
+        rnd = random.Random(42)
+        for ending in ("", "\n"):
+            lines = ["x" * rnd.randint(0, 20) + "\n" for _ in range(200)]
+            data = "".join(lines)[:-1] + ending
+            path = self._write("lines.csv", data)
+            index = sampling._LineIndex(path, block_size=16)
+            self.assertEqual(200, index.line_count)
+            with open(path, "rb") as fh:
+                self.assertEqual(
+                    data.splitlines(True),
+                    [index.find(fh, line).decode() for line in range(200)])
+
+    def test_estimates(self):
+        rnd = random.Random(42)
+        lines0, lines1 = [], []
+        for i in range(5000):
+            fields = ["{:.3f}".format(rnd.random()) for _ in range(4)]
+            lines0.append(",".join(fields) + "\n")
+            # About 25% unequal, 25% numerically equal, 50% identical
+            lines1.append(",".join(
+                [fields[0] + "0", "9", fields[2], fields[3]]
+                if rnd.random() < 0.5 else fields) + "\n")
+        comparer = DecimalComparer()
+        result = sampling.compare_sampled(
+            comparer, self._write("0.csv", "".join(lines0)),
+            self._write("1.csv", "".join(lines1)), precision=0.03, seed=1)
+        self.assertTrue(result.precision_reached)
+        self.assertEqual([5000, 5000], result.line_counts)
+        self.assertEqual(0, result.skipped)
+        self.assertEqual(4 * result.samples, sum(comparer.totals.values()))
+        for level, expected in ((EqualityLevel.UNEQUAL, 0.125),
+                                (EqualityLevel.CLOSE, 0),
+                                (EqualityLevel.NUMERICALLY_EQUAL, 0.125),
+                                (EqualityLevel.IDENTICAL, 0.75)):
+            estimate = result.estimates[level]
+            self.assertLessEqual(estimate.low, expected)
+            self.assertGreaterEqual(estimate.high, expected)
+            self.assertLessEqual(estimate.high - estimate.low, 0.06)
+        self.assertRegex(result.first_difference, "field 2 differs")
+
+    def test_identical(self):
+        path = self._write("0.csv", "".join(
+            "{},{}\n".format(i, i * i) for i in range(500)))
+        result = sampling.compare_sampled(DecimalComparer(), path, path,
+                                          max_samples=50)
+        self.assertEqual(50, result.samples)
+        self.assertFalse(result.precision_reached)
+        self.assertIsNone(result.first_difference)
+        self.assertEqual(1.0, result.estimates[EqualityLevel.IDENTICAL]
+                         .proportion)
+
+    def test_small_file_compared_exactly(self):
+        path0 = self._write("0.csv", "1,2\n3,4\n5,6\n")
+        path1 = self._write("1.csv", "1,2\n3,4.0\n5,7\n")
+        comparer = DecimalComparer()
+        result = sampling.compare_sampled(comparer, path0, path1, seed=1)
+        self.assertEqual(3, result.samples)
+        self.assertTrue(result.precision_reached)
+        self.assertEqual({EqualityLevel.UNEQUAL: 1,
+                          EqualityLevel.CLOSE: 0,
+                          EqualityLevel.COMPATIBLE: 0,
+                          EqualityLevel.NUMERICALLY_EQUAL: 1,
+                          EqualityLevel.IDENTICAL: 4}, comparer.totals)
+        self.assertEqual((1 / 6, 1 / 6, 1 / 6),
+                         tuple(result.estimates[EqualityLevel.UNEQUAL]))
+        self.assertRegex(sampling.format_estimates(result),
+                         "Sampled 3 of 3 lines .*every line sampled")
+
+    def test_samples_distinct_lines(self):
+        path = self._write("0.csv", "".join(
+            "{}\n".format(i) for i in range(100)))
+        lines = []
+
+        class Comparer(DecimalComparer):
+            def compare_string_lists(self, row0, row1, line=None):
+                lines.append(line)
+                return super().compare_string_lists(row0, row1, line)
+
+        result = sampling.compare_sampled(Comparer(), path, path,
+                                          max_samples=80, seed=2)
+        self.assertEqual(80, result.samples)
+        self.assertEqual(80, len(set(lines)))
+
+    def test_incomplete_records(self):
+        path0 = self._write("0.csv", "1,\"a\nb\"\n2,c\n")
+        path1 = self._write("1.csv", "1,\"a\nb\"\n2,d\n")
+        comparer = DecimalComparer(profile=True)
+        result = sampling.compare_sampled(comparer, path0, path1, seed=1)
+        # The continuation line b" is read as a record of its own.
+        self.assertEqual(1, result.skipped)
+        self.assertEqual(2, result.samples)
+        self.assertEqual(0, comparer.profile.identical_lines)
+        self.assertEqual("On line 3: field 2 differs (c, d)",
+                         result.first_difference)
+
+    def test_mismatched_fields(self):
+        path0 = self._write("0.csv", "1,2\n3\n")
+        path1 = self._write("1.csv", "1,2\n3,4\n5,6\n")
+        result = sampling.compare_sampled(DecimalComparer(), path0, path1,
+                                          seed=1)
+        self.assertEqual([2, 3], result.line_counts)
+        self.assertEqual(2, result.samples)
+        self.assertEqual(1, result.mismatched)
+        self.assertEqual("Differing numbers of fields on line 2",
+                         result.first_difference)
+
+    def test_fail_fast(self):
+        path = self._write("0.csv", "1\n")
+        with self.assertRaises(ValueError):
+            sampling.compare_sampled(DecimalComparer(fail_fast=True),
+                                     path, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
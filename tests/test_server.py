@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+This file is part of comparedecimal.
+
+Copyright 2018, 2019 Pontus Lurcock.
+
+comparedecimal is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+comparedecimal is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from comparedecimal import DecimalComparer, EqualityLevel
+from comparedecimal import server
+from tests import TempDirTestCase
+import os
+import socket
+import threading
+import unittest
+
+
+class TestServer(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.socket = os.path.join(self.tempdir.name, "server.sock")
+        self.server = server.ComparisonServer(self.socket, jobs=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_requests(self):
+        files = [self._write("0.csv", "1,2\n3.0,4.0\n"),
+                 self._write("1.csv", "1,2\n3,4.2\n"),
+                 self._write("2.tsv", "1\t2\n3.00\t4\n")]
+        requests = [
+            {"id": 0, "file1": files[0], "file2": files[1]},
+            {"id": 1, "file1": files[0], "file2": files[1],
+             "threshold": 0.1},
+            {"id": 2, "file1": files[0], "file2": files[2],
+             "delimiter": "\t"},
+            {"id": 3, "file1": files[0], "file2": files[0]},
+            {"id": 4, "file1": files[0],
+             "file2": os.path.join(self.tempdir.name, "missing.csv")},
+        ]
+        results = {result["id"]: result
+                   for result in server.send_requests(requests, self.socket)}
+        self.assertEqual(list(range(5)), sorted(results))
+
+        for request in requests[:4]:
+            comparer = DecimalComparer(
+                separator=request.get("delimiter", ","),
+                closeness_threshold=request.get("threshold", 0.01))
+            with open(request["file1"]) as fh0, \
+                    open(request["file2"]) as fh1:
+                first_difference = comparer.compare_streams(fh0, fh1)
+            result = results[request["id"]]
+            self.assertEqual(first_difference, result["first_difference"])
+            self.assertEqual(
+                {level.description: count
+                 for level, count in comparer.totals.items()},
+                result["totals"])
+        self.assertEqual("On line 2: field 2 differs (4.0, 4.2)",
+                         results[0]["first_difference"])
+        self.assertEqual(
+            4, results[3]["totals"][EqualityLevel.IDENTICAL.description])
+        self.assertIn("error", results[4])
+
+    def test_invalid_request(self):
+        results = list(server.send_requests([{"id": 0}], self.socket))
+        self.assertEqual(1, len(results))
+        self.assertRegex(results[0]["error"], "Invalid request")
+
+    def test_many_requests(self):
+        files = [self._write("0.csv", "1,2\n"), self._write("1.csv", "1,3\n")]
+        requests = [{"id": i, "file1": files[0], "file2": files[1]}
+                    for i in range(200)]
+        results = list(server.send_requests(requests, self.socket))
+        self.assertEqual(list(range(200)),
+                         sorted(result["id"] for result in results))
+
+    def test_socket_in_use(self):
+        with self.assertRaises(OSError):
+            server.ComparisonServer(self.socket, jobs=1)
+        self.assertTrue(os.path.exists(self.socket))
+        results = list(server.send_requests([{"id": 0}], self.socket))
+        self.assertEqual(1, len(results))
+
+    def test_stale_socket(self):
+        path = os.path.join(self.tempdir.name, "stale.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(path)
+        with server.ComparisonServer(path, jobs=1) as replacement:
+            self.assertEqual(path, replacement.socket_path)
+
+
+class TestComparerCache(unittest.TestCase):
+
+    def test_bounded(self):
+        server._comparer.cache_clear()
+        comparer = server._comparer(",", 0.01, False)
+        self.assertIs(comparer, server._comparer(",", 0.01, False))
+        for threshold in range(server.COMPARER_CACHE_SIZE):
+            server._comparer(",", threshold, False)
+        self.assertEqual(server.COMPARER_CACHE_SIZE,
+                         server._comparer.cache_info().currsize)
+        self.assertIsNot(comparer, server._comparer(",", 0.01, False))
+
+
+if __name__ == "__main__":
+    unittest.main()